@@ -0,0 +1,127 @@
+"""Compara a leitura do histórico completo de station_status: só SQLite vs. arquivo Parquet.
+
+Gera uma base sintética (modo full) num diretório temporário, mede `get_status_range()`
+sem filtros, roda `archive_status()` e mede de novo. Cada leitura roda num processo
+novo, para que o pico de memória (ru_maxrss) seja só dela.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_archive.py --stations 200 --days 14
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from bike_analyzer.archive import archive_status
+from bike_analyzer.config import DEFAULT_SYSTEM_ID
+from bike_analyzer.db import get_engine, init_db, refresh_data_stats
+from bike_analyzer.etl_gbfs import _INSERT_SNAPSHOT_SQL, _INSERT_STATUS_SQL, _RECORD_SYSTEM_SQL
+
+
+def _populate(n_stations: int, days: int, every_min: int, seed: int = 0) -> int:
+    rng = np.random.default_rng(seed)
+    engine = get_engine()
+    init_db(engine)
+    times = pd.date_range("2024-01-01", periods=days * 24 * 60 // every_min, freq=f"{every_min}min", tz="-03:00")
+    bikes = np.clip(rng.choice([-1, 0, 0, 0, 1], size=(len(times), n_stations)).cumsum(axis=0) + 8, 0, 16)
+    ids = [str(i) for i in range(n_stations)]
+    with engine.begin() as conn:
+        for t, row in zip(times, bikes):
+            snapshot_id = conn.execute(
+                _INSERT_SNAPSHOT_SQL,
+                {
+                    "scraped_at": t.isoformat(), "ts_epoch": int(t.timestamp()),
+                    "n_stations": n_stations, "n_rows": n_stations,
+                },
+            ).scalar_one()
+            conn.execute(
+                _INSERT_STATUS_SQL,
+                [
+                    {
+                        "station_id": sid, "nba": int(b), "nbd": 0, "nda": 16 - int(b), "ndd": 0,
+                        "installed": 1, "renting": 1, "returning": 1, "last_reported": None,
+                        "snapshot_id": snapshot_id, "vehicles_json": None, "system_id": DEFAULT_SYSTEM_ID,
+                    }
+                    for sid, b in zip(ids, row)
+                ],
+            )
+            conn.execute(
+                _RECORD_SYSTEM_SQL,
+                {"system_id": DEFAULT_SYSTEM_ID, "ts_epoch": int(t.timestamp()), "snapshot_id": snapshot_id},
+            )
+        refresh_data_stats(conn)
+    return bikes.size
+
+
+def _read_once() -> dict[str, Any]:
+    from bike_analyzer.utils import get_status_range
+
+    t0 = time.perf_counter()
+    df = get_status_range()
+    return {
+        "rows": len(df),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _read_in_child(cwd: str) -> dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--read"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    return json.loads(out.stdout)
+
+
+def run(n_stations: int, days: int, every_min: int) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)  # DATABASE_URL/ARCHIVE_DIR are relative to the working directory
+        try:
+            rows = _populate(n_stations, days, every_min)
+            sqlite = _read_in_child(tmp)
+            t0 = time.perf_counter()
+            archived = archive_status(keep_days=1)
+            archived["seconds"] = round(time.perf_counter() - t0, 2)
+            parquet = _read_in_child(tmp)
+        finally:
+            os.chdir(cwd)
+    return {
+        "rows": rows,
+        "sqlite": sqlite,
+        "archive": archived,
+        "parquet": parquet,
+        "speedup": round(sqlite["seconds"] / max(parquet["seconds"], 1e-9), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=200)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--every-min", type=int, default=5, help="Intervalo entre coletas sintéticas")
+    parser.add_argument("--read", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.read:
+        print(json.dumps(_read_once()))
+        return
+    print(json.dumps(run(args.stations, args.days, args.every_min), indent=2))
+
+
+if __name__ == "__main__":
+    main()
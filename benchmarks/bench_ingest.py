@@ -0,0 +1,144 @@
+"""Compara ingestão linha-a-linha (caminho antigo) com a ingestão em lote.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_ingest.py --stations 500 --snapshots 20 --hours 1344
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import TextClause
+
+from bike_analyzer.config import WEATHER_HOURLY_PARAMS
+from bike_analyzer.db import init_db
+from bike_analyzer.etl_gbfs import (
+    _INSERT_STATUS_SQL,
+    _UPSERT_STATION_SQL,
+    _station_rows,
+    _status_rows,
+    append_status_snapshot,
+    load_stations,
+)
+from bike_analyzer.etl_weather import _UPSERT_WEATHER_SQL, _weather_rows, load_weather_hourly
+
+
+def _fake_station_information(n: int) -> dict[str, Any]:
+    stations = [
+        {
+            "station_id": str(i),
+            "name": f"Estação {i}",
+            "lat": -30.0346 + random.uniform(-0.05, 0.05),
+            "lon": -51.2177 + random.uniform(-0.05, 0.05),
+            "capacity": 12,
+            "rental_methods": ["KEY", "CREDITCARD"],
+        }
+        for i in range(n)
+    ]
+    return {"last_updated": int(time.time()), "data": {"stations": stations}}
+
+
+def _fake_station_status(n: int) -> dict[str, Any]:
+    stations = []
+    for i in range(n):
+        bikes = random.randint(0, 12)
+        stations.append(
+            {
+                "station_id": str(i),
+                "num_bikes_available": bikes,
+                "num_bikes_disabled": 0,
+                "num_docks_available": 12 - bikes,
+                "num_docks_disabled": 0,
+                "is_installed": 1,
+                "is_renting": 1,
+                "is_returning": 1,
+                "last_reported": int(time.time()),
+            }
+        )
+    return {"last_updated": int(time.time()), "data": {"stations": stations}}
+
+
+def _fake_weather(hours: int) -> dict[str, Any]:
+    t0 = datetime(2024, 1, 1)
+    hourly: dict[str, list[Any]] = {
+        "time": [(t0 + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)]
+    }
+    for c in WEATHER_HOURLY_PARAMS["hourly"]:
+        hourly[c] = [random.random() for _ in range(hours)]
+    return {"hourly": hourly}
+
+
+# --- caminho antigo: um text() + execute por linha ---------------------------
+
+def _per_row(engine: Engine, stmt: TextClause, rows: list[dict[str, Any]]) -> int:
+    with engine.begin() as conn:
+        for r in rows:
+            conn.execute(text(stmt.text), r)
+    return len(rows)
+
+
+def _timed(fn: Callable[[], int]) -> dict[str, float]:
+    t0 = time.perf_counter()
+    n = fn()
+    dt = time.perf_counter() - t0
+    return {"rows": n, "seconds": round(dt, 4), "rows_per_sec": round(n / dt, 1) if dt else 0.0}
+
+
+def run(n_stations: int, n_snapshots: int, n_hours: int) -> dict[str, Any]:
+    si = _fake_station_information(n_stations)
+    snapshots = [_fake_station_status(n_stations) for _ in range(n_snapshots)]
+    weather = _fake_weather(n_hours)
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("per_row", "batched"):
+            engine = create_engine(f"sqlite:///{Path(tmp) / mode}.sqlite", future=True)
+            init_db(engine)
+            if mode == "per_row":
+                st = _timed(lambda: _per_row(engine, _UPSERT_STATION_SQL, _station_rows(si)))
+                ss = _timed(
+                    lambda: sum(
+                        _per_row(
+                            engine,
+                            _INSERT_STATUS_SQL,
+                            [{**r, "snapshot_id": 1} for r in _status_rows(s, "2024-01-01T00:00:00-03:00")],
+                        )
+                        for s in snapshots
+                    )
+                )
+                wh = _timed(lambda: _per_row(engine, _UPSERT_WEATHER_SQL, _weather_rows(weather)))
+            else:
+                st = _timed(lambda: load_stations(si, engine))
+                ss = _timed(lambda: sum(append_status_snapshot(s, engine) for s in snapshots))
+                wh = _timed(lambda: load_weather_hourly(weather, engine))
+            results[mode] = {"stations": st, "station_status": ss, "weather_hourly": wh}
+            engine.dispose()
+        # repetir station_information inalterado deve ser praticamente grátis
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'batched'}.sqlite", future=True)
+        results["batched"]["stations_unchanged"] = _timed(lambda: load_stations(si, engine))
+        engine.dispose()
+    for table in ("stations", "station_status", "weather_hourly"):
+        old = results["per_row"][table]["rows_per_sec"]
+        new = results["batched"][table]["rows_per_sec"]
+        results.setdefault("speedup", {})[table] = round(new / old, 2) if old else None
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--snapshots", type=int, default=20)
+    parser.add_argument("--hours", type=int, default=24 * 56)
+    args = parser.parse_args()
+    print(json.dumps(run(args.stations, args.snapshots, args.hours), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Pico de memória e tempo da leitura do histórico: carregador padrão, compacto e em blocos.
+
+Gera uma base sintética num diretório temporário (mesma geração de `bench_archive.py`,
+opcionalmente compactada para o modo delta) e lê o histórico completo em cada modo,
+cada leitura num processo novo para que o pico de memória (ru_maxrss) seja só dela.
+Também monta o `DeltaCube` a partir do resultado, como o dashboard faz, e compara com a
+leitura em blocos (`iter_status_range`) alimentando `StationMean`/`StationActivity`, cujo
+pico de memória não depende do tamanho do intervalo.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_loader.py --stations 500 --days 14 --storage delta
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from bench_archive import _populate
+
+
+def _rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _read_once(compact: bool) -> dict[str, Any]:
+    from bike_analyzer.delta_cube import DeltaCube
+    from bike_analyzer.utils import get_status_range
+
+    baseline = _rss_mb()
+    t0 = time.perf_counter()
+    df = get_status_range(compact=compact)
+    seconds = time.perf_counter() - t0
+    peak_read = _rss_mb()
+    t0 = time.perf_counter()
+    DeltaCube.from_status(df)
+    return {
+        "rows": len(df),
+        "seconds": round(seconds, 3),
+        "frame_mb": round(df.memory_usage(deep=True).sum() / 2**20, 1),
+        "peak_rss_mb": peak_read,
+        "read_rss_mb": round(peak_read - baseline, 1),
+        "cube_seconds": round(time.perf_counter() - t0, 3),
+        "peak_rss_with_cube_mb": _rss_mb(),
+    }
+
+
+def _stream_once(chunk_snapshots: int) -> dict[str, Any]:
+    from bike_analyzer.streaming import StationActivity, StationMean
+    from bike_analyzer.utils import iter_status_range
+
+    baseline = _rss_mb()
+    t0 = time.perf_counter()
+    mean, activity = StationMean(), StationActivity()
+    rows = 0
+    for chunk in iter_status_range(chunk_snapshots=chunk_snapshots):
+        mean.update(chunk)
+        activity.update(chunk)
+        rows += len(chunk)
+    mean.result(), activity.result()
+    return {
+        "rows": rows,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "peak_rss_mb": _rss_mb(),
+        "read_rss_mb": round(_rss_mb() - baseline, 1),
+    }
+
+
+def _read_in_child(cwd: str, *flags: str) -> dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--read", *flags],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    return json.loads(out.stdout)
+
+
+def run(n_stations: int, days: int, every_min: int, storage: str, chunk_snapshots: int) -> dict[str, Any]:
+    from bike_analyzer.status_store import compact_status
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)  # DATABASE_URL is relative to the working directory
+        try:
+            rows = _populate(n_stations, days, every_min)
+            if storage == "delta":
+                compact_status()
+            default = _read_in_child(tmp)
+            compact = _read_in_child(tmp, "--compact")
+            stream = _read_in_child(tmp, "--stream", str(chunk_snapshots))
+        finally:
+            os.chdir(cwd)
+    return {
+        "rows": rows,
+        "storage": storage,
+        "default": default,
+        "compact": compact,
+        "stream": stream,
+        "frame_ratio": round(default["frame_mb"] / max(compact["frame_mb"], 1e-9), 1),
+        "read_rss_ratio": round(default["read_rss_mb"] / max(compact["read_rss_mb"], 1e-9), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--every-min", type=int, default=5, help="Intervalo entre coletas sintéticas")
+    parser.add_argument("--storage", choices=["full", "delta"], default="full")
+    parser.add_argument("--chunk-snapshots", type=int, default=288, help="Coletas por bloco na leitura em blocos")
+    parser.add_argument("--read", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--compact", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--stream", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.read:
+        print(json.dumps(_stream_once(args.stream) if args.stream else _read_once(args.compact)))
+        return
+    print(json.dumps(run(args.stations, args.days, args.every_min, args.storage, args.chunk_snapshots), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Compara o matching OD antigo (laço Python + haversine escalar) com os matchers vetorizados.
+
+Cada cenário simula um bucket com N estações que mudaram de estoque (metade partidas,
+metade chegadas, de 1 a ``--max-count`` bikes cada) e mede tempo e distância total dos
+fluxos atribuídos. ``optimal_solver`` indica como o ``optimal`` resolveu o bucket: atribuição
+bike a bike (``assignment``, matriz de ``assignment_mb``) ou transporte entre estações
+(``transport``, acima de ``ASSIGNMENT_MAX_CELLS``).
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_od_matching.py --sizes 10 100 500 2000 --legacy-max 500
+    PYTHONPATH=src python benchmarks/bench_od_matching.py --sizes 200 1000 --max-count 30 --legacy-max 0
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from bike_analyzer.od_inference import ASSIGNMENT_MAX_CELLS, MATCHERS
+from bike_analyzer.utils import haversine, haversine_matrix
+
+
+# --- implementação anterior, mantida aqui só como referência ------------------
+
+@dataclass
+class Node:
+    station_id: int
+    lat: float
+    lon: float
+    count: int
+
+
+def _legacy_match(departs: list[Node], arrives: list[Node]) -> list[tuple[int, int, int]]:
+    flows: list[tuple[int, int, int]] = []
+    while True:
+        dep_candidates = [d for d in departs if d.count > 0]
+        arr_candidates = [a for a in arrives if a.count > 0]
+        if not dep_candidates or not arr_candidates:
+            break
+        dep = max(dep_candidates, key=lambda x: x.count)
+        best = None
+        best_dist = 1e18
+        for a in arr_candidates:
+            dist = haversine(dep.lat, dep.lon, a.lat, a.lon)
+            if dist < best_dist:
+                best = a
+                best_dist = dist
+        if best is None:
+            break
+        flow = min(dep.count, best.count)
+        flows.append((dep.station_id, best.station_id, flow))
+        dep.count -= flow
+        best.count -= flow
+    return flows
+
+
+def _scenario(n: int, max_count: int, rng: np.random.Generator) -> dict[str, np.ndarray]:
+    lat = -30.0346 + rng.uniform(-0.08, 0.08, n)
+    lon = -51.2177 + rng.uniform(-0.08, 0.08, n)
+    counts = rng.integers(1, max_count + 1, n)
+    is_dep = np.arange(n) % 2 == 0
+    return {"lat": lat, "lon": lon, "counts": counts, "is_dep": is_dep}
+
+
+def run(sizes: list[int], legacy_max: int, max_count: int = 3, seed: int = 0) -> list[dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    for match in MATCHERS.values():  # warm-up (lazy imports)
+        match(np.array([1]), np.array([1]), np.zeros((1, 1)))
+    out = []
+    for n in sizes:
+        sc = _scenario(n, max_count, rng)
+        dep_i = np.flatnonzero(sc["is_dep"])
+        arr_i = np.flatnonzero(~sc["is_dep"])
+        cells = int(sc["counts"][dep_i].sum()) * int(sc["counts"][arr_i].sum())
+        row: dict[str, Any] = {
+            "moving_stations": n,
+            "moving_bikes": int(sc["counts"].sum()),
+            "optimal_solver": "assignment" if cells <= ASSIGNMENT_MAX_CELLS else "transport",
+            "assignment_mb": round(cells * 4 / 2**20, 1),
+        }
+
+        t0 = time.perf_counter()
+        dist = haversine_matrix(sc["lat"][dep_i], sc["lon"][dep_i], sc["lat"][arr_i], sc["lon"][arr_i])
+        row["distance_matrix_s"] = round(time.perf_counter() - t0, 4)
+
+        for name, match in MATCHERS.items():
+            t0 = time.perf_counter()
+            flows = match(sc["counts"][dep_i], sc["counts"][arr_i], dist)
+            row[f"{name}_s"] = round(time.perf_counter() - t0, 4)
+            row[f"{name}_km"] = round(sum(dist[i, j] * c for i, j, c in flows) / 1000, 2)
+
+        if n <= legacy_max:
+            departs = [Node(int(k), sc["lat"][k], sc["lon"][k], int(sc["counts"][k])) for k in dep_i]
+            arrives = [Node(int(k), sc["lat"][k], sc["lon"][k], int(sc["counts"][k])) for k in arr_i]
+            t0 = time.perf_counter()
+            _legacy_match(departs, arrives)
+            row["legacy_s"] = round(time.perf_counter() - t0, 4)
+        out.append(row)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500, 1000, 3000])
+    parser.add_argument("--legacy-max", type=int, default=500, help="Maior cenário para o laço antigo")
+    parser.add_argument("--max-count", type=int, default=3, help="Máximo de bikes movidas por estação no bucket")
+    args = parser.parse_args()
+    print(json.dumps(run(args.sizes, args.legacy_max, args.max_count), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Suíte de benchmarks em escala: coleta, ingestão, clima, leitura, OD e agregações do dashboard.
+
+Para cada escala (1x, 10x, 100x o volume atual), gera uma rede sintética (``synthetic.py``),
+carrega a base num diretório temporário pelo caminho da ingestão e mede cada caso num
+processo novo, para que o pico de memória (ru_maxrss) seja só dele. O volume 1x é o de hoje:
+CURRENT_STATIONS estações, uma coleta a cada CURRENT_EVERY_MIN min, ``--days`` dias de
+histórico; ``--scale-by`` diz se a escala multiplica os dias (padrão) ou as estações.
+A coleta (``fetch``) usa o servidor local de ``stub_server.py``, sem rede.
+
+Casos: fetch, load_weather_hourly, get_status_range (último dia), get_status_range_all
+(histórico inteiro, compacto), infer_flows (último dia), dashboard (get_station_stats,
+get_station_summary, get_hour_of_day_profile, hexbin_levels, state_at) e, por último,
+append_status_snapshot (coletas novas sobre a base carregada, com rollups).
+
+A saída é JSON: uma lista de resultados (--jsonl: um resultado por linha). A escala 100x
+carrega ~18 M linhas e leva dezenas de minutos.
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_suite.py --scales 1 10 100 --days 7
+    PYTHONPATH=src python benchmarks/bench_suite.py --scales 1 --cases fetch infer_flows --jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+import pandas as pd
+
+from synthetic import CURRENT_EVERY_MIN, CURRENT_STATIONS, SyntheticNetwork, weather_payload
+
+START = "2024-01-01T00:00:00-03:00"
+CASES = (
+    "fetch",
+    "load_weather_hourly",
+    "get_status_range",
+    "get_status_range_all",
+    "infer_flows",
+    "dashboard",
+    "append_status_snapshot",  # writes to the base: keep it last
+)
+
+
+def _rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _network(args: argparse.Namespace, **kwargs: Any) -> SyntheticNetwork:
+    return SyntheticNetwork(args.stations, every_min=args.every_min, churn=args.churn, seed=args.seed, **kwargs)
+
+
+def _populate(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.db import get_data_stats, get_engine, init_db
+    from bike_analyzer.etl_gbfs import append_status_snapshot, load_stations
+    from bike_analyzer.rollups import rebuild_rollups
+
+    engine = get_engine()
+    init_db(engine)
+    t0 = time.perf_counter()
+    net = _network(args, start=START)
+    load_stations(net.station_information(), engine)
+    # Same path as `replay`: rollups rebuilt once at the end
+    for scraped_at, payload in net.snapshots(args.days):
+        append_status_snapshot(payload, engine, args.storage, scraped_at=scraped_at, rollups=False)
+    rebuild_rollups(engine=engine)
+    stats = get_data_stats(engine)
+    return {
+        "snapshots": stats["n_snapshots"],
+        "rows": stats["n_status_rows"],
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+
+def _last_day() -> tuple[str, str]:
+    from bike_analyzer.utils import get_time_bounds
+
+    _, hi = get_time_bounds()
+    return (pd.Timestamp(hi) - pd.Timedelta(days=1)).isoformat(), hi
+
+
+def _case_fetch(args: argparse.Namespace) -> dict[str, Any]:
+    from stub_server import StubServer
+
+    from bike_analyzer.etl_gbfs import GbfsClient
+    from bike_analyzer.etl_weather import fetch_weather
+
+    n = 20
+    with StubServer(_network(args)) as server, GbfsClient(server.gbfs_url, archive=False) as client:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            client.fetch_feeds()
+        gbfs = time.perf_counter() - t0
+        end = (pd.Timestamp("2024-01-01") + pd.Timedelta(days=args.days - 1)).date().isoformat()
+        t0 = time.perf_counter()
+        weather = fetch_weather("2024-01-01", end, url=server.weather_url)
+        weather_s = time.perf_counter() - t0
+    return {
+        "seconds": round(gbfs / n, 4),
+        "fetches": n,
+        "weather_seconds": round(weather_s, 4),
+        "weather_hours": len(weather["hourly"]["time"]),
+    }
+
+
+def _case_load_weather_hourly(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.etl_weather import load_weather_hourly
+
+    payload = weather_payload("2024-01-01", args.days)
+    t0 = time.perf_counter()
+    hours = load_weather_hourly(payload)
+    return {"seconds": round(time.perf_counter() - t0, 4), "hours": hours}
+
+
+def _case_get_status_range(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.utils import get_status_range
+
+    start, end = _last_day()
+    t0 = time.perf_counter()
+    df = get_status_range(start, end)
+    return {"seconds": round(time.perf_counter() - t0, 4), "result_rows": len(df)}
+
+
+def _case_get_status_range_all(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.utils import get_status_range
+
+    t0 = time.perf_counter()
+    df = get_status_range(compact=True)
+    return {"seconds": round(time.perf_counter() - t0, 4), "result_rows": len(df)}
+
+
+def _case_infer_flows(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.od_inference import infer_flows
+    from bike_analyzer.utils import get_stations, get_status_range
+
+    start, end = _last_day()
+    status, stations = get_status_range(start, end), get_stations()
+    t0 = time.perf_counter()
+    flows = infer_flows(status, stations, "10min")
+    return {"seconds": round(time.perf_counter() - t0, 4), "flows": len(flows), "trips": int(flows["count"].sum())}
+
+
+def _case_dashboard(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.aggregates import get_station_stats
+    from bike_analyzer.hexbins import hexbin_levels
+    from bike_analyzer.rollups import get_hour_of_day_profile, get_station_summary
+    from bike_analyzer.time_travel import state_at
+    from bike_analyzer.utils import get_stations, get_time_bounds
+
+    lo, hi = get_time_bounds()
+    mid = pd.Timestamp(lo) + (pd.Timestamp(hi) - pd.Timestamp(lo)) / 2
+    parts: dict[str, Callable[[], Any]] = {
+        "station_stats": lambda: get_station_stats(lo, hi),
+        "station_summary": lambda: get_station_summary(lo, hi),
+        "hour_profile": lambda: get_hour_of_day_profile(lo, hi),
+        "hexbins": lambda: hexbin_levels(
+            get_stations().merge(get_station_summary(lo, hi), on="station_id"), ["avg_bikes", "activity"]
+        ),
+        "state_at": lambda: state_at(mid.isoformat()),
+    }
+    out: dict[str, Any] = {}
+    for name, fn in parts.items():
+        t0 = time.perf_counter()
+        fn()
+        out[f"{name}_seconds"] = round(time.perf_counter() - t0, 4)
+    return {"seconds": round(sum(out.values()), 4), **out}
+
+
+def _case_append_status_snapshot(args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.etl_gbfs import append_status_snapshot
+    from bike_analyzer.utils import get_time_bounds
+
+    n = 50
+    _, hi = get_time_bounds()
+    # Same seed: the stations match the loaded base; the clock continues after its last snapshot
+    net = _network(args, start=(pd.Timestamp(hi) + pd.Timedelta(minutes=args.every_min)).isoformat())
+    payloads = [net.station_status() for _ in range(n)]
+    times = [(pd.Timestamp(hi) + pd.Timedelta(minutes=args.every_min * (i + 1))).isoformat() for i in range(n)]
+    t0 = time.perf_counter()
+    for scraped_at, payload in zip(times, payloads):
+        append_status_snapshot(payload, mode=args.storage, scraped_at=scraped_at)
+    return {"seconds": round((time.perf_counter() - t0) / n, 4), "snapshots": n}
+
+
+def _run_case(args: argparse.Namespace) -> dict[str, Any]:
+    fn = globals()[f"_case_{args.case}"]
+    best: dict[str, Any] | None = None
+    for _ in range(max(args.repeat, 1)):
+        res = fn(args)
+        if best is None or res["seconds"] < best["seconds"]:
+            best = res
+    assert best is not None
+    return {**best, "peak_rss_mb": _rss_mb()}
+
+
+def _case_in_child(cwd: str, case: str, args: argparse.Namespace) -> dict[str, Any]:
+    flags = [
+        "--case", case, "--stations", str(args.stations), "--days", str(args.days),
+        "--every-min", str(args.every_min), "--churn", str(args.churn), "--seed", str(args.seed),
+        "--storage", args.storage, "--repeat", str(args.repeat),
+    ]
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *flags],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    return json.loads(out.stdout)
+
+
+def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    results = []
+    for scale in args.scales:
+        scaled = argparse.Namespace(**vars(args))
+        if args.scale_by == "stations":
+            scaled.stations = int(args.stations * scale)
+        else:
+            scaled.days = args.days * scale
+        base = {"scale": scale, "stations": scaled.stations, "days": scaled.days, "storage": args.storage}
+        with tempfile.TemporaryDirectory() as tmp:
+            cwd = os.getcwd()
+            os.chdir(tmp)  # DATABASE_URL is relative to the working directory
+            try:
+                populated = _populate(scaled)
+            finally:
+                os.chdir(cwd)
+            results.append({**base, "case": "populate", **populated})
+            base["rows"] = populated["rows"]
+            for case in [c for c in CASES if c in args.cases]:
+                if args.jsonl:
+                    print(json.dumps(results[-1]), flush=True)
+                results.append({**base, "case": case, **_case_in_child(tmp, case, scaled)})
+        if args.jsonl:
+            print(json.dumps(results[-1]), flush=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100], help="Múltiplos do volume atual")
+    parser.add_argument("--scale-by", choices=["days", "stations"], default="days")
+    parser.add_argument("--stations", type=int, default=CURRENT_STATIONS, help="Estações no volume 1x")
+    parser.add_argument("--days", type=float, default=7, help="Dias de histórico no volume 1x")
+    parser.add_argument("--every-min", type=int, default=CURRENT_EVERY_MIN, help="Intervalo entre coletas sintéticas")
+    parser.add_argument("--churn", type=float, default=0.1, help="Fração de estações que mudam por coleta no pico")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--storage", choices=["full", "delta"], default="full")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=1, help="Repetições por caso (vale o menor tempo)")
+    parser.add_argument("--jsonl", action="store_true", help="Um resultado JSON por linha, à medida que saem")
+    parser.add_argument("--out", default=None, help="Também grava a lista de resultados neste arquivo")
+    parser.add_argument("--case", choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(_run_case(args)))
+        return
+    results = run(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if not args.jsonl:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
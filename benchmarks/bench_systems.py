@@ -0,0 +1,103 @@
+"""Compara a coleta sequencial de vários sistemas GBFS com o ``ingest-systems`` (asyncio).
+
+Sobe ``--systems`` servidores locais (``stub_server.py``), cada um com ``--latency`` s
+por resposta, e grava ``--cycles`` coletas de cada sistema numa base temporária:
+
+- sequential: um ``GbfsClient`` por sistema, ``load_stations`` + ``append_status_snapshot``
+  um sistema depois do outro (o tempo de um ciclo é a soma das latências);
+- async: ``MultiSystemIngester`` com ``--max-concurrency``/``--per-host`` e o gravador único
+  em lote (o tempo de um ciclo acompanha o sistema mais lento).
+
+Uso:
+    PYTHONPATH=src python benchmarks/bench_systems.py --systems 4 16 64 --latency 0.2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+from typing import Any
+
+from stub_server import StubServer
+from synthetic import SyntheticNetwork
+
+START = "2024-01-01T00:00:00-03:00"
+
+
+def _sequential(servers: list[StubServer], cycles: int) -> dict[str, Any]:
+    from bike_analyzer.etl_gbfs import GbfsClient, append_status_snapshot, load_stations
+
+    clients = [GbfsClient(s.gbfs_url, archive=False) for s in servers]
+    rows = 0
+    t0 = time.perf_counter()
+    for _ in range(cycles):
+        for i, client in enumerate(clients):
+            feeds = client.fetch_feeds()
+            load_stations(feeds["station_information"][0], system_id=f"s{i}")
+            rows += append_status_snapshot(feeds["station_status"][0], system_id=f"s{i}")
+    elapsed = time.perf_counter() - t0
+    for client in clients:
+        client.close()
+    return {"seconds": round(elapsed, 3), "snapshots": cycles * len(servers), "status_rows": rows}
+
+
+def _async(servers: list[StubServer], cycles: int, args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.multi_ingest import ingest_systems
+    from bike_analyzer.systems import System, add_system
+
+    for i, s in enumerate(servers):
+        add_system(System(f"s{i}", s.gbfs_url, min_interval=0.001, max_interval=0.001))
+    t0 = time.perf_counter()
+    res = ingest_systems(
+        [f"s{i}" for i in range(len(servers))],
+        iterations=cycles,
+        max_concurrency=args.max_concurrency,
+        per_host=args.per_host,
+        batch_window=args.batch_window,
+    )
+    return {"seconds": round(time.perf_counter() - t0, 3), "snapshots": res["snapshots"], "status_rows": res["status_rows"]}
+
+
+def _run(n: int, args: argparse.Namespace) -> dict[str, Any]:
+    from bike_analyzer.db import init_db
+
+    out: dict[str, Any] = {"systems": n, "latency": args.latency, "cycles": args.cycles}
+    for case in ("sequential", "async"):
+        with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+            cwd = os.getcwd()
+            os.chdir(tmp)  # DATABASE_URL is relative to the working directory
+            try:
+                os.makedirs("data")
+                init_db()
+                servers = [
+                    stack.enter_context(
+                        StubServer(SyntheticNetwork(args.stations, start=START, seed=i), latency=args.latency)
+                    )
+                    for i in range(n)
+                ]
+                res = _sequential(servers, args.cycles) if case == "sequential" else _async(servers, args.cycles, args)
+            finally:
+                os.chdir(cwd)
+        out[case] = res
+    out["speedup"] = round(out["sequential"]["seconds"] / out["async"]["seconds"], 1)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--systems", type=int, nargs="+", default=[4, 16, 64], help="Quantidades de sistemas")
+    parser.add_argument("--stations", type=int, default=100, help="Estações por sistema")
+    parser.add_argument("--latency", type=float, default=0.2, help="Atraso (s) de cada resposta dos servidores")
+    parser.add_argument("--cycles", type=int, default=3, help="Coletas por sistema")
+    parser.add_argument("--max-concurrency", type=int, default=64)
+    parser.add_argument("--per-host", type=int, default=4)
+    parser.add_argument("--batch-window", type=float, default=0.5)
+    args = parser.parse_args()
+    print(json.dumps([_run(n, args) for n in args.systems], indent=2))
+
+
+if __name__ == "__main__":
+    main()
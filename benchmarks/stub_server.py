@@ -0,0 +1,132 @@
+"""Servidor HTTP local que serve os payloads sintéticos, para medir os caminhos de coleta sem rede.
+
+Rotas (mesmo formato dos serviços reais):
+    /gbfs.json                      auto-discovery apontando para as rotas abaixo
+    /station_information.json       fixo, com ETag (responde 304 a If-None-Match)
+    /station_status.json            uma coleta nova por requisição (``SyntheticNetwork.station_status``)
+    /v1/forecast?start_date=&end_date=   resposta hourly do Open-Meteo para o intervalo
+
+``latency`` (s) atrasa cada resposta, como um servidor remoto (``bench_systems.py``), e
+``fail(path, times)`` faz as próximas ``times`` requisições da rota responderem 500 (testes de
+recuperação).
+
+Uso:
+    with StubServer(SyntheticNetwork(n_stations=500)) as server:
+        GbfsClient(server.gbfs_url).fetch_feeds()
+        fetch_weather("2024-01-01", "2024-01-07", url=server.weather_url)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from synthetic import SyntheticNetwork, weather_payload
+
+
+class StubServer:
+    def __init__(
+        self,
+        network: SyntheticNetwork | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+    ) -> None:
+        self.network = network or SyntheticNetwork()
+        self.latency = latency
+        self.requests = 0
+        self._failures: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._info = json.dumps(self.network.station_information()).encode()
+        self._info_etag = f'"{hashlib.sha1(self._info).hexdigest()[:16]}"'
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                stub._handle(self)
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def gbfs_url(self) -> str:
+        return f"{self.base_url}/gbfs.json"
+
+    @property
+    def weather_url(self) -> str:
+        return f"{self.base_url}/v1/forecast"
+
+    def __enter__(self) -> StubServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def fail(self, path: str, times: int = 1) -> None:
+        """As próximas ``times`` requisições de ``path`` (ex.: "/station_status.json") recebem 500."""
+        with self._lock:
+            self._failures[path] = self._failures.get(path, 0) + times
+
+    def _auto_discovery(self) -> bytes:
+        feeds = [
+            {"name": name, "url": f"{self.base_url}/{name}.json"}
+            for name in ("station_information", "station_status")
+        ]
+        return json.dumps({"last_updated": 0, "ttl": 0, "data": {"en": {"feeds": feeds}}}).encode()
+
+    def _handle(self, h: BaseHTTPRequestHandler) -> None:
+        url = urlparse(h.path)
+        etag = None
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.requests += 1
+            if self._failures.get(url.path):
+                self._failures[url.path] -= 1
+                h.send_response(500)
+                h.end_headers()
+                return
+            if url.path == "/gbfs.json":
+                body = self._auto_discovery()
+            elif url.path == "/station_information.json":
+                if h.headers.get("If-None-Match") == self._info_etag:
+                    h.send_response(304)
+                    h.end_headers()
+                    return
+                body, etag = self._info, self._info_etag
+            elif url.path == "/station_status.json":
+                body = json.dumps(self.network.station_status()).encode()
+            elif url.path == "/v1/forecast":
+                q = parse_qs(url.query)
+                start = q.get("start_date", ["2024-01-01"])[0]
+                end = q.get("end_date", [start])[0]
+                days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+                body = json.dumps(weather_payload(start, max(days, 1))).encode()
+            else:
+                h.send_response(404)
+                h.end_headers()
+                return
+        h.send_response(200)
+        h.send_header("Content-Type", "application/json")
+        h.send_header("Content-Length", str(len(body)))
+        if etag:
+            h.send_header("ETag", etag)
+        h.end_headers()
+        h.wfile.write(body)
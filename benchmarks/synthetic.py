@@ -0,0 +1,146 @@
+"""Gerador sintético de payloads GBFS (station_information/station_status) e Open-Meteo (hourly).
+
+A rede tem ``n_stations`` estações espalhadas em volta de CITY_LAT/CITY_LON. A cada coleta
+saem viagens (Poisson, com picos às 8h e às 18h): cada uma tira uma bike de uma estação
+e a devolve numa estação próxima com vaga, então as contagens se conservam e a inferência
+OD tem sinal de verdade. ``churn`` é a fração média de estações que mudam por coleta no
+pico; estações ocasionalmente param de alugar/devolver e voltam depois.
+
+Usado por ``bench_suite.py`` e pelo servidor local de ``stub_server.py``.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import numpy as np
+import pandas as pd
+
+from bike_analyzer.config import CITY_LAT, CITY_LON, TIMEZONE, WEATHER_HOURLY_PARAMS
+
+# Porto Alegre today: stations in the GBFS feed, one snapshot every 5 minutes
+CURRENT_STATIONS = 88
+CURRENT_EVERY_MIN = 5
+GBFS_TTL = 60
+
+
+def _intensity(hour: np.ndarray | float) -> np.ndarray:
+    # Relative trip rate by local hour: night floor plus morning and evening peaks (max ~1)
+    h = np.asarray(hour, dtype=float)
+    peaks = 0.9 * np.exp(-((h - 8) ** 2) / 2.0) + np.exp(-((h - 18) ** 2) / 3.0) + 0.3 * np.exp(-((h - 13) ** 2) / 4.0)
+    return 0.08 + peaks
+
+
+@dataclass
+class SyntheticNetwork:
+    n_stations: int = CURRENT_STATIONS
+    start: str = "2024-01-01T00:00:00-03:00"
+    every_min: int = CURRENT_EVERY_MIN
+    churn: float = 0.1  # fraction of stations changing per snapshot at peak
+    outage_prob: float = 0.0005  # per station and snapshot
+    seed: int = 0
+    rng: np.random.Generator = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.rng = np.random.default_rng(self.seed)
+        n = self.n_stations
+        # ~3 km spread around the city center, in degrees
+        self.lat = CITY_LAT + self.rng.normal(0, 0.027, n)
+        self.lon = CITY_LON + self.rng.normal(0, 0.031, n)
+        self.capacity = self.rng.integers(10, 21, n)
+        self.bikes = (self.capacity * self.rng.uniform(0.2, 0.8, n)).astype(np.int64)
+        self.renting = np.ones(n, dtype=np.int64)
+        self.ids = np.array([str(1000 + i) for i in range(n)], dtype=object)
+        # Trips end at one of the 10 nearest stations
+        d2 = (self.lat[:, None] - self.lat[None, :]) ** 2 + (self.lon[:, None] - self.lon[None, :]) ** 2
+        np.fill_diagonal(d2, np.inf)
+        self.near = np.argsort(d2, axis=1)[:, : min(10, max(n - 1, 1))]
+        self.t = pd.Timestamp(self.start)
+        self.i = 0
+
+    def station_information(self) -> dict[str, Any]:
+        stations = [
+            {
+                "station_id": sid,
+                "name": f"Estação {sid}",
+                "lat": round(float(la), 6),
+                "lon": round(float(lo), 6),
+                "capacity": int(c),
+                "address": f"Rua Sintética, {k}",
+                "rental_methods": ["KEY", "CREDITCARD"],
+                "is_virtual_station": False,
+            }
+            for k, (sid, la, lo, c) in enumerate(zip(self.ids, self.lat, self.lon, self.capacity))
+        ]
+        last_updated = int(pd.Timestamp(self.start).timestamp())
+        return {"last_updated": last_updated, "ttl": 86400, "version": "2.2", "data": {"stations": stations}}
+
+    def _step(self) -> None:
+        n = self.n_stations
+        rate = self.churn * n * float(_intensity(self.t.tz_convert(TIMEZONE).hour)) / 2
+        for o in self.rng.integers(0, n, self.rng.poisson(rate)):
+            if self.bikes[o] == 0 or not self.renting[o]:
+                continue
+            free = [d for d in self.near[o] if self.bikes[d] < self.capacity[d] and self.renting[d]]
+            if free:
+                self.bikes[o] -= 1
+                self.bikes[free[self.rng.integers(len(free))]] += 1
+        flip = self.rng.random(n) < np.where(self.renting == 1, self.outage_prob, 0.05)
+        self.renting = np.where(flip, 1 - self.renting, self.renting)
+
+    def station_status(self) -> dict[str, Any]:
+        """Próxima coleta (avança ``every_min`` minutos)."""
+        if self.i:
+            self.t += pd.Timedelta(minutes=self.every_min)
+            self._step()
+        self.i += 1
+        ts = int(self.t.timestamp())
+        stations = [
+            {
+                "station_id": sid,
+                "num_bikes_available": int(b),
+                "num_bikes_disabled": 0,
+                "num_docks_available": int(c - b),
+                "num_docks_disabled": 0,
+                "is_installed": 1,
+                "is_renting": int(r),
+                "is_returning": int(r),
+                "last_reported": ts,
+            }
+            for sid, b, c, r in zip(self.ids, self.bikes, self.capacity, self.renting)
+        ]
+        return {"last_updated": ts, "ttl": GBFS_TTL, "version": "2.2", "data": {"stations": stations}}
+
+    @property
+    def scraped_at(self) -> str:
+        """Horário (ISO) da última coleta gerada."""
+        return self.t.isoformat()
+
+    def snapshots(self, days: float) -> Iterator[tuple[str, dict[str, Any]]]:
+        """(scraped_at, payload) de todas as coletas de ``days`` dias."""
+        for _ in range(int(days * 24 * 60 // self.every_min)):
+            payload = self.station_status()
+            yield self.scraped_at, payload
+
+
+def weather_payload(start: str, days: float, seed: int = 0) -> dict[str, Any]:
+    """Resposta do Open-Meteo (``hourly``) para ``days`` dias a partir de ``start`` (YYYY-MM-DD)."""
+    rng = np.random.default_rng(seed)
+    times = pd.date_range(start, periods=int(days * 24), freq="h")
+    h = times.hour.to_numpy()
+    rain = np.where(rng.random(len(times)) < 0.08, rng.exponential(1.5, len(times)), 0.0).round(1)
+    series = {
+        "temperature_2m": (20 + 6 * np.sin((h - 9) / 24 * 2 * np.pi) + rng.normal(0, 1, len(times))).round(1),
+        "precipitation": rain,
+        "rain": rain,
+        "showers": np.zeros(len(times)),
+        "snowfall": np.zeros(len(times)),
+        "cloudcover": rng.integers(0, 101, len(times)),
+        "windspeed_10m": rng.gamma(2.0, 5.0, len(times)).round(1),
+        "relative_humidity_2m": rng.integers(40, 100, len(times)),
+        "weathercode": np.where(rain > 0, 61, 1),
+    }
+    hourly = {"time": times.strftime("%Y-%m-%dT%H:%M").tolist()}
+    for c in WEATHER_HOURLY_PARAMS["hourly"]:
+        hourly[c] = series[c].tolist() if c in series else [None] * len(times)
+    return {"latitude": CITY_LAT, "longitude": CITY_LON, "timezone": TIMEZONE, "hourly": hourly}
@@ -1,53 +1,47 @@
 -- KPIs e consultas exemplo
 
 -- 1) Resumo da rede na última coleta
-WITH last_scrape AS (
-  SELECT MAX(scraped_at) AS ts FROM station_status
-)
+-- (station_status_latest guarda o último estado de cada estação, nos modos full e delta)
 SELECT
   COUNT(DISTINCT s.station_id) AS estaciones,
   SUM(COALESCE(s.capacity,0)) AS capacidade_total,
   SUM(ss.num_bikes_available) AS bikes_disp,
   SUM(ss.num_docks_available) AS docks_disp
-FROM station_status ss
-JOIN last_scrape ls ON ss.scraped_at = ls.ts
+FROM station_status_latest ss
 JOIN stations s ON s.station_id = ss.station_id;
 
 -- 2) Top 10 estações por ocupação (bikes/capacidade) no último snapshot
-WITH last_scrape AS (
-  SELECT MAX(scraped_at) AS ts FROM station_status
-)
 SELECT
   s.station_id,
   s.name,
   s.capacity,
   ss.num_bikes_available,
   ROUND(100.0 * ss.num_bikes_available / NULLIF(s.capacity,0), 1) AS ocupacao_pct
-FROM station_status ss
-JOIN last_scrape ls ON ss.scraped_at = ls.ts
+FROM station_status_latest ss
 JOIN stations s ON s.station_id = ss.station_id
 WHERE s.capacity IS NOT NULL AND s.capacity > 0
 ORDER BY ocupacao_pct DESC
 LIMIT 10;
 
 -- 3) Série horária média de bikes disponíveis por hora do dia
+-- (3-5 leem os rollups station_hourly/station_daily, mantidos na ingestão e recalculados por `rebuild-rollups`)
 SELECT
   s.station_id,
   s.name,
-  STRFTIME('%H', ss.scraped_at) AS hora,
-  AVG(ss.num_bikes_available) AS media_bikes
-FROM station_status ss
+  SUBSTR(h.hour, 12, 2) AS hora,
+  SUM(h.sum_bikes) * 1.0 / SUM(h.n_samples) AS media_bikes
+FROM station_hourly h
 JOIN stations s USING(station_id)
 GROUP BY 1,2,3
 ORDER BY s.name, hora;
 
 -- 4) Correlação simples com clima (temperatura)
--- Agregar status por hora e juntar com clima
+-- Agregar status por hora (chave no mesmo formato de weather_hourly.time) e juntar com clima
 WITH status_hour AS (
   SELECT
-    SUBSTR(scraped_at, 1, 13) || ':00:00' AS hora,
-    AVG(num_bikes_available) AS bikes_med
-  FROM station_status
+    hour AS hora,
+    SUM(sum_bikes) * 1.0 / SUM(n_samples) AS bikes_med
+  FROM station_hourly
   GROUP BY 1
 )
 SELECT
@@ -56,4 +50,27 @@ SELECT
   sh.bikes_med
 FROM weather_hourly wh
 JOIN status_hour sh ON sh.hora = wh.time
-ORDER BY hora;
\ No newline at end of file
+ORDER BY hora;
+
+-- 5) Estações que mais ficaram vazias ou cheias por dia
+SELECT
+  d.day,
+  s.name,
+  ROUND(d.empty_min) AS minutos_vazia,
+  ROUND(d.full_min) AS minutos_cheia,
+  d.activity
+FROM station_daily d
+JOIN stations s USING(station_id)
+ORDER BY d.day DESC, d.empty_min + d.full_min DESC;
+
+-- 6) Por estação: média de bikes com e sem chuva, por hora do dia
+-- (station_features: rollup horário com o clima alinhado à hora local, weathercode WMO >= 51 = garoa/chuva)
+SELECT
+  f.station_id,
+  f.hour_of_day AS hora,
+  AVG(CASE WHEN f.weathercode >= 51 THEN f.sum_bikes * 1.0 / f.n_samples END) AS bikes_chuva,
+  AVG(CASE WHEN f.weathercode < 51 THEN f.sum_bikes * 1.0 / f.n_samples END) AS bikes_seco
+FROM station_features f
+WHERE f.n_samples > 0
+GROUP BY 1, 2
+ORDER BY 1, 2;
@@ -12,7 +12,8 @@ CREATE TABLE IF NOT EXISTS stations (
   external_id TEXT,
   short_name TEXT,
   region_id TEXT,
-  last_updated INTEGER
+  last_updated INTEGER,
+  system_id TEXT NOT NULL DEFAULT 'bikepoa'
 );
 
 CREATE TABLE IF NOT EXISTS station_status (
@@ -26,11 +27,14 @@ CREATE TABLE IF NOT EXISTS station_status (
   is_renting INTEGER,
   is_returning INTEGER,
   last_reported INTEGER,
-  scraped_at TEXT NOT NULL,
+  snapshot_id INTEGER NOT NULL,
   vehicles_json TEXT,
-  FOREIGN KEY (station_id) REFERENCES stations (station_id)
+  system_id TEXT NOT NULL DEFAULT 'bikepoa',
+  FOREIGN KEY (station_id) REFERENCES stations (station_id),
+  FOREIGN KEY (snapshot_id) REFERENCES snapshots (snapshot_id)
 );
-CREATE INDEX IF NOT EXISTS idx_station_status_station_time ON station_status(station_id, scraped_at);
+CREATE INDEX IF NOT EXISTS idx_station_status_station_snapshot ON station_status(station_id, snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_station_status_snapshot ON station_status(snapshot_id);
 
 CREATE TABLE IF NOT EXISTS weather_hourly (
   time TEXT PRIMARY KEY,
@@ -42,5 +46,191 @@ CREATE TABLE IF NOT EXISTS weather_hourly (
   cloudcover REAL,
   windspeed_10m REAL,
   relative_humidity_2m REAL,
-  weathercode INTEGER
+  weathercode INTEGER,
+  -- 1: hora ainda futura quando foi baixada (previsão), o sync de clima a baixa de novo depois que passar
+  is_forecast INTEGER
+);
+
+-- Log de coletas: uma linha por snapshot, mesmo quando station_status só recebe as mudanças (modo delta).
+-- station_status referencia o snapshot por snapshot_id; filtros de tempo usam ts_epoch (segundos UTC)
+CREATE TABLE IF NOT EXISTS snapshots (
+  snapshot_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  scraped_at TEXT NOT NULL UNIQUE,
+  n_stations INTEGER,
+  n_rows INTEGER,
+  ts_epoch INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots(ts_epoch);
+
+-- Contagens e marcas d'água mantidas pela ingestão, na mesma transação dos dados (uma linha, id = 1).
+-- n_status_rows conta só as linhas ainda no SQLite (sem as arquivadas em Parquet)
+CREATE TABLE IF NOT EXISTS data_stats (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  n_stations INTEGER NOT NULL DEFAULT 0,
+  n_snapshots INTEGER NOT NULL DEFAULT 0,
+  n_status_rows INTEGER NOT NULL DEFAULT 0,
+  first_ts_epoch INTEGER,
+  last_ts_epoch INTEGER,
+  last_snapshot_id INTEGER,
+  last_ingest_at TEXT,
+  last_ingest_stations INTEGER,
+  last_ingest_rows INTEGER,
+  last_ingest_ms REAL
+);
+
+-- Último estado conhecido de cada estação (detecção de mudanças na ingestão)
+CREATE TABLE IF NOT EXISTS station_status_latest (
+  station_id TEXT PRIMARY KEY,
+  num_bikes_available INTEGER,
+  num_bikes_disabled INTEGER,
+  num_docks_available INTEGER,
+  num_docks_disabled INTEGER,
+  is_installed INTEGER,
+  is_renting INTEGER,
+  is_returning INTEGER,
+  scraped_at TEXT NOT NULL
+);
+
+-- Fluxos OD materializados por janela (bucket_start em epoch segundos, UTC)
+CREATE TABLE IF NOT EXISTS od_flows (
+  bucket_size INTEGER NOT NULL,
+  matcher TEXT NOT NULL,
+  bucket_start INTEGER NOT NULL,
+  o TEXT NOT NULL,
+  d TEXT NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (bucket_size, matcher, bucket_start, o, d)
+);
+
+-- Até onde od_flows foi materializado: última janela (possivelmente parcial) e o snapshot anterior a ela
+CREATE TABLE IF NOT EXISTS od_watermarks (
+  bucket_size INTEGER NOT NULL,
+  matcher TEXT NOT NULL,
+  last_bucket_start INTEGER NOT NULL,
+  baseline_scraped_at TEXT,
+  PRIMARY KEY (bucket_size, matcher)
+);
+
+-- Agregados por estação e hora/dia (horário local; hour no formato de weather_hourly.time), mantidos na ingestão.
+-- Média = sum_bikes / n_samples; activity = soma das variações absolutas; empty_min/full_min = minutos vazia/cheia
+CREATE TABLE IF NOT EXISTS station_hourly (
+  station_id TEXT NOT NULL,
+  hour TEXT NOT NULL,
+  n_samples INTEGER NOT NULL,
+  sum_bikes INTEGER NOT NULL,
+  min_bikes INTEGER,
+  max_bikes INTEGER,
+  activity INTEGER NOT NULL,
+  empty_min REAL NOT NULL,
+  full_min REAL NOT NULL,
+  PRIMARY KEY (station_id, hour)
+);
+CREATE INDEX IF NOT EXISTS idx_station_hourly_hour ON station_hourly(hour);
+
+CREATE TABLE IF NOT EXISTS station_daily (
+  station_id TEXT NOT NULL,
+  day TEXT NOT NULL,
+  n_samples INTEGER NOT NULL,
+  sum_bikes INTEGER NOT NULL,
+  min_bikes INTEGER,
+  max_bikes INTEGER,
+  activity INTEGER NOT NULL,
+  empty_min REAL NOT NULL,
+  full_min REAL NOT NULL,
+  PRIMARY KEY (station_id, day)
+);
+CREATE INDEX IF NOT EXISTS idx_station_daily_day ON station_daily(day);
+
+-- Features estação x hora para modelagem: agregados das coletas da hora (mesma regra de station_hourly,
+-- mais docks) e o clima de weather_hourly alinhado (as-of) à hora local. weather_time é a hora de clima usada
+-- (NULL se não houver até FEATURES_WEATHER_MAX_LAG_H horas antes); mantida pela ingestão e pelo sync de clima
+CREATE TABLE IF NOT EXISTS station_features (
+  station_id TEXT NOT NULL,
+  hour TEXT NOT NULL,
+  hour_of_day INTEGER NOT NULL,
+  dow INTEGER NOT NULL,
+  n_samples INTEGER NOT NULL,
+  sum_bikes INTEGER NOT NULL,
+  min_bikes INTEGER,
+  max_bikes INTEGER,
+  sum_docks INTEGER NOT NULL,
+  min_docks INTEGER,
+  max_docks INTEGER,
+  activity INTEGER NOT NULL,
+  empty_min REAL NOT NULL,
+  full_min REAL NOT NULL,
+  weather_time TEXT,
+  temperature_2m REAL,
+  precipitation REAL,
+  rain REAL,
+  showers REAL,
+  snowfall REAL,
+  cloudcover REAL,
+  windspeed_10m REAL,
+  relative_humidity_2m REAL,
+  weathercode INTEGER,
+  PRIMARY KEY (station_id, hour)
+);
+CREATE INDEX IF NOT EXISTS idx_station_features_hour ON station_features(hour);
+CREATE INDEX IF NOT EXISTS idx_station_features_hod ON station_features(hour_of_day, station_id);
+CREATE INDEX IF NOT EXISTS idx_station_features_weather ON station_features(weathercode, hour_of_day);
+
+-- Bairro de cada estação, chaveado nas coordenadas: muda de lat/lon (ou de arquivo de limites) => recalcula.
+-- source: "geojson:<hash do arquivo>" (resolvedor offline) ou "nominatim" (fallback online)
+CREATE TABLE IF NOT EXISTS station_bairros (
+  station_id TEXT PRIMARY KEY,
+  lat REAL NOT NULL,
+  lon REAL NOT NULL,
+  bairro TEXT,
+  source TEXT NOT NULL,
+  resolved_at TEXT NOT NULL
+);
+
+-- Keyframes: estado completo da rede (última linha conhecida de cada estação) a cada KEYFRAME_EVERY_MIN minutos.
+-- ts_epoch é o da coleta do keyframe; o estado num instante T = keyframe <= T + linhas de station_status em (keyframe, T]
+CREATE TABLE IF NOT EXISTS status_keyframes (
+  ts_epoch INTEGER NOT NULL,
+  station_id TEXT NOT NULL,
+  num_bikes_available INTEGER,
+  num_bikes_disabled INTEGER,
+  num_docks_available INTEGER,
+  num_docks_disabled INTEGER,
+  is_installed INTEGER,
+  is_renting INTEGER,
+  is_returning INTEGER,
+  PRIMARY KEY (ts_epoch, station_id)
+);
+
+-- Instrumentação (metrics.stage): totais por etapa e hora, somados por todos os processos.
+-- total_ms/max_ms: duração das execuções; rows/bytes: volume processado (0 quando não se aplica)
+CREATE TABLE IF NOT EXISTS perf_metrics (
+  bucket_start INTEGER NOT NULL,
+  stage TEXT NOT NULL,
+  calls INTEGER NOT NULL,
+  total_ms REAL NOT NULL,
+  max_ms REAL NOT NULL,
+  rows INTEGER NOT NULL DEFAULT 0,
+  bytes INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket_start, stage)
+);
+
+-- Registro de sistemas GBFS (ingest-systems). O sistema padrão ('bikepoa' = DEFAULT_SYSTEM_ID, a URL de
+-- GBFS_AUTO_DISCOVERY_URL) guarda station_id como no feed; nos demais station_id vira "<system_id>:<id do feed>"
+CREATE TABLE IF NOT EXISTS systems (
+  system_id TEXT PRIMARY KEY,
+  name TEXT,
+  auto_discovery_url TEXT NOT NULL,
+  min_interval REAL NOT NULL DEFAULT 10,
+  max_interval REAL NOT NULL DEFAULT 300,
+  enabled INTEGER NOT NULL DEFAULT 1
+);
+
+-- Sistemas presentes em cada snapshot (um snapshot do ingest-systems junta as coletas de vários sistemas).
+-- ts_epoch repetido do snapshot: a coleta anterior de um sistema é uma busca no índice
+CREATE TABLE IF NOT EXISTS snapshot_systems (
+  system_id TEXT NOT NULL,
+  ts_epoch INTEGER NOT NULL,
+  snapshot_id INTEGER NOT NULL,
+  PRIMARY KEY (system_id, ts_epoch),
+  FOREIGN KEY (snapshot_id) REFERENCES snapshots (snapshot_id)
 );
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .archive import archived_days
+from .db import get_engine
+from .status_store import REMOVED_SQL, from_epoch, to_epoch
+from .streaming import StationActivity, StationMean
+from .utils import epoch_range, iter_status_range, read_carry_in
+
+# Per-station mean bikes and activity over the dense view, computed inside SQLite.
+# Snapshots in range are numbered k = 1..n; the carry-in state (passed as JSON, one row
+# per station) sits at k = 0. {weight} is how many snapshots a row stands for: in delta
+# storage every snapshot until the station's next row, in full storage just its own.
+# Tombstones (station out of the feed) end the weight of the row before them and are
+# skipped by the variations, as in the dense view.
+_STATION_STATS_SQL = """
+    WITH snaps AS (
+      SELECT snapshot_id, ROW_NUMBER() OVER (ORDER BY ts_epoch) AS k
+      FROM snapshots sn{cond}
+    ),
+    samples AS (
+      SELECT st.station_id, s.k, st.num_bikes_available AS v, """ + REMOVED_SQL + """ AS removed
+      FROM snaps s JOIN station_status st ON st.snapshot_id = s.snapshot_id
+      UNION ALL
+      SELECT json_extract(value, '$[0]'), 0, json_extract(value, '$[1]'), 0 FROM json_each(:carry)
+    ),
+    weighted AS (
+      SELECT station_id, k, v, removed, {weight} AS weight
+      FROM samples
+      WINDOW win AS (PARTITION BY station_id ORDER BY k)
+    ),
+    w AS (
+      SELECT station_id, k, v, weight, LAG(v) OVER (PARTITION BY station_id ORDER BY k) AS prev_v
+      FROM weighted
+      WHERE NOT removed
+    )
+    SELECT
+      station_id,
+      SUM(weight * v) AS sum_bikes,
+      SUM(CASE WHEN v IS NOT NULL THEN weight ELSE 0 END) AS n_samples,
+      -- The first row in range only steps from the carry-in when the range continues
+      -- from archived days; otherwise it has no sample before it
+      COALESCE(SUM(CASE WHEN k > 1 OR :continued THEN ABS(v - prev_v) END), 0) AS activity
+    FROM w
+    GROUP BY station_id
+"""
+_DELTA_WEIGHT = "LEAD(k, 1, :n + 1) OVER win - MAX(k, 1)"
+_FULL_WEIGHT = "(k > 0)"
+
+
+def get_station_stats(
+    start: str | pd.Timestamp | None = None,
+    end: str | pd.Timestamp | None = None,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Por estação: avg_bikes, n_samples e activity (soma das variações absolutas) no intervalo.
+
+    Calculado dentro do SQLite com funções de janela (``LAG``/``LEAD``), então só uma linha
+    por estação sai do banco; os números são os de ``StationMean``/``StationActivity`` sobre
+    ``get_status_range``. Dias já arquivados em Parquet são agregados em blocos e somados.
+    """
+    eng = engine or get_engine()
+    _, params = epoch_range(start, end)
+    lo, hi = params.get("start"), params.get("end")
+    days = archived_days()
+    # Archived days are all older than the rows still in SQLite
+    cutoff = to_epoch((pd.Timestamp(days[-1]) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")) if days else None
+    parts: list[pd.DataFrame] = []
+    last_archived = None
+    if cutoff is not None and (lo is None or lo < cutoff):
+        mean, activity = StationMean(), StationActivity()
+        arch_end = from_epoch([cutoff - 1 if hi is None else min(hi, cutoff - 1)])[0]
+        for chunk in iter_status_range(None if lo is None else from_epoch([lo])[0], arch_end, engine=eng):
+            mean.update(chunk)
+            activity.update(chunk)
+        arch = mean.result().merge(activity.result(), on="station_id")
+        parts.append(arch.assign(sum_bikes=arch["avg_bikes"] * arch["n_samples"]).drop(columns="avg_bikes"))
+        last_archived = activity.last
+        lo = cutoff if lo is None else max(lo, cutoff)
+    if hi is None or lo is None or lo <= hi or not parts:
+        parts.append(_live_stats(eng, lo, hi, last_archived))
+    df = pd.concat(parts, ignore_index=True)
+    df = df.groupby("station_id", as_index=False)[["sum_bikes", "n_samples", "activity"]].sum()
+    df = df[df["n_samples"] > 0]
+    return pd.DataFrame(
+        {
+            "station_id": df["station_id"].to_numpy(dtype=object),
+            "avg_bikes": (df["sum_bikes"] / df["n_samples"]).to_numpy(),
+            "n_samples": df["n_samples"].astype("int64").to_numpy(),
+            "activity": df["activity"].astype("int64").to_numpy(),
+        }
+    )
+
+
+def _live_stats(eng: Engine, lo: int | None, hi: int | None, last_archived: pd.DataFrame | None) -> pd.DataFrame:
+    params: dict[str, int] = {}
+    where: list[str] = []
+    if lo is not None:
+        where.append("sn.ts_epoch >= :start")
+        params["start"] = lo
+    if hi is not None:
+        where.append("sn.ts_epoch <= :end")
+        params["end"] = hi
+    cond = (" WHERE " + " AND ".join(where)) if where else ""
+    with eng.connect() as conn:
+        n, n_rows, n_stations = conn.execute(
+            text("SELECT COUNT(*), SUM(n_rows), SUM(n_stations) FROM snapshots sn" + cond), params
+        ).one()
+        delta = bool(n) and n_rows != n_stations
+        # Full storage only uses a carry-in to continue from archived days
+        if last_archived is not None:
+            carry = last_archived
+        elif delta and lo is not None:
+            carry = read_carry_in(conn, lo, ("num_bikes_available",))
+        else:
+            carry = None
+        pairs = [] if carry is None else [
+            [s, None if pd.isna(v) else int(v)]
+            for s, v in zip(carry["station_id"].astype(object), carry["num_bikes_available"])
+        ]
+        return pd.read_sql(
+            text(_STATION_STATS_SQL.format(cond=cond, weight=_DELTA_WEIGHT if delta else _FULL_WEIGHT)),
+            conn,
+            params={
+                **params,
+                "carry": json.dumps(pairs),
+                "n": n or 0,
+                "continued": int(last_archived is not None),
+            },
+        )
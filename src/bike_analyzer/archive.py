@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Sequence
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import ARCHIVE_DIR
+from .db import get_engine, init_db, refresh_data_stats
+from .status_store import CARRY_IN_SQL, STATE_COLUMNS, db_size, from_epoch, to_epoch
+
+# station_status columns kept in the archive (the SQLite id is dropped)
+STATUS_COLUMNS = (
+    "station_id",
+    "num_bikes_available",
+    "num_bikes_disabled",
+    "num_docks_available",
+    "num_docks_disabled",
+    "is_installed",
+    "is_renting",
+    "is_returning",
+    "last_reported",
+    "ts_epoch",
+    "vehicles_json",
+)
+_INT_COLUMNS = STATUS_COLUMNS[1:9]
+
+
+def _status_dir() -> Path:
+    return Path(ARCHIVE_DIR) / "station_status"
+
+
+def _partition_path(day: str) -> Path:
+    return _status_dir() / f"day={day}" / "part.parquet"
+
+
+def _local_day(epoch: int) -> str:
+    return from_epoch([epoch])[0].strftime("%Y-%m-%d")
+
+
+def _next_day(day: str) -> str:
+    return (pd.Timestamp(day) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def archived_days() -> list[str]:
+    """Dias (YYYY-MM-DD, data local em TIMEZONE) já movidos para o arquivo Parquet."""
+    root = _status_dir()
+    if not root.exists():
+        return []
+    return sorted(p.parent.name[len("day=") :] for p in root.glob("day=*/part.parquet"))
+
+
+def read_archive(
+    start: int | None = None,
+    end: int | None = None,
+    columns: Sequence[str] = ("num_bikes_available",),
+    days: Sequence[str] | None = None,
+    removed: bool = False,
+) -> pd.DataFrame | None:
+    """Linhas arquivadas entre os epochs ``start`` e ``end``: station_id, ts_epoch e ``columns``.
+
+    Só as partições dos dias do intervalo são abertas, e só as colunas pedidas são lidas;
+    retorna None se nenhuma partição se aplica. Com ``removed`` vem também a coluna
+    booleana ``removed``, que marca as linhas de remoção (estação fora do feed).
+    """
+    table = read_archive_table(start, end, columns, days, removed)
+    return table.to_pandas() if table is not None else None
+
+
+def read_archive_table(
+    start: int | None = None,
+    end: int | None = None,
+    columns: Sequence[str] = ("num_bikes_available",),
+    days: Sequence[str] | None = None,
+    removed: bool = False,
+) -> Any:
+    """Como ``read_archive``, mas devolve a ``pyarrow.Table`` (sem converter para pandas)."""
+    if days is None:
+        days = archived_days()
+    first = _local_day(start) if start is not None else None
+    last = _local_day(end) if end is not None else None
+    days = [d for d in days if (first is None or d >= first) and (last is None or d <= last)]
+    if not days:
+        return None
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset([str(_partition_path(d)) for d in days], format="parquet")
+    cond = None
+    if start is not None:
+        cond = ds.field("ts_epoch") >= start
+    if end is not None:
+        cond = ds.field("ts_epoch") <= end if cond is None else cond & (ds.field("ts_epoch") <= end)
+    projection = {c: ds.field(c) for c in ("station_id", "ts_epoch", *columns)}
+    if removed:
+        # Computed while scanning: the other state columns are not materialized
+        flag = ds.field(STATE_COLUMNS[0]).is_null()
+        for c in STATE_COLUMNS[1:]:
+            flag = flag & ds.field(c).is_null()
+        projection["removed"] = flag
+    return dataset.to_table(columns=projection, filter=cond)
+
+
+def archive_carry_in(start: int, columns: Sequence[str] = ("num_bikes_available",)) -> pd.DataFrame | None:
+    """Último registro arquivado de cada estação antes do epoch ``start``, com a coluna ``removed``.
+
+    Partições de dias em modo delta começam com o estado de todas as estações, então
+    bastam as duas últimas partições até o dia de ``start``. Uma linha de remoção como
+    último registro é mantida, para valer sobre linhas mais antigas de outra fonte.
+    """
+    days = [d for d in archived_days() if d <= _local_day(start)][-2:]
+    if not days:
+        return None
+    df = read_archive(None, start - 1, columns, days, removed=True)
+    if df is None:
+        # `start` is the first instant of the oldest archived day
+        return None
+    return df.sort_values("ts_epoch", kind="stable").drop_duplicates("station_id", keep="last")
+
+
+def _write_partition(day: str, df: pd.DataFrame) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = _partition_path(day)
+    if path.exists():
+        # Late rows for a day that was already archived: merge and rewrite
+        df = pd.concat([pq.read_table(path).to_pandas(), df], ignore_index=True)
+    df = df.astype({**{c: "Int64" for c in _INT_COLUMNS}, "ts_epoch": "int64"})
+    df = df.sort_values(["station_id", "ts_epoch"], kind="stable")
+    # Without the pandas metadata, reads come back as int64/float64 like pd.read_sql
+    table = pa.Table.from_pandas(df[list(STATUS_COLUMNS)], preserve_index=False).replace_schema_metadata()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    tmp.replace(path)
+
+
+def archive_status(keep_days: int = 1, engine: Engine | None = None) -> dict[str, Any]:
+    """Move os dias fechados de station_status para partições Parquet diárias.
+
+    Ficam no SQLite os últimos ``keep_days`` dias (contando o dia da coleta mais recente);
+    o log ``snapshots`` não é tocado. Em dias gravados no modo delta, a partição recebe
+    no primeiro snapshot do dia o estado corrente das estações sem linha nele, para que
+    cada dia seja legível sem consultar os anteriores.
+    """
+    engine = engine or get_engine()
+    init_db(engine)
+    join = "FROM station_status st JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id"
+    with engine.connect() as conn:
+        last = conn.execute(text("SELECT MAX(ts_epoch) FROM snapshots")).scalar()
+        oldest = conn.execute(text(f"SELECT MIN(sn.ts_epoch) {join}")).scalar()
+    if last is None or oldest is None:
+        return {"days": 0, "rows": 0}
+    cutoff = (pd.Timestamp(_local_day(last)) - pd.Timedelta(days=max(keep_days, 1) - 1)).strftime("%Y-%m-%d")
+    bytes_before = db_size(engine)
+    cols = ", ".join(f"st.{c}" for c in STATUS_COLUMNS if c != "ts_epoch")
+    state = [c for c in STATUS_COLUMNS if c not in ("station_id", "ts_epoch")]
+    n_days = n_rows = n_padding = 0
+    day = _local_day(oldest)
+    while day < cutoff:
+        params = {"start": to_epoch(day), "end": to_epoch(_next_day(day))}
+        day_range = "sn.ts_epoch >= :start AND sn.ts_epoch < :end"
+        with engine.connect() as conn:
+            rows = pd.read_sql(text(f"SELECT {cols}, sn.ts_epoch {join} WHERE {day_range}"), conn, params=params)
+            snaps = pd.read_sql(
+                text(f"SELECT ts_epoch, n_stations, n_rows FROM snapshots sn WHERE {day_range} ORDER BY ts_epoch"),
+                conn,
+                params=params,
+            )
+            if rows.empty:
+                day = _next_day(day)
+                continue
+            first = int(snaps["ts_epoch"].iloc[0])
+            is_delta = snaps["n_rows"].sum() != snaps["n_stations"].sum()
+            if is_delta:
+                carry_sql = CARRY_IN_SQL.format(columns=", ".join(state))
+                carry = pd.concat(
+                    [archive_carry_in(first, state), pd.read_sql(text(carry_sql), conn, params={"start": first})]
+                )
+        if is_delta and not carry.empty:
+            carry = carry.sort_values("ts_epoch", kind="stable").drop_duplicates("station_id", keep="last")
+            # Stations that left the feed before the day are not padded back in
+            carry = carry[~carry["removed"].astype(bool)]
+            present = rows.loc[rows["ts_epoch"] == first, "station_id"]
+            pad = carry[~carry["station_id"].isin(present)].assign(ts_epoch=first)
+            rows = pd.concat([pad[list(STATUS_COLUMNS)], rows], ignore_index=True)
+            n_padding += len(pad)
+        _write_partition(day, rows)
+        with engine.begin() as conn:
+            n_rows += conn.execute(
+                text(
+                    "DELETE FROM station_status WHERE snapshot_id IN "
+                    "(SELECT snapshot_id FROM snapshots sn WHERE " + day_range + ")"
+                ),
+                params,
+            ).rowcount
+        n_days += 1
+        day = _next_day(day)
+    if n_days:
+        with engine.begin() as conn:
+            refresh_data_stats(conn)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return {
+        "days": n_days,
+        "rows": n_rows,
+        "padding_rows": n_padding,
+        "bytes_before": bytes_before,
+        "bytes_after": db_size(engine),
+    }
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import requests
+from numpy.typing import ArrayLike
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import BAIRROS_GEOJSON
+from .db import get_engine, init_db
+from .utils import get_stations
+
+# Feature properties tried, in order, for the neighborhood name
+NAME_PROPERTIES = ("bairro", "Bairro", "BAIRRO", "nome", "Nome", "NOME", "NOME_BAIRRO", "name", "Name")
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
+# Written by the old per-station Nominatim loop of the dashboard; imported once into station_bairros
+_LEGACY_CSV = Path("data/station_neighborhoods.csv")
+
+_UPSERT_SQL = text(
+    """
+    INSERT INTO station_bairros (station_id, lat, lon, bairro, source, resolved_at)
+    VALUES (:station_id, :lat, :lon, :bairro, :source, :resolved_at)
+    ON CONFLICT(station_id) DO UPDATE SET
+      lat=excluded.lat,
+      lon=excluded.lon,
+      bairro=excluded.bairro,
+      source=excluded.source,
+      resolved_at=excluded.resolved_at
+    ;
+    """
+)
+
+_memo: dict[str, Boundaries] = {}
+
+
+@dataclass
+class Boundaries:
+    """Limites dos bairros: nome, bounding box e arestas (todos os anéis) de cada feature."""
+
+    source: str  # "geojson:<hash do arquivo>"
+    names: np.ndarray  # object, one per feature
+    bbox: np.ndarray  # float n x 4: min_lon, min_lat, max_lon, max_lat
+    edges: list[np.ndarray]  # per feature, m x 4: lon1, lat1, lon2, lat2
+
+    def locate(self, lats: ArrayLike, lons: ArrayLike) -> np.ndarray:
+        """Índice da feature que contém cada ponto (-1 = nenhuma), com a regra par-ímpar.
+
+        As bounding boxes funcionam como índice espacial: cada feature só testa os pontos
+        dentro da sua caixa, todos de uma vez contra todas as suas arestas.
+        """
+        y = np.asarray(lats, dtype=float)
+        x = np.asarray(lons, dtype=float)
+        out = np.full(len(x), -1, dtype=np.int64)
+        for i, (b, e) in enumerate(zip(self.bbox, self.edges)):
+            cand = np.flatnonzero((out < 0) & (x >= b[0]) & (x <= b[2]) & (y >= b[1]) & (y <= b[3]))
+            if not cand.size:
+                continue
+            px, py = x[cand, None], y[cand, None]
+            x1, y1, x2, y2 = e.T
+            straddles = (y1 > py) != (y2 > py)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cross_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+            inside = (straddles & (px < cross_x)).sum(axis=1) % 2 == 1
+            out[cand[inside]] = i
+        return out
+
+
+def _rings(geometry: dict[str, Any]) -> list[list[list[float]]]:
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "MultiPolygon":
+        return [ring for polygon in geometry["coordinates"] for ring in polygon]
+    return []
+
+
+def _feature_name(props: dict[str, Any]) -> str | None:
+    for key in NAME_PROPERTIES:
+        if props.get(key):
+            return str(props[key])
+    # Otherwise the first text property
+    return next((v for v in props.values() if isinstance(v, str) and v), None)
+
+
+def load_boundaries(path: str | Path = BAIRROS_GEOJSON) -> Boundaries | None:
+    """Lê o GeoJSON de bairros (Polygon/MultiPolygon, lon/lat); None se o arquivo não existe."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    raw = path.read_bytes()
+    source = "geojson:" + hashlib.sha1(raw).hexdigest()[:16]
+    if source in _memo:
+        return _memo[source]
+    names, bbox, edges = [], [], []
+    for feature in json.loads(raw)["features"]:
+        rings = [np.asarray(r, dtype=float)[:, :2] for r in _rings(feature.get("geometry") or {"type": None})]
+        rings = [r for r in rings if len(r) >= 3]
+        if not rings:
+            continue
+        # Each ring closed on itself, so the last vertex pairs with the first
+        e = np.concatenate([np.hstack([r, np.roll(r, -1, axis=0)]) for r in rings])
+        pts = np.concatenate(rings)
+        names.append(_feature_name(feature.get("properties") or {}))
+        bbox.append([pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max()])
+        edges.append(e)
+    boundaries = Boundaries(source, np.asarray(names, dtype=object), np.asarray(bbox, dtype=float).reshape(-1, 4), edges)
+    _memo[source] = boundaries
+    return boundaries
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _import_legacy_csv(engine: Engine) -> int:
+    df = pd.read_csv(_LEGACY_CSV).dropna(subset=["station_id", "lat", "lon"])
+    rows = [
+        {
+            "station_id": str(r.station_id), "lat": float(r.lat), "lon": float(r.lon),
+            "bairro": r.bairro if isinstance(r.bairro, str) else None,
+            "source": "nominatim", "resolved_at": _now_iso(),
+        }
+        for r in df.itertuples(index=False)
+    ]
+    if rows:
+        with engine.begin() as conn:
+            conn.execute(_UPSERT_SQL, rows)
+    return len(rows)
+
+
+def resolve_bairros(
+    stations: pd.DataFrame | None = None,
+    path: str | Path = BAIRROS_GEOJSON,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Bairro de cada estação (station_id, bairro, source), sem rede.
+
+    Os resultados ficam em ``station_bairros`` chaveados nas coordenadas: só estações novas,
+    que mudaram de lugar ou resolvidas com outro arquivo de limites passam pelo teste de
+    ponto-em-polígono (todas numa única passada vetorizada). Sem o GeoJSON, valem os
+    resultados já guardados (por exemplo, do fallback ``geocode_nominatim``).
+    """
+    engine = engine or get_engine()
+    init_db(engine)
+    stations = get_stations(engine) if stations is None else stations
+    boundaries = load_boundaries(path)
+    sql = text("SELECT station_id, lat AS lat_cached, lon AS lon_cached, bairro, source FROM station_bairros")
+    with engine.connect() as conn:
+        cached = pd.read_sql(sql, conn)
+    if cached.empty and _LEGACY_CSV.exists():
+        _import_legacy_csv(engine)
+        with engine.connect() as conn:
+            cached = pd.read_sql(sql, conn)
+    df = stations[["station_id", "lat", "lon"]].merge(cached, on="station_id", how="left")
+    lat, lon = df[["lat", "lat_cached"]].to_numpy(dtype=float).T, df[["lon", "lon_cached"]].to_numpy(dtype=float).T
+    same = np.isclose(*lat) & np.isclose(*lon)
+    moved = pd.Series(~same, index=df.index)
+    stale = moved | (df["source"] != boundaries.source) if boundaries is not None else moved
+    if boundaries is not None and stale.any():
+        idx = boundaries.locate(df.loc[stale, "lat"], df.loc[stale, "lon"])
+        # Outside every polygon: a Nominatim name for the same coordinates is kept
+        keep = (idx < 0) & ~moved[stale].to_numpy() & (df.loc[stale, "source"] == "nominatim").to_numpy()
+        todo = df[stale][~keep]
+        idx = idx[~keep]
+        bairro = np.where(idx >= 0, boundaries.names[np.maximum(idx, 0)], None)
+        df.loc[todo.index, "bairro"] = bairro
+        df.loc[todo.index, "source"] = boundaries.source
+        rows = [
+            {"station_id": s, "lat": float(lat), "lon": float(lon), "bairro": b, "source": boundaries.source,
+             "resolved_at": _now_iso()}
+            for s, lat, lon, b in zip(todo["station_id"], todo["lat"], todo["lon"], bairro)
+        ]
+        if rows:
+            with engine.begin() as conn:
+                conn.execute(_UPSERT_SQL, rows)
+    elif boundaries is None:
+        # A cached name no longer applies once the station moved
+        df.loc[moved, ["bairro", "source"]] = None
+    return df[["station_id", "bairro", "source"]].reset_index(drop=True)
+
+
+def _reverse_geocode(session: requests.Session, lat: float, lon: float) -> str | None:
+    r = session.get(
+        NOMINATIM_URL,
+        params={"format": "jsonv2", "lat": lat, "lon": lon, "accept-language": "pt-BR", "zoom": 14},
+        timeout=20,
+    )
+    r.raise_for_status()
+    addr = r.json().get("address", {})
+    return (
+        addr.get("neighbourhood")
+        or addr.get("suburb")
+        or addr.get("city_district")
+        or addr.get("quarter")
+        or addr.get("residential")
+        or None
+    )
+
+
+def geocode_nominatim(
+    stations: pd.DataFrame | None = None,
+    engine: Engine | None = None,
+    session: requests.Session | None = None,
+    pause: float = 1.0,
+    path: str | Path = BAIRROS_GEOJSON,
+) -> int:
+    """Fallback online: consulta o Nominatim (1 req/s) só para as estações ainda sem bairro.
+
+    Os nomes vão para ``station_bairros`` com ``source = 'nominatim'``; retorna quantas
+    estações foram consultadas.
+    """
+    engine = engine or get_engine()
+    stations = get_stations(engine) if stations is None else stations
+    resolved = resolve_bairros(stations, path, engine)
+    missing = stations[stations["station_id"].isin(resolved.loc[resolved["bairro"].isna(), "station_id"])]
+    session = session or requests.Session()
+    session.headers.setdefault("User-Agent", "bike-analyzer/0.1 (educational)")
+    n = 0
+    for row in missing.itertuples(index=False):
+        try:
+            bairro = _reverse_geocode(session, row.lat, row.lon)
+        except (requests.RequestException, ValueError):
+            bairro = None
+        with engine.begin() as conn:
+            conn.execute(
+                _UPSERT_SQL,
+                {"station_id": row.station_id, "lat": float(row.lat), "lon": float(row.lon), "bairro": bairro,
+                 "source": "nominatim", "resolved_at": _now_iso()},
+            )
+        n += 1
+        time.sleep(pause)  # Nominatim usage policy: at most 1 request per second
+    return n
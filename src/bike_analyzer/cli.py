@@ -2,26 +2,161 @@ from __future__ import annotations
 
 import argparse
 import json
+import sys
 
-from .db import init_db
-from .etl_gbfs import ingest_once
-from .etl_weather import fetch_weather, load_weather_hourly
+import numpy as np
+from sqlalchemy import create_engine
+
+from .archive import archive_status
+from .bairros import geocode_nominatim, resolve_bairros
+from .config import (
+    GBFS_AUTO_DISCOVERY_URL,
+    KEYFRAME_EVERY_MIN,
+    SYSTEMS_BATCH_WINDOW_S,
+    SYSTEMS_MAX_CONCURRENCY,
+    SYSTEMS_PER_HOST,
+)
+from .db import get_data_stats, get_engine, init_db, refresh_data_stats
+from .etl_gbfs import GbfsClient, ingest_once, replay_archive
+from .etl_weather import fetch_weather, load_weather_hourly, sync_weather
+from .features import FEATURE_COLUMNS, feature_matrix, get_station_features
+from .ingest_loop import ingest_loop
+from .metrics import bind, get_metrics, profiled
+from .multi_ingest import ingest_systems
+from .geo import get_station_geometry
+from .od_inference import MATCHERS
+from .od_store import materialize_od
+from .rollups import rebuild_rollups
+from .status_store import compact_status
+from .streaming import FlowTotals, StationActivity, StationMean
+from .systems import System, add_system, get_systems, set_system_enabled
+from .time_travel import build_keyframes, state_at
+from .utils import get_stations, iter_status_range
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(prog="bike-analyzer")
+    parser.add_argument(
+        "--profile", default=None, metavar="ARQUIVO",
+        help="Roda o comando sob cProfile: grava as estatísticas no arquivo e imprime o resumo em stderr",
+    )
     sub = parser.add_subparsers(dest="cmd", required=True)
 
     sub.add_parser("init-db")
     sub.add_parser("ingest-stations")
     sub.add_parser("ingest-status")
+    sub.add_parser("compact-status", help="Migra station_status para o modo delta (só mudanças)")
+    p_i = sub.add_parser("info", help="Contagens e primeira/última coleta, lidas de data_stats")
+    p_i.add_argument("--refresh", action="store_true", help="Recalcula as contagens a partir das tabelas")
+    p_a = sub.add_parser("archive", help="Move dias fechados de station_status para Parquet (data/archive)")
+    p_a.add_argument("--keep-days", type=int, default=1, help="Dias mais recentes mantidos no SQLite")
+
+    p_p = sub.add_parser("replay", help="Recarrega os payloads GBFS brutos (data/raw) numa base, sem rede")
+    p_p.add_argument("--start", default=None, help="Primeiro dia (YYYY-MM-DD)")
+    p_p.add_argument("--end", default=None, help="Último dia (YYYY-MM-DD)")
+    p_p.add_argument("--db", default=None, help="Arquivo SQLite de destino (padrão: DATABASE_URL)")
+    p_p.add_argument("--workers", type=int, default=0, help="Processos que descompactam/interpretam os dias")
+    p_p.add_argument("--mode", choices=["full", "delta"], default=None, help="Armazenamento (padrão: STATUS_STORAGE)")
+
+    p_b = sub.add_parser("resolve-bairros", help="Atribui o bairro de cada estação a partir do GeoJSON local")
+    p_b.add_argument("--geojson", default=None, help="Arquivo de limites (padrão: BAIRROS_GEOJSON)")
+    p_b.add_argument("--nominatim", action="store_true", help="Completa as estações sem bairro pelo Nominatim (online)")
+
+    p_k = sub.add_parser("keyframes", help="Grava os keyframes do estado da rede que faltam no histórico")
+    p_k.add_argument("--every-min", type=float, default=KEYFRAME_EVERY_MIN, help="Intervalo entre keyframes (min)")
+    p_k.add_argument("--rebuild", action="store_true", help="Apaga e refaz todos os keyframes")
+    p_s = sub.add_parser("state-at", help="Estado de todas as estações num instante (keyframe + mudanças)")
+    p_s.add_argument("when", help="Instante (ISO, mesmo formato de scraped_at)")
+
+    p_f = sub.add_parser("features", help="Tabela estação x hora com clima alinhado (station_features)")
+    p_f.add_argument("--start", default=None, help="Início (ISO, mesmo formato de scraped_at)")
+    p_f.add_argument("--end", default=None, help="Fim (ISO, mesmo formato de scraped_at)")
+    p_f.add_argument("--station", nargs="+", default=None, help="Só estas estações")
+    p_f.add_argument("--hour-of-day", type=int, nargs="+", default=None, help="Só estas horas do dia (0-23)")
+    p_f.add_argument("--weathercode", type=int, nargs="+", default=None, help="Só estes códigos WMO de tempo")
+    p_f.add_argument("--out", default=None, help="Grava em .parquet, .csv ou .npz (matriz FEATURE_COLUMNS)")
+    p_f.add_argument("--top", type=int, default=20, help="Quantas linhas imprimir sem --out (0 = todas)")
+
+    p_t = sub.add_parser("stats", help="Tempo, volume e espera de lock por etapa (tabela perf_metrics)")
+    p_t.add_argument("--hours", type=float, default=24.0, help="Janela em horas")
+    p_t.add_argument("--stage", default=None, help="Só etapas com este prefixo (ex: gbfs.)")
+
+    p_r = sub.add_parser("rebuild-rollups", help="Recalcula station_hourly/station_daily a partir do histórico")
+    p_r.add_argument("--chunk-days", type=float, default=7.0, help="Tamanho dos blocos de recomputação")
+
+    p_w = sub.add_parser("ingest-weather", help="Completa weather_hourly, baixando só as horas que faltam")
+    p_w.add_argument("--start", default=None, help="Data inicial (YYYY-MM-DD) ou relativo, ex: -2d (padrão: 1ª coleta)")
+    p_w.add_argument("--end", default=None, help="Data final (YYYY-MM-DD) ou relativo, ex: +2d (padrão: última coleta)")
+    p_w.add_argument("--chunk-days", type=int, default=31, help="Dias por requisição")
+    p_w.add_argument("--workers", type=int, default=4, help="Requisições simultâneas")
+    p_w.add_argument("--full", action="store_true", help="Baixa e regrava o intervalo inteiro (exige --start/--end)")
 
-    p_w = sub.add_parser("ingest-weather")
-    p_w.add_argument("--start", default="-2d", help="Data inicial (YYYY-MM-DD) ou relativo, ex: -2d")
-    p_w.add_argument("--end", default="+2d", help="Data final (YYYY-MM-DD) ou relativo, ex: +2d")
+    p_l = sub.add_parser("ingest-loop", help="Coleta contínua respeitando o ttl dos feeds GBFS")
+    p_l.add_argument("--url", default=GBFS_AUTO_DISCOVERY_URL, help="URL do gbfs.json (auto-discovery)")
+    p_l.add_argument("--min-interval", type=float, default=10.0, help="Intervalo mínimo entre polls (s)")
+    p_l.add_argument("--max-interval", type=float, default=300.0, help="Intervalo máximo entre polls (s)")
+    p_l.add_argument("--max-backoff", type=float, default=600.0, help="Espera máxima após falhas (s)")
+    p_l.add_argument("--iterations", type=int, default=None, help="Para após N ciclos (padrão: infinito)")
+    p_l.add_argument(
+        "--materialize-od", type=int, nargs="*", default=[], metavar="MIN",
+        help="Janelas OD (min) a estender em od_flows após cada snapshot",
+    )
+    p_l.add_argument("--od-matcher", choices=sorted(MATCHERS), default="optimal")
+
+    p_sy = sub.add_parser("systems", help="Lista os sistemas GBFS registrados")
+    p_sy.add_argument("--all", action="store_true", help="Inclui os desabilitados")
+    p_sa = sub.add_parser("add-system", help="Registra (ou atualiza) um sistema GBFS para o ingest-systems")
+    p_sa.add_argument("system_id", help="Identificador curto, prefixo dos station_id do sistema")
+    p_sa.add_argument("url", help="URL do gbfs.json (auto-discovery)")
+    p_sa.add_argument("--name", default=None)
+    p_sa.add_argument("--min-interval", type=float, default=10.0, help="Intervalo mínimo entre polls (s)")
+    p_sa.add_argument("--max-interval", type=float, default=300.0, help="Intervalo máximo entre polls (s)")
+    for cmd, help_ in (("enable-system", "Volta a coletar um sistema"), ("disable-system", "Para de coletar um sistema (mantém os dados)")):
+        sub.add_parser(cmd, help=help_).add_argument("system_id")
+
+    p_ms = sub.add_parser("ingest-systems", help="Coleta contínua e simultânea de todos os sistemas habilitados")
+    p_ms.add_argument("--systems", nargs="+", default=None, metavar="ID", help="Só estes sistemas (padrão: todos)")
+    p_ms.add_argument("--max-concurrency", type=int, default=SYSTEMS_MAX_CONCURRENCY, help="Requisições simultâneas")
+    p_ms.add_argument("--per-host", type=int, default=SYSTEMS_PER_HOST, help="Requisições simultâneas por host")
+    p_ms.add_argument(
+        "--batch-window", type=float, default=SYSTEMS_BATCH_WINDOW_S, help="Janela (s) que junta coletas num snapshot"
+    )
+    p_ms.add_argument("--mode", choices=["full", "delta"], default=None, help="Armazenamento (padrão: STATUS_STORAGE)")
+    p_ms.add_argument("--max-backoff", type=float, default=600.0, help="Espera máxima após falhas (s)")
+    p_ms.add_argument("--iterations", type=int, default=None, help="Para após N ciclos por sistema (padrão: infinito)")
+    p_ms.add_argument("--duration", type=float, default=None, help="Para após N segundos (padrão: infinito)")
+
+    p_m = sub.add_parser("materialize-od", help="Estende (ou reconstrói) a tabela od_flows")
+    p_m.add_argument("--bucket", type=int, nargs="+", default=[10], help="Janelas em minutos")
+    p_m.add_argument("--matcher", choices=sorted(MATCHERS), default="optimal")
+    p_m.add_argument("--backfill", action="store_true", help="Apaga e reconstrói todo o histórico")
+    p_m.add_argument("--chunk-days", type=float, default=7.0, help="Tamanho dos blocos de recomputação")
+
+    p_od = sub.add_parser("od", help="Estima fluxos origem-destino no intervalo")
+    p_od.add_argument("--start", default=None, help="Início (ISO, mesmo formato de scraped_at)")
+    p_od.add_argument("--end", default=None, help="Fim (ISO, mesmo formato de scraped_at)")
+    p_od.add_argument("--bucket", type=int, default=10, help="Janela em minutos")
+    p_od.add_argument("--matcher", choices=sorted(MATCHERS), default="optimal")
+    p_od.add_argument("--workers", type=int, default=1, help="Processos para o matching por janela")
+    p_od.add_argument("--top", type=int, default=50, help="Quantos fluxos imprimir (0 = todos)")
+    p_od.add_argument("--chunk-snapshots", type=int, default=288, help="Coletas lidas por bloco")
+
+    p_u = sub.add_parser("station-usage", help="Média de bikes e proxy de uso por estação, lendo em blocos")
+    p_u.add_argument("--start", default=None, help="Início (ISO, mesmo formato de scraped_at)")
+    p_u.add_argument("--end", default=None, help="Fim (ISO, mesmo formato de scraped_at)")
+    p_u.add_argument("--top", type=int, default=20, help="Quantas estações imprimir (0 = todas)")
+    p_u.add_argument("--chunk-snapshots", type=int, default=288, help="Coletas lidas por bloco")
 
     args = parser.parse_args()
+    if args.profile:
+        with profiled(args.profile) as report:
+            _run(args)
+        print(report.getvalue(), file=sys.stderr)
+        return
+    _run(args)
+
 
+def _run(args: argparse.Namespace) -> None:
     if args.cmd == "init-db":
         init_db()
         print("ok")
@@ -32,10 +167,178 @@ def main() -> None:
         print(json.dumps(res))
         return
 
+    if args.cmd == "compact-status":
+        print(json.dumps(compact_status()))
+        return
+
+    if args.cmd == "info":
+        engine = get_engine()
+        init_db(engine)
+        if args.refresh:
+            with engine.begin() as conn:
+                refresh_data_stats(conn)
+        print(json.dumps(get_data_stats(engine)))
+        return
+
+    if args.cmd == "archive":
+        print(json.dumps(archive_status(args.keep_days)))
+        return
+
+    if args.cmd == "replay":
+        engine = create_engine(f"sqlite:///{args.db}", future=True) if args.db else get_engine()
+        bind(engine)
+        print(json.dumps(replay_archive(args.start, args.end, engine, args.workers, args.mode)))
+        return
+
+    if args.cmd == "resolve-bairros":
+        kwargs = {"path": args.geojson} if args.geojson else {}
+        res = resolve_bairros(**kwargs)
+        out = {"stations": len(res), "resolved": int(res["bairro"].notna().sum())}
+        if args.nominatim:
+            out["nominatim_queries"] = geocode_nominatim(**kwargs)
+            out["resolved"] = int(resolve_bairros(**kwargs)["bairro"].notna().sum())
+        print(json.dumps(out))
+        return
+
+    if args.cmd == "keyframes":
+        print(json.dumps(build_keyframes(args.every_min, rebuild=args.rebuild)))
+        return
+
+    if args.cmd == "state-at":
+        state = state_at(args.when)
+        print(json.dumps({"stations": state.astype(object).where(state.notna(), None).to_dict(orient="records")}))
+        return
+
+    if args.cmd == "features":
+        df = get_station_features(args.start, args.end, args.station, args.hour_of_day, args.weathercode)
+        if args.out:
+            if args.out.endswith(".npz"):
+                np.savez_compressed(
+                    args.out, X=feature_matrix(df), columns=np.array(FEATURE_COLUMNS),
+                    station_id=df["station_id"].to_numpy(dtype=str), hour=df["hour"].to_numpy(dtype=str),
+                )
+            elif args.out.endswith(".csv"):
+                df.to_csv(args.out, index=False)
+            else:
+                df.to_parquet(args.out, index=False)
+            print(json.dumps({"rows": len(df), "out": args.out}))
+            return
+        if args.top:
+            df = df.head(args.top)
+        print(json.dumps({"rows": df.astype(object).where(df.notna(), None).to_dict(orient="records")}))
+        return
+
+    if args.cmd == "stats":
+        engine = get_engine()
+        init_db(engine)
+        df = get_metrics(args.hours, engine)
+        if args.stage:
+            df = df[df["stage"].str.startswith(args.stage)]
+        print(json.dumps({"hours": args.hours, "stages": df.astype(object).where(df.notna(), None).to_dict(orient="records")}))
+        return
+
+    if args.cmd == "rebuild-rollups":
+        print(json.dumps(rebuild_rollups(args.chunk_days)))
+        return
+
+    if args.cmd == "ingest-loop":
+        init_db()
+        with GbfsClient(args.url) as client:
+            try:
+                for event in ingest_loop(
+                    client,
+                    min_interval=args.min_interval,
+                    max_interval=args.max_interval,
+                    max_backoff=args.max_backoff,
+                    iterations=args.iterations,
+                ):
+                    if event.get("snapshot"):
+                        event["od"] = {b: materialize_od(b, args.od_matcher) for b in args.materialize_od}
+                    print(json.dumps(event), flush=True)
+            except KeyboardInterrupt:
+                pass
+        return
+
+    if args.cmd == "systems":
+        print(json.dumps([vars(s) for s in get_systems(enabled_only=not args.all)]))
+        return
+
+    if args.cmd == "add-system":
+        try:
+            add_system(System(args.system_id, args.url, args.name, args.min_interval, args.max_interval))
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print("ok")
+        return
+
+    if args.cmd in {"enable-system", "disable-system"}:
+        if not set_system_enabled(args.system_id, args.cmd == "enable-system"):
+            raise SystemExit(f"Sistema não registrado: {args.system_id}")
+        print("ok")
+        return
+
+    if args.cmd == "ingest-systems":
+        engine = get_engine()
+        bind(engine)
+        try:
+            res = ingest_systems(
+                args.systems,
+                engine,
+                args.duration,
+                mode=args.mode,
+                max_concurrency=args.max_concurrency,
+                per_host=args.per_host,
+                batch_window=args.batch_window,
+                max_backoff=args.max_backoff,
+                iterations=args.iterations,
+                on_event=lambda event: print(json.dumps(event), flush=True),
+            )
+        except ValueError as e:
+            raise SystemExit(str(e))
+        except KeyboardInterrupt:
+            return
+        print(json.dumps(res))
+        return
+
+    if args.cmd == "materialize-od":
+        init_db()
+        res = {
+            b: materialize_od(b, args.matcher, backfill=args.backfill, chunk_days=args.chunk_days)
+            for b in args.bucket
+        }
+        print(json.dumps(res))
+        return
+
+    if args.cmd == "od":
+        # Streamed: memory is bounded by the chunk, not by the length of the range
+        totals = FlowTotals(get_station_geometry(get_stations()), f"{args.bucket}min", args.matcher, args.workers)
+        for chunk in iter_status_range(args.start, args.end, chunk_snapshots=args.chunk_snapshots):
+            totals.update(chunk)
+        flows = totals.result().sort_values("count", ascending=False)
+        if args.top:
+            flows = flows.head(args.top)
+        print(json.dumps({"flows": flows.to_dict(orient="records")}))
+        return
+
+    if args.cmd == "station-usage":
+        mean, activity = StationMean(), StationActivity()
+        for chunk in iter_status_range(args.start, args.end, chunk_snapshots=args.chunk_snapshots):
+            mean.update(chunk)
+            activity.update(chunk)
+        usage = mean.result().merge(activity.result(), on="station_id").sort_values("activity", ascending=False)
+        if args.top:
+            usage = usage.head(args.top)
+        print(json.dumps({"stations": usage.to_dict(orient="records")}))
+        return
+
     if args.cmd == "ingest-weather":
-        payload = fetch_weather(args.start, args.end)
-        n = load_weather_hourly(payload)
-        print(json.dumps({"rows": n}))
+        if args.full:
+            if not (args.start and args.end):
+                raise SystemExit("--full exige --start e --end")
+            init_db()
+            print(json.dumps({"rows": load_weather_hourly(fetch_weather(args.start, args.end))}))
+            return
+        print(json.dumps(sync_weather(args.start, args.end, chunk_days=args.chunk_days, workers=args.workers)))
         return
 
 
@@ -2,8 +2,36 @@ from __future__ import annotations
 
 CITY_NAME = "Porto Alegre"
 GBFS_AUTO_DISCOVERY_URL = "https://portoalegre.publicbikesystem.net/customer/gbfs/v2/gbfs.json"
+# system_id do sistema de GBFS_AUTO_DISCOVERY_URL (mesmo valor do DEFAULT em sql/schema.sql)
+DEFAULT_SYSTEM_ID = "bikepoa"
 DATABASE_URL = "sqlite:///data/bikepoa.sqlite"
+CACHE_DIR = "data/cache"
+# geo.get_station_geometry: geometrias (conjuntos de estações distintos) mantidas em memória por processo
+GEO_MEMO_SIZE = 4
+# Partições Parquet diárias de station_status (comando `archive`)
+ARCHIVE_DIR = "data/archive"
+# Payloads GBFS brutos, um gzip JSONL por dia (comando `replay`); vazio desativa a gravação
+RAW_ARCHIVE_DIR = "data/raw"
 TIMEZONE = "America/Sao_Paulo"
+# "full": uma linha por estação a cada coleta; "delta": só grava estações cujo estado mudou
+STATUS_STORAGE = "full"
+# Rollups horários/diários: intervalo máximo (min) entre coletas contado como tempo vazia/cheia
+ROLLUP_MAX_GAP_MIN = 15.0
+# Limites dos bairros (GeoJSON com Polygon/MultiPolygon) para o resolvedor offline de bairros
+BAIRROS_GEOJSON = "data/bairros_poa.geojson"
+# Orçamento de memória (MB) do cache de intervalos do dashboard (range_cache.RangeCache)
+RANGE_CACHE_MB = 512
+# Intervalo (min) entre keyframes do estado da rede (time_travel.state_at reaplica no máximo isso de histórico)
+KEYFRAME_EVERY_MIN = 60
+# station_features: clima alinhado à última hora de weather_hourly até este atraso (h); mais antigo fica nulo
+FEATURES_WEATHER_MAX_LAG_H = 3
+# Instrumentação (metrics.stage): totais por etapa gravados em perf_metrics no máximo a cada METRICS_FLUSH_S
+METRICS_ENABLED = True
+METRICS_FLUSH_S = 60.0
+# ingest-systems: requisições HTTP simultâneas (total e por host) e janela (s) que junta coletas num snapshot
+SYSTEMS_MAX_CONCURRENCY = 16
+SYSTEMS_PER_HOST = 4
+SYSTEMS_BATCH_WINDOW_S = 1.0
 CITY_LAT = -30.0346
 CITY_LON = -51.2177
 
@@ -1,10 +1,35 @@
 from __future__ import annotations
 
 from pathlib import Path
+from typing import Any
+
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
+
+from .config import CITY_NAME, DATABASE_URL, DEFAULT_SYSTEM_ID, GBFS_AUTO_DISCOVERY_URL
 
-from .config import DATABASE_URL
+# Recount of data_stats from the tables themselves; the last_ingest_* fields are kept
+_REFRESH_DATA_STATS_SQL = text(
+    """
+    INSERT INTO data_stats (id, n_stations, n_snapshots, n_status_rows, first_ts_epoch, last_ts_epoch, last_snapshot_id)
+    SELECT
+      1,
+      (SELECT COUNT(*) FROM stations),
+      (SELECT COUNT(*) FROM snapshots),
+      (SELECT COUNT(*) FROM station_status),
+      (SELECT MIN(ts_epoch) FROM snapshots),
+      (SELECT MAX(ts_epoch) FROM snapshots),
+      (SELECT snapshot_id FROM snapshots ORDER BY ts_epoch DESC LIMIT 1)
+    WHERE true
+    ON CONFLICT(id) DO UPDATE SET
+      n_stations = excluded.n_stations,
+      n_snapshots = excluded.n_snapshots,
+      n_status_rows = excluded.n_status_rows,
+      first_ts_epoch = excluded.first_ts_epoch,
+      last_ts_epoch = excluded.last_ts_epoch,
+      last_snapshot_id = excluded.last_snapshot_id
+    """
+)
 
 
 def get_engine() -> Engine:
@@ -19,7 +44,153 @@ def init_db(engine: Engine | None = None) -> None:
     with open(schema_path, "r", encoding="utf-8") as f:
         schema_sql = f.read()
     with engine.begin() as conn:
+        legacy = _prepare_epoch_migration(conn)
+        _add_missing_columns(conn)
         for stmt in schema_sql.split(";\n"):
             s = stmt.strip()
             if s:
                 conn.execute(text(s))
+        if legacy:
+            _migrate_legacy_status(conn)
+        _backfill_status_logs(conn)
+        _seed_systems(conn)
+        if legacy or conn.execute(text("SELECT 1 FROM data_stats")).first() is None:
+            refresh_data_stats(conn)
+    if legacy:
+        # The legacy table was dropped; give the space back
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+
+
+def _columns(conn: Connection, table: str) -> set[str]:
+    return {r[1] for r in conn.execute(text(f"PRAGMA table_info({table})"))}
+
+
+# Columns added to existing tables after their creation: (table, column, definition)
+_ADDED_COLUMNS = (
+    # Older rows keep NULL (unknown): the weather sync treats them as forecasts and fetches them once more
+    ("weather_hourly", "is_forecast", "INTEGER"),
+    # Everything stored before the systems registry belongs to the default system
+    ("stations", "system_id", f"TEXT NOT NULL DEFAULT '{DEFAULT_SYSTEM_ID}'"),
+    ("station_status", "system_id", f"TEXT NOT NULL DEFAULT '{DEFAULT_SYSTEM_ID}'"),
+)
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    for table, column, definition in _ADDED_COLUMNS:
+        existing = _columns(conn, table)
+        if existing and column not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+
+
+def _seed_systems(conn: Connection) -> None:
+    conn.execute(
+        text("INSERT OR IGNORE INTO systems (system_id, name, auto_discovery_url) VALUES (:s, :name, :url)"),
+        {"s": DEFAULT_SYSTEM_ID, "name": CITY_NAME, "url": GBFS_AUTO_DISCOVERY_URL},
+    )
+    # Snapshots written before snapshot_systems existed all came from the default system
+    if conn.execute(text("SELECT 1 FROM snapshot_systems LIMIT 1")).first() is None:
+        conn.execute(
+            text(
+                "INSERT INTO snapshot_systems (system_id, ts_epoch, snapshot_id) "
+                "SELECT :s, ts_epoch, MIN(snapshot_id) FROM snapshots WHERE ts_epoch IS NOT NULL GROUP BY ts_epoch"
+            ),
+            {"s": DEFAULT_SYSTEM_ID},
+        )
+
+
+def _prepare_epoch_migration(conn: Connection) -> bool:
+    # Bases anteriores ao snapshot_id: station_status com scraped_at TEXT em cada linha.
+    # A tabela antiga é renomeada para o schema criar a nova; os dados são copiados depois.
+    if "ts_epoch" not in _columns(conn, "snapshots") and _columns(conn, "snapshots"):
+        conn.execute(text("ALTER TABLE snapshots ADD COLUMN ts_epoch INTEGER"))
+    if "scraped_at" not in _columns(conn, "station_status"):
+        return False
+    conn.execute(text("DROP INDEX IF EXISTS idx_station_status_station_time"))
+    conn.execute(text("ALTER TABLE station_status RENAME TO station_status_legacy"))
+    return True
+
+
+def _migrate_legacy_status(conn: Connection) -> None:
+    conn.execute(
+        text(
+            """
+            INSERT INTO snapshots (scraped_at, n_stations, n_rows)
+            SELECT scraped_at, COUNT(*), COUNT(*)
+            FROM station_status_legacy
+            WHERE true
+            GROUP BY scraped_at
+            ORDER BY scraped_at
+            ON CONFLICT(scraped_at) DO NOTHING
+            """
+        )
+    )
+    conn.execute(
+        text("UPDATE snapshots SET ts_epoch = CAST(strftime('%s', scraped_at) AS INTEGER) WHERE ts_epoch IS NULL")
+    )
+    conn.execute(
+        text(
+            """
+            INSERT INTO station_status (
+              id, station_id, num_bikes_available, num_bikes_disabled, num_docks_available,
+              num_docks_disabled, is_installed, is_renting, is_returning, last_reported,
+              snapshot_id, vehicles_json
+            )
+            SELECT l.id, l.station_id, l.num_bikes_available, l.num_bikes_disabled, l.num_docks_available,
+                   l.num_docks_disabled, l.is_installed, l.is_renting, l.is_returning, l.last_reported,
+                   s.snapshot_id, l.vehicles_json
+            FROM station_status_legacy l
+            JOIN snapshots s ON s.scraped_at = l.scraped_at
+            ORDER BY l.id
+            """
+        )
+    )
+    conn.execute(text("DROP TABLE station_status_legacy"))
+
+
+def _backfill_status_logs(conn: Connection) -> None:
+    # Snapshots gravados antes de ts_epoch existir
+    conn.execute(
+        text("UPDATE snapshots SET ts_epoch = CAST(strftime('%s', scraped_at) AS INTEGER) WHERE ts_epoch IS NULL")
+    )
+    if conn.execute(text("SELECT 1 FROM station_status_latest LIMIT 1")).first() is None:
+        conn.execute(
+            text(
+                """
+                INSERT INTO station_status_latest (
+                  station_id, num_bikes_available, num_bikes_disabled, num_docks_available,
+                  num_docks_disabled, is_installed, is_renting, is_returning, scraped_at
+                )
+                SELECT station_id, num_bikes_available, num_bikes_disabled, num_docks_available,
+                       num_docks_disabled, is_installed, is_renting, is_returning, scraped_at
+                FROM (
+                  SELECT st.*, sn.scraped_at,
+                         ROW_NUMBER() OVER (PARTITION BY st.station_id ORDER BY sn.ts_epoch DESC, st.id DESC) AS rn
+                  FROM station_status st
+                  JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id
+                )
+                WHERE rn = 1
+                """
+            )
+        )
+
+
+def refresh_data_stats(conn: Connection) -> None:
+    """Recalcula as contagens de data_stats a partir das tabelas (na transação de ``conn``)."""
+    conn.execute(_REFRESH_DATA_STATS_SQL)
+
+
+def get_data_stats(engine: Engine | None = None) -> dict[str, Any]:
+    """Contagens e marcas d'água de data_stats, lidas em O(1) (zeros se o banco ainda não existe)."""
+    engine = engine or get_engine()
+    empty: dict[str, Any] = {"n_stations": 0, "n_snapshots": 0, "n_status_rows": 0}
+    with engine.connect() as conn:
+        if "id" not in _columns(conn, "data_stats"):
+            return empty
+        row = conn.execute(text("SELECT * FROM data_stats WHERE id = 1")).mappings().first()
+    if row is None:
+        # Written by ingest/init_db; a database filled by other means is counted once here
+        with engine.begin() as conn:
+            refresh_data_stats(conn)
+            row = conn.execute(text("SELECT * FROM data_stats WHERE id = 1")).mappings().first()
+    return {k: v for k, v in dict(row).items() if k != "id"}
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+FINEST_MIN = 5
+
+
+@dataclass
+class DeltaCube:
+    """Deltas de bikes por estação na resolução mais fina (janelas de ``finest_min`` minutos).
+
+    ``net[b, s]`` é a variação líquida da estação ``s`` na janela ``b`` (último valor na
+    janela menos o último valor antes dela); ``gross[b, s]`` é a soma das variações
+    absolutas entre coletas consecutivas. Como as diferenças se telescopam, qualquer
+    janela múltipla de ``finest_min`` é só uma soma de linhas consecutivas.
+    """
+
+    station_ids: np.ndarray  # sorted
+    t0: int  # epoch seconds of row 0 (aligned to finest_min)
+    finest_min: int
+    net: np.ndarray  # int16/int32, n_buckets x n_stations
+    gross: np.ndarray  # int16/int32, n_buckets x n_stations
+    first_seen: np.ndarray  # int64 epoch seconds of each station's first row
+    tz: str | None = None
+
+    @classmethod
+    def from_status(cls, status_df: pd.DataFrame, finest_min: int = FINEST_MIN) -> DeltaCube:
+        # status_df: station_id, scraped_at (datetime64 or ISO), num_bikes_available; the compact
+        # frame (categorical ids, datetime64[s], int16 counts) is read in place. As in
+        # bucket_deltas, rows with a missing count are not readings
+        valid = status_df["num_bikes_available"].notna().to_numpy()
+        if not valid.all():
+            status_df = status_df[valid]
+        ts = pd.to_datetime(status_df["scraped_at"])
+        tz = str(ts.dt.tz) if ts.dt.tz is not None else None
+        epoch = ts.dt.as_unit("s").array.asi8
+        codes, ids = pd.factorize(status_df["station_id"], sort=True)
+        n = status_df["num_bikes_available"].to_numpy(dtype=np.int64)
+        step = finest_min * 60
+        if len(n) == 0:
+            empty = np.zeros((0, len(ids)), dtype=np.int16)
+            return cls(np.asarray(ids, dtype=object), 0, finest_min, empty, empty.copy(), np.zeros(0, np.int64), tz)
+
+        order = np.lexsort((epoch, codes))
+        codes, epoch, n = codes[order], epoch[order], n[order]
+        d = np.diff(n, prepend=n[0])
+        first = np.r_[True, codes[1:] != codes[:-1]]
+        d[first] = 0  # first appearance of a station
+
+        t0 = int(epoch.min() // step * step)
+        b = (epoch - t0) // step
+        shape = (int(b.max()) + 1, len(ids))
+        flat = b * shape[1] + codes
+        net = np.bincount(flat, weights=d, minlength=shape[0] * shape[1]).reshape(shape)
+        gross = np.bincount(flat, weights=np.abs(d), minlength=shape[0] * shape[1]).reshape(shape)
+        dtype = np.int16 if max(np.abs(net).max(), gross.max()) < np.iinfo(np.int16).max else np.int32
+        return cls(
+            np.asarray(ids, dtype=object), t0, finest_min, net.astype(dtype), gross.astype(dtype), epoch[first], tz
+        )
+
+    def extend(self, status_df: pd.DataFrame) -> DeltaCube:
+        """Cubo acrescido de coletas mais novas, sem refazer as janelas já cobertas.
+
+        ``status_df`` traz as linhas novas precedidas da última linha já coberta de cada
+        estação: essa âncora não gera delta, só serve de base para o primeiro delta novo.
+        """
+        inc = DeltaCube.from_status(status_df, self.finest_min)
+        if inc.n_buckets == 0:
+            return self
+        if self.n_buckets == 0:
+            return inc
+        step = self.finest_min * 60
+        ids = np.union1d(self.station_ids, inc.station_ids).astype(object)
+        t0 = min(self.t0, inc.t0)
+        stop = max(self.t0 + self.n_buckets * step, inc.t0 + inc.n_buckets * step)
+        net = np.zeros(((stop - t0) // step, len(ids)), dtype=np.int32)
+        gross = np.zeros_like(net)
+        first_seen = np.zeros(len(ids), dtype=np.int64)
+        # The anchor bucket gets contributions from both cubes; stations already covered keep first_seen
+        for cube in (inc, self):
+            r0 = (cube.t0 - t0) // step
+            cols = np.searchsorted(ids, cube.station_ids)
+            net[r0 : r0 + cube.n_buckets][:, cols] += cube.net
+            gross[r0 : r0 + cube.n_buckets][:, cols] += cube.gross
+            first_seen[cols] = cube.first_seen
+        dtype = np.int16 if max(np.abs(net).max(), gross.max()) < np.iinfo(np.int16).max else np.int32
+        return DeltaCube(ids, t0, self.finest_min, net.astype(dtype), gross.astype(dtype), first_seen, self.tz or inc.tz)
+
+    @property
+    def n_buckets(self) -> int:
+        return self.net.shape[0]
+
+    def bucket_starts(self) -> np.ndarray:
+        return self.t0 + np.arange(self.n_buckets, dtype=np.int64) * self.finest_min * 60
+
+    def rollup(self, minutes: int, plane: str = "net") -> tuple[np.ndarray, np.ndarray]:
+        """Agrega para janelas de ``minutes`` (múltiplo de ``finest_min``, alinhadas ao epoch).
+
+        Retorna (inícios das janelas em epoch segundos, matriz janelas x estações).
+        """
+        if minutes % self.finest_min:
+            raise ValueError(f"Janela de {minutes} min não é múltipla de {self.finest_min} min")
+        data = getattr(self, plane)
+        if self.n_buckets == 0:
+            return np.zeros(0, dtype=np.int64), data
+        coarse = self.bucket_starts() // (minutes * 60)
+        starts = np.flatnonzero(np.r_[True, coarse[1:] != coarse[:-1]])
+        summed = np.add.reduceat(data.astype(np.int32), starts, axis=0)
+        return coarse[starts] * minutes * 60, summed
+
+    def bucket_deltas(self, minutes: int) -> pd.DataFrame:
+        """Mesmo resultado de ``od_inference.bucket_deltas`` (só deltas != 0)."""
+        starts, net = self.rollup(minutes)
+        # As in bucket_deltas, a station's first window has no previous window to diff against
+        first_window = np.searchsorted(starts, self.first_seen // (minutes * 60) * minutes * 60)
+        net[first_window, np.arange(len(self.station_ids))] = 0
+        b, s = np.nonzero(net)
+        bucket = pd.to_datetime(starts[b], unit="s", utc=True)
+        if self.tz is not None:
+            bucket = bucket.tz_convert(self.tz)
+        return pd.DataFrame({"station_id": self.station_ids[s], "bucket": bucket, "delta": net[b, s].astype(int)})
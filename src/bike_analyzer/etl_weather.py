@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
+import numpy as np
+import pandas as pd
 import requests
 from dateutil import parser as dateparser
 from sqlalchemy import text
+from sqlalchemy.engine import Engine
 
 from .config import CITY_LAT, CITY_LON, TIMEZONE, WEATHER_HOURLY_PARAMS
-from .db import get_engine
+from .db import get_data_stats, get_engine, init_db
+from .features import weather_loaded
+from .metrics import acquire_write_lock, stage
+from .rollups import hour_key
+
+OPEN_METEO_URL = "https://api.open-meteo.com/v1/forecast"
 
 
 def _parse_rel(s: str) -> datetime:
@@ -20,7 +29,9 @@ def _parse_rel(s: str) -> datetime:
     return dateparser.parse(s)
 
 
-def fetch_weather(start: str, end: str) -> dict[str, Any]:
+def fetch_weather(
+    start: str, end: str, url: str = OPEN_METEO_URL, session: requests.Session | None = None
+) -> dict[str, Any]:
     start_dt = _parse_rel(start)
     end_dt = _parse_rel(end)
     params = {
@@ -31,46 +42,163 @@ def fetch_weather(start: str, end: str) -> dict[str, Any]:
         "end_date": end_dt.date().isoformat(),
         "hourly": ",".join(WEATHER_HOURLY_PARAMS["hourly"]),
     }
-    r = requests.get("https://api.open-meteo.com/v1/forecast", params=params, timeout=30)
+    with stage("weather.fetch") as m:
+        r = (session or requests).get(url, params=params, timeout=30)
+        m.bytes = len(r.content)
     r.raise_for_status()
     return r.json()
 
 
-def load_weather_hourly(payload: dict[str, Any]) -> int:
+_UPSERT_WEATHER_SQL = text(
+    """
+    INSERT INTO weather_hourly (
+      time, temperature_2m, precipitation, rain, showers, snowfall,
+      cloudcover, windspeed_10m, relative_humidity_2m, weathercode, is_forecast
+    ) VALUES (
+      :time, :temperature_2m, :precipitation, :rain, :showers, :snowfall,
+      :cloudcover, :windspeed_10m, :relative_humidity_2m, :weathercode, :is_forecast
+    )
+    ON CONFLICT(time) DO UPDATE SET
+      temperature_2m=excluded.temperature_2m,
+      precipitation=excluded.precipitation,
+      rain=excluded.rain,
+      showers=excluded.showers,
+      snowfall=excluded.snowfall,
+      cloudcover=excluded.cloudcover,
+      windspeed_10m=excluded.windspeed_10m,
+      relative_humidity_2m=excluded.relative_humidity_2m,
+      weathercode=excluded.weathercode,
+      is_forecast=excluded.is_forecast
+    ;
+    """
+)
+
+
+def _weather_rows(
+    payload: dict[str, Any], fetched_at: str | None = None, only: set[str] | None = None
+) -> list[dict[str, Any]]:
     hourly = payload.get("hourly", {})
     times = hourly.get("time", [])
-    engine = get_engine()
     cols = WEATHER_HOURLY_PARAMS["hourly"]
-    rows = 0
-    with engine.begin() as conn:
-        for i, t in enumerate(times):
-            data = {"time": t}
-            for c in cols:
-                data[c] = (hourly.get(c) or [None] * len(times))[i]
-            conn.execute(
-                text(
-                    """
-                    INSERT INTO weather_hourly (
-                      time, temperature_2m, precipitation, rain, showers, snowfall,
-                      cloudcover, windspeed_10m, relative_humidity_2m, weathercode
-                    ) VALUES (
-                      :time, :temperature_2m, :precipitation, :rain, :showers, :snowfall,
-                      :cloudcover, :windspeed_10m, :relative_humidity_2m, :weathercode
-                    )
-                    ON CONFLICT(time) DO UPDATE SET
-                      temperature_2m=excluded.temperature_2m,
-                      precipitation=excluded.precipitation,
-                      rain=excluded.rain,
-                      showers=excluded.showers,
-                      snowfall=excluded.snowfall,
-                      cloudcover=excluded.cloudcover,
-                      windspeed_10m=excluded.windspeed_10m,
-                      relative_humidity_2m=excluded.relative_humidity_2m,
-                      weathercode=excluded.weathercode
-                    ;
-                    """
-                ),
-                data,
-            )
-            rows += 1
-    return rows
+    # Column-wise: resolve every series once, then zip them into rows
+    series = [hourly.get(c) or [None] * len(times) for c in cols]
+    # Hours at or after the fetch hour are forecasts; the sync fetches them again once they are past
+    now = hour_key(fetched_at or datetime.now(timezone.utc))
+    flags = (np.asarray(times, dtype=object) >= now).astype(int).tolist()
+    keys = ["time", *cols, "is_forecast"]
+    rows = (dict(zip(keys, values)) for values in zip(times, *series, flags))
+    return [r for r in rows if r["time"] in only] if only is not None else list(rows)
+
+
+def load_weather_hourly(
+    payload: dict[str, Any],
+    engine: Engine | None = None,
+    fetched_at: str | None = None,
+    only: set[str] | None = None,
+) -> int:
+    """Grava as horas do payload do Open-Meteo em weather_hourly (só as de ``only``, se dado).
+
+    ``fetched_at`` (ISO; padrão: agora) separa horas observadas das previsões (``is_forecast``).
+    """
+    engine = engine or get_engine()
+    rows = _weather_rows(payload, fetched_at, only)
+    if not rows:
+        return 0
+    with stage("weather.load") as m, engine.begin() as conn:
+        acquire_write_lock(conn)
+        conn.execute(_UPSERT_WEATHER_SQL, rows)
+        weather_loaded(conn, [r["time"] for r in rows])
+        m.rows = len(rows)
+    return len(rows)
+
+
+def _status_span(engine: Engine) -> tuple[pd.Timestamp, pd.Timestamp] | None:
+    # First/last collection from data_stats (O(1)), in local time
+    stats = get_data_stats(engine)
+    if stats.get("first_ts_epoch") is None:
+        return None
+    lo, hi = pd.to_datetime([stats["first_ts_epoch"], stats["last_ts_epoch"]], unit="s", utc=True)
+    return lo.tz_convert(TIMEZONE), hi.tz_convert(TIMEZONE)
+
+
+def weather_gaps(
+    start: str | None = None, end: str | None = None, engine: Engine | None = None
+) -> tuple[list[str], int]:
+    """Horas ('YYYY-MM-DDTHH:00', locais) a buscar entre ``start`` e ``end``, e quantas delas são previsões vencidas.
+
+    Sem ``start``/``end``, o intervalo é o do histórico de station_status. Faltam as horas
+    sem linha em weather_hourly e as gravadas como previsão que já passaram
+    (``is_forecast`` diferente de 0; linhas anteriores à coluna contam como previsão).
+    """
+    engine = engine or get_engine()
+    span = _status_span(engine)
+    lo = pd.Timestamp(_parse_rel(start)) if start else span[0] if span else None
+    hi = pd.Timestamp(_parse_rel(end)) if end else span[1] if span else None
+    if lo is None or hi is None:
+        return [], 0
+    lo, hi = (t.tz_convert(TIMEZONE) if t.tzinfo else t.tz_localize(TIMEZONE) for t in (lo, hi))
+    expected = pd.date_range(lo.floor("h"), hi.floor("h"), freq="h").strftime("%Y-%m-%dT%H:00")
+    if expected.empty:
+        return [], 0
+    now = hour_key(datetime.now(timezone.utc))
+    with engine.connect() as conn:
+        stored = conn.execute(
+            text("SELECT time, is_forecast FROM weather_hourly WHERE time >= :lo AND time <= :hi"),
+            {"lo": expected[0], "hi": expected[-1]},
+        ).all()
+    done = {t for t, forecast in stored if forecast == 0 or t >= now}
+    stale = sum(1 for t, forecast in stored if forecast != 0 and t < now)
+    return [t for t in expected if t not in done], stale
+
+
+def _chunks(hours: list[str], chunk_days: int) -> list[tuple[str, str]]:
+    # Runs of consecutive missing days, split into requests of at most chunk_days days
+    days = pd.DatetimeIndex(sorted({h[:10] for h in hours}))
+    if days.empty:
+        return []
+    breaks = np.flatnonzero((days[1:] - days[:-1]) != pd.Timedelta(days=1)) + 1
+    out = []
+    for run in np.split(days, breaks):
+        for i in range(0, len(run), chunk_days):
+            part = run[i : i + chunk_days]
+            out.append((part[0].date().isoformat(), part[-1].date().isoformat()))
+    return out
+
+
+def sync_weather(
+    start: str | None = None,
+    end: str | None = None,
+    engine: Engine | None = None,
+    chunk_days: int = 31,
+    workers: int = 4,
+    url: str = OPEN_METEO_URL,
+    session: requests.Session | None = None,
+) -> dict[str, Any]:
+    """Completa weather_hourly no intervalo do histórico de status (ou ``start``..``end``), buscando só as lacunas.
+
+    As horas que faltam (ou que ainda são previsão) viram blocos de dias consecutivos
+    de até ``chunk_days`` dias, baixados em paralelo (``workers`` threads, uma sessão
+    HTTP compartilhada) e gravados em lote, só as horas que faltavam. Com a base em dia
+    o custo é uma consulta, sem nenhuma requisição.
+    """
+    engine = engine or get_engine()
+    init_db(engine)
+    with stage("weather.sync"):
+        hours, stale = weather_gaps(start, end, engine)
+        chunks = _chunks(hours, max(chunk_days, 1))
+        out: dict[str, Any] = {"missing_hours": len(hours), "forecast_hours": stale, "requests": len(chunks), "rows": 0}
+        if not chunks:
+            return out
+        fetched_at = datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds")
+        own = session is None
+        session = session or requests.Session()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+                payloads = pool.map(lambda c: fetch_weather(c[0], c[1], url, session), chunks)
+                wanted = set(hours)
+                for payload in payloads:
+                    out["rows"] += load_weather_hourly(payload, engine, fetched_at, wanted)
+        finally:
+            if own:
+                session.close()
+    return out
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .config import FEATURES_WEATHER_MAX_LAG_H, WEATHER_HOURLY_PARAMS
+from .db import get_engine
+
+WEATHER_COLUMNS = tuple(WEATHER_HOURLY_PARAMS["hourly"])
+# Columns of the modelling matrix (feature_matrix), in order
+FEATURE_COLUMNS = (
+    "hour_of_day",
+    "dow",
+    "avg_bikes",
+    "min_bikes",
+    "max_bikes",
+    "avg_docks",
+    "min_docks",
+    "max_docks",
+    "activity",
+    "empty_min",
+    "full_min",
+    *WEATHER_COLUMNS,
+)
+
+_UPSERT_FEATURES_SQL = text(
+    """
+    INSERT INTO station_features (
+      station_id, hour, hour_of_day, dow, n_samples, sum_bikes, min_bikes, max_bikes,
+      sum_docks, min_docks, max_docks, activity, empty_min, full_min
+    ) VALUES (
+      :station_id, :hour, CAST(SUBSTR(:hour, 12, 2) AS INTEGER), CAST(STRFTIME('%w', :hour) AS INTEGER),
+      :n_samples, :sum_bikes, :min_bikes, :max_bikes, :sum_docks, :min_docks, :max_docks,
+      :activity, :empty_min, :full_min
+    )
+    ON CONFLICT(station_id, hour) DO UPDATE SET
+      n_samples = n_samples + excluded.n_samples,
+      sum_bikes = sum_bikes + excluded.sum_bikes,
+      min_bikes = COALESCE(MIN(min_bikes, excluded.min_bikes), min_bikes, excluded.min_bikes),
+      max_bikes = COALESCE(MAX(max_bikes, excluded.max_bikes), max_bikes, excluded.max_bikes),
+      sum_docks = sum_docks + excluded.sum_docks,
+      min_docks = COALESCE(MIN(min_docks, excluded.min_docks), min_docks, excluded.min_docks),
+      max_docks = COALESCE(MAX(max_docks, excluded.max_docks), max_docks, excluded.max_docks),
+      activity = activity + excluded.activity,
+      empty_min = empty_min + excluded.empty_min,
+      full_min = full_min + excluded.full_min
+    ;
+    """
+)
+
+# As-of alignment: the last weather hour at or before the row's hour, at most
+# FEATURES_WEATHER_MAX_LAG_H hours old. Both keys are local hours in TIMEZONE
+# ('YYYY-MM-DDTHH:00'), so they compare as strings
+_ALIGN_TIME_SQL = """
+    UPDATE station_features SET weather_time = (
+      SELECT MAX(w.time) FROM weather_hourly w
+      WHERE w.time <= station_features.hour
+        AND w.time >= STRFTIME('%Y-%m-%dT%H:00', station_features.hour, :lag)
+    )
+    WHERE hour >= :lo AND hour <= :hi
+"""
+_ALIGN_VALUES_SQL = f"""
+    UPDATE station_features SET ({", ".join(WEATHER_COLUMNS)}) = (
+      SELECT {", ".join(f"w.{c}" for c in WEATHER_COLUMNS)} FROM weather_hourly w
+      WHERE w.time = station_features.weather_time
+    )
+    WHERE hour >= :lo AND hour <= :hi
+"""
+
+
+def align_weather(conn: Connection, lo: str, hi: str) -> None:
+    """Reatribui o clima (as-of) das linhas de station_features com hora em ``lo``..``hi`` (na transação de ``conn``)."""
+    params = {"lo": lo, "hi": hi, "lag": f"-{FEATURES_WEATHER_MAX_LAG_H} hours"}
+    conn.execute(text(_ALIGN_TIME_SQL), params)
+    conn.execute(text(_ALIGN_VALUES_SQL), params)
+
+
+def weather_loaded(conn: Connection, times: Sequence[str]) -> None:
+    """Realinha as features afetadas por horas de clima recém-gravadas (até FEATURES_WEATHER_MAX_LAG_H depois)."""
+    if not len(times):
+        return
+    hi = pd.Timestamp(max(times)) + pd.Timedelta(hours=FEATURES_WEATHER_MAX_LAG_H)
+    align_weather(conn, min(times), hi.strftime("%Y-%m-%dT%H:00"))
+
+
+def update_features(conn: Connection, hourly: list[dict[str, Any]]) -> None:
+    """Soma os agregados por estação e hora (mesmas linhas de station_hourly) e alinha o clima dessas horas."""
+    if not hourly:
+        return
+    conn.execute(_UPSERT_FEATURES_SQL, hourly)
+    hours = [r["hour"] for r in hourly]
+    align_weather(conn, min(hours), max(hours))
+
+
+def _in(column: str, values: Sequence[Any] | None, params: dict[str, Any]) -> str | None:
+    if values is None:
+        return None
+    names = []
+    for i, v in enumerate(values):
+        params[f"{column}_{i}"] = v
+        names.append(f":{column}_{i}")
+    return f"{column} IN ({', '.join(names)})" if names else "0"
+
+
+def get_station_features(
+    start: str | None = None,
+    end: str | None = None,
+    stations: Sequence[str] | None = None,
+    hours_of_day: Sequence[int] | None = None,
+    weathercodes: Sequence[int] | None = None,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Tabela estação x hora: station_id, hour (local, 'YYYY-MM-DDTHH:00'), weather_time e FEATURE_COLUMNS.
+
+    Filtros opcionais por intervalo, estações, horas do dia (0-23) e ``weathercode``
+    (WMO), todos cobertos por índices. avg_bikes/avg_docks são médias das coletas da
+    hora; as colunas de clima vêm da hora de ``weather_hourly`` alinhada (nulas se não
+    houver clima até FEATURES_WEATHER_MAX_LAG_H horas antes).
+    """
+    from .rollups import hour_key  # rollups imports this module
+
+    engine = engine or get_engine()
+    params: dict[str, Any] = {}
+    where = [
+        "hour >= :start" if start else None,
+        "hour <= :end" if end else None,
+        _in("station_id", stations, params),
+        _in("hour_of_day", hours_of_day, params),
+        _in("weathercode", weathercodes, params),
+    ]
+    if start:
+        params["start"] = hour_key(start)
+    if end:
+        params["end"] = hour_key(end)
+    cond = [w for w in where if w]
+    sql = (
+        "SELECT station_id, hour, weather_time, hour_of_day, dow, "
+        "sum_bikes * 1.0 / NULLIF(n_samples, 0) AS avg_bikes, min_bikes, max_bikes, "
+        "sum_docks * 1.0 / NULLIF(n_samples, 0) AS avg_docks, min_docks, max_docks, "
+        f"activity, empty_min, full_min, {', '.join(WEATHER_COLUMNS)} FROM station_features"
+        + (" WHERE " + " AND ".join(cond) if cond else "")
+        + " ORDER BY station_id, hour"
+    )
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params)
+
+
+def feature_matrix(df: pd.DataFrame, columns: Sequence[str] = FEATURE_COLUMNS) -> np.ndarray:
+    """``df[columns]`` como matriz float64 (NaN onde não há valor), uma linha por estação e hora."""
+    return df[list(columns)].to_numpy(dtype=np.float64, na_value=np.nan)
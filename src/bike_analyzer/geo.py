@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+from .config import CACHE_DIR, GEO_MEMO_SIZE
+from .utils import get_stations, haversine_matrix
+
+# Above this many stations the dense matrix is not stored; distances are computed per query
+MAX_DENSE_STATIONS = 4000
+KNN_K = 16
+
+# LRU keyed by stations_key: callers alternating station sets (e.g. per system) keep their geometries
+_memo: OrderedDict[str, StationGeometry] = OrderedDict()
+
+
+def stations_key(stations_df: pd.DataFrame) -> str:
+    """Hash estável de (station_id, lat, lon): muda só quando estações/coordenadas mudam."""
+    df = stations_df[["station_id", "lat", "lon"]].sort_values("station_id")
+    payload = "\n".join(f"{s}|{lat:.7f}|{lon:.7f}" for s, lat, lon in df.itertuples(index=False))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class StationGeometry:
+    key: str
+    station_ids: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    dist: np.ndarray | None = None  # float32 n x n, metros
+    knn: np.ndarray | None = None  # int32 n x k, vizinhos mais próximos (sem a própria estação)
+    _index: pd.Index = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._index = pd.Index(self.station_ids)
+
+    @classmethod
+    def build(cls, stations_df: pd.DataFrame, key: str | None = None) -> StationGeometry:
+        df = stations_df.sort_values("station_id")
+        ids = df["station_id"].to_numpy(dtype=object)
+        lat = df["lat"].to_numpy(dtype=float)
+        lon = df["lon"].to_numpy(dtype=float)
+        geom = cls(key or stations_key(df), ids, lat, lon)
+        if len(ids) <= MAX_DENSE_STATIONS:
+            geom.dist = haversine_matrix(lat, lon, lat, lon).astype(np.float32)
+            k = min(KNN_K, len(ids) - 1)
+            if k > 0:
+                d = geom.dist.copy()
+                np.fill_diagonal(d, np.inf)
+                part = np.argpartition(d, k - 1, axis=1)[:, :k]
+                order = np.take_along_axis(d, part, axis=1).argsort(axis=1)
+                geom.knn = np.take_along_axis(part, order, axis=1).astype(np.int32)
+        return geom
+
+    def __len__(self) -> int:
+        return len(self.station_ids)
+
+    def positions(self, station_ids: ArrayLike) -> np.ndarray:
+        """Posição de cada station_id na geometria (-1 se desconhecida)."""
+        return self._index.get_indexer(pd.Index(np.asarray(station_ids, dtype=object)))
+
+    def distances(self, o_pos: ArrayLike, d_pos: ArrayLike) -> np.ndarray:
+        o_pos, d_pos = np.asarray(o_pos), np.asarray(d_pos)
+        if self.dist is not None:
+            return self.dist[np.ix_(o_pos, d_pos)]
+        return haversine_matrix(self.lat[o_pos], self.lon[o_pos], self.lat[d_pos], self.lon[d_pos])
+
+    def _chunks(self, n_points: int):
+        # bounded-memory row chunks for point x station distance matrices
+        step = max(1, 2_000_000 // max(len(self), 1))
+        return (slice(s, s + step) for s in range(0, n_points, step))
+
+    def within_radius(self, lat: ArrayLike, lon: ArrayLike, radius_m: float) -> list[np.ndarray]:
+        """Para cada ponto (lat, lon), os station_ids a até ``radius_m`` metros."""
+        lat, lon = np.atleast_1d(np.asarray(lat, dtype=float)), np.atleast_1d(np.asarray(lon, dtype=float))
+        out: list[np.ndarray] = []
+        for sl in self._chunks(len(lat)):
+            d = haversine_matrix(lat[sl], lon[sl], self.lat, self.lon)
+            out.extend(self.station_ids[row <= radius_m] for row in d)
+        return out
+
+    def neighbors(self, radius_m: float) -> pd.DataFrame:
+        """Pares de estações a até ``radius_m`` metros: station_id, neighbor_id, distance_m."""
+        if self.dist is not None:
+            i, j = np.nonzero(self.dist <= radius_m)
+            d = self.dist[i, j]
+        else:
+            ii, jj, dd = [np.array([], dtype=np.int64)], [np.array([], dtype=np.int64)], [np.array([])]
+            for sl in self._chunks(len(self)):
+                block = haversine_matrix(self.lat[sl], self.lon[sl], self.lat, self.lon)
+                r, c = np.nonzero(block <= radius_m)
+                ii.append(r + sl.start)
+                jj.append(c)
+                dd.append(block[r, c])
+            i, j, d = np.concatenate(ii), np.concatenate(jj), np.concatenate(dd)
+        keep = i != j
+        return pd.DataFrame(
+            {"station_id": self.station_ids[i[keep]], "neighbor_id": self.station_ids[j[keep]], "distance_m": d[keep]}
+        )
+
+    def save(self, path: Path) -> None:
+        arrays = {"station_ids": self.station_ids.astype(str), "lat": self.lat, "lon": self.lon}
+        if self.dist is not None:
+            arrays["dist"] = self.dist
+        if self.knn is not None:
+            arrays["knn"] = self.knn
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(tmp, **arrays)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path, key: str) -> StationGeometry:
+        with np.load(path, allow_pickle=False) as z:
+            return cls(
+                key,
+                z["station_ids"].astype(object),
+                z["lat"],
+                z["lon"],
+                z["dist"] if "dist" in z else None,
+                z["knn"] if "knn" in z else None,
+            )
+
+
+def _cache_path(key: str) -> Path:
+    return Path(CACHE_DIR) / f"station_geometry_{key}.npz"
+
+
+def get_station_geometry(stations_df: pd.DataFrame | None = None) -> StationGeometry:
+    """Geometria das estações (distâncias, k-NN), reconstruída só quando o hash das coordenadas muda.
+
+    Cache em memória por processo (as ``GEO_MEMO_SIZE`` geometrias usadas mais
+    recentemente) e em disco (``CACHE_DIR``, um arquivo por conjunto de estações),
+    então reinícios do dashboard não recalculam a matriz e conjuntos diferentes não
+    se invalidam entre si.
+    """
+    if stations_df is None:
+        stations_df = get_stations()
+    key = stations_key(stations_df)
+    if key in _memo:
+        _memo.move_to_end(key)
+        return _memo[key]
+    path = _cache_path(key)
+    if path.exists():
+        geom = StationGeometry.load(path, key)
+    else:
+        geom = StationGeometry.build(stations_df, key)
+        geom.save(path)
+    _memo[key] = geom
+    while len(_memo) > GEO_MEMO_SIZE:
+        _memo.popitem(last=False)
+    return geom
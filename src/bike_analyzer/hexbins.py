@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+
+from .config import CITY_LAT, CITY_LON
+
+# Hex cell sizes (center to vertex, meters) precomputed for the maps, coarse to fine;
+# each level halves the previous one
+HEX_LEVELS_M = (1600, 800, 400, 200)
+EARTH_RADIUS_M = 6371000.0
+_SQRT3 = np.sqrt(3.0)
+
+
+def _project(lats: ArrayLike, lons: ArrayLike, origin: tuple[float, float]) -> tuple[np.ndarray, np.ndarray]:
+    # Local equirectangular projection (meters); at city scale the distortion is negligible
+    lat0, lon0 = origin
+    x = EARTH_RADIUS_M * np.radians(np.asarray(lons, dtype=float) - lon0) * np.cos(np.radians(lat0))
+    y = EARTH_RADIUS_M * np.radians(np.asarray(lats, dtype=float) - lat0)
+    return x, y
+
+
+def hex_cells(
+    lats: ArrayLike, lons: ArrayLike, size_m: float, origin: tuple[float, float] = (CITY_LAT, CITY_LON)
+) -> tuple[np.ndarray, np.ndarray]:
+    """Célula hexagonal (coordenadas axiais q, r; hexágonos de topo plano) de cada ponto.
+
+    A grade é fixa em ``origin``, então as células não mudam quando os dados mudam.
+    """
+    x, y = _project(lats, lons, origin)
+    qf = (2.0 / 3.0) * x / size_m
+    rf = (-x / 3.0 + _SQRT3 / 3.0 * y) / size_m
+    sf = -qf - rf
+    q, r, s = np.round(qf), np.round(rf), np.round(sf)
+    dq, dr, ds = np.abs(q - qf), np.abs(r - rf), np.abs(s - sf)
+    # Cube rounding: the coordinate with the largest rounding error is recomputed from the others
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    q = np.where(fix_q, -r - s, q)
+    r = np.where(fix_r, -q - s, r)
+    return q.astype(np.int64), r.astype(np.int64)
+
+
+def hex_centers(
+    q: ArrayLike, r: ArrayLike, size_m: float, origin: tuple[float, float] = (CITY_LAT, CITY_LON)
+) -> tuple[np.ndarray, np.ndarray]:
+    """Centro (lat, lon) das células axiais ``q, r``."""
+    q, r = np.asarray(q, dtype=float), np.asarray(r, dtype=float)
+    x = size_m * 1.5 * q
+    y = size_m * _SQRT3 * (r + q / 2.0)
+    lat0, lon0 = origin
+    lat = lat0 + np.degrees(y / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(x / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    return lat, lon
+
+
+def hexbin(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    size_m: float,
+    origin: tuple[float, float] = (CITY_LAT, CITY_LON),
+) -> pd.DataFrame:
+    """Soma de ``columns`` por célula: q, r, lat, lon (centro), n_stations e as colunas."""
+    df = df.dropna(subset=["lat", "lon"])
+    q, r = hex_cells(df["lat"], df["lon"], size_m, origin)
+    values = df[list(columns)].fillna(0).assign(q=q, r=r, n_stations=1)
+    bins = values.groupby(["q", "r"], as_index=False, sort=True)[["n_stations", *columns]].sum()
+    lat, lon = hex_centers(bins["q"], bins["r"], size_m, origin)
+    bins.insert(2, "lat", lat)
+    bins.insert(3, "lon", lon)
+    return bins
+
+
+def hexbin_levels(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    levels: Sequence[float] = HEX_LEVELS_M,
+    origin: tuple[float, float] = (CITY_LAT, CITY_LON),
+) -> pd.DataFrame:
+    """``hexbin`` para cada tamanho de ``levels``, num só frame com a coluna ``size_m``.
+
+    Pensado para ser calculado uma vez por versão dos dados: trocar o nível no mapa só
+    filtra linhas, e o navegador recebe células já agregadas em vez das estações.
+    """
+    parts = [hexbin(df, columns, size, origin).assign(size_m=size) for size in levels]
+    return pd.concat(parts, ignore_index=True)
+
+
+def scaled_radius(values: ArrayLike, scale: float, lo: float, hi: float) -> np.ndarray:
+    """Raio (m) dos pontos no mapa: ``values * scale`` limitado a [lo, hi], já calculado no servidor."""
+    return np.clip(np.nan_to_num(np.asarray(values, dtype=float)) * scale, lo, hi)
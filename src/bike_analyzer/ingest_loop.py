@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Iterator
+
+import requests
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from .etl_gbfs import FEED_NAMES, GbfsClient, append_status_snapshot, load_stations
+
+# Errors of a polling cycle that back off and retry instead of stopping the loop
+RETRYABLE_ERRORS = (requests.RequestException, SQLAlchemyError, RuntimeError, ValueError, KeyError)
+
+
+def feed_delay(payload: dict[str, Any], now: float, min_interval: float, max_interval: float) -> float:
+    """Segundos até buscar o feed de novo: o fim do ``ttl`` a partir de ``last_updated``, entre os limites."""
+    # GBFS: the feed is refreshed `ttl` seconds after `last_updated`
+    ttl = payload.get("ttl")
+    if ttl is None:
+        return min_interval
+    last_updated = payload.get("last_updated")
+    delay = (last_updated + ttl - now) if last_updated else ttl
+    if delay <= 0:
+        # publisher missed its own refresh deadline: fall back to polling every ttl
+        delay = ttl
+    return min(max(delay, min_interval), max_interval)
+
+
+def ingest_loop(
+    client: GbfsClient | None = None,
+    engine: Engine | None = None,
+    *,
+    min_interval: float = 10.0,
+    max_interval: float = 300.0,
+    max_backoff: float = 600.0,
+    iterations: int | None = None,
+    clock: Callable[[], float] = time.time,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[dict[str, Any]]:
+    """Ingestão residente: gera um evento por ciclo de polling.
+
+    Cada feed é buscado quando o seu ``ttl`` expira; snapshots cujo ``last_updated``
+    não mudou são pulados. Erros de rede/banco aplicam backoff exponencial.
+    """
+    own_client = client is None
+    client = client or GbfsClient()
+    next_due = {name: 0.0 for name in FEED_NAMES}
+    last_seen: dict[str, Any] = {}
+    failures = 0
+    i = 0
+    try:
+        while iterations is None or i < iterations:
+            i += 1
+            now = clock()
+            due = [name for name in FEED_NAMES if next_due[name] <= now]
+            t0 = time.perf_counter()
+            try:
+                fetched = client.fetch_feeds(due)
+                fetch_s = time.perf_counter() - t0
+                event: dict[str, Any] = {
+                    "event": "poll",
+                    "fetch_seconds": round(fetch_s, 3),
+                    "stations_upserted": 0,
+                    "status_rows": 0,
+                    "snapshot": False,
+                    "skipped": [],
+                }
+                now = clock()
+                for name, (payload, modified) in fetched.items():
+                    next_due[name] = now + feed_delay(payload, now, min_interval, max_interval)
+                    last_updated = payload.get("last_updated")
+                    if not modified or (last_updated is not None and last_updated == last_seen.get(name)):
+                        event["skipped"].append(name)
+                        continue
+                    if name == "station_information":
+                        event["stations_upserted"] = load_stations(payload, engine)
+                    else:
+                        event["status_rows"] = append_status_snapshot(payload, engine)
+                        event["snapshot"] = True
+                    last_seen[name] = last_updated
+            except RETRYABLE_ERRORS as e:
+                failures += 1
+                client.invalidate()
+                delay = min(min_interval * 2 ** (failures - 1), max_backoff)
+                yield {"event": "error", "error": f"{type(e).__name__}: {e}", "retry_in": delay}
+                if iterations is None or i < iterations:
+                    sleep(delay)
+                continue
+            failures = 0
+            yield event
+            if iterations is None or i < iterations:
+                sleep(max(0.0, min(next_due.values()) - clock()))
+    finally:
+        if own_client:
+            client.close()
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import atexit
+import cProfile
+import io
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from .config import DATABASE_URL, METRICS_ENABLED, METRICS_FLUSH_S
+from .db import get_engine
+
+# Per-process totals go to perf_metrics in hourly buckets, one row per (hour, stage)
+_BUCKET_S = 3600
+
+_UPSERT_METRICS_SQL = text(
+    """
+    INSERT INTO perf_metrics (bucket_start, stage, calls, total_ms, max_ms, rows, bytes)
+    VALUES (:bucket_start, :stage, :calls, :total_ms, :max_ms, :rows, :bytes)
+    ON CONFLICT(bucket_start, stage) DO UPDATE SET
+      calls = calls + excluded.calls,
+      total_ms = total_ms + excluded.total_ms,
+      max_ms = MAX(max_ms, excluded.max_ms),
+      rows = rows + excluded.rows,
+      bytes = bytes + excluded.bytes
+    ;
+    """
+)
+
+_SUMMARY_SQL = text(
+    """
+    SELECT stage, SUM(calls) AS calls, SUM(total_ms) AS total_ms, MAX(max_ms) AS max_ms,
+           SUM(rows) AS rows, SUM(bytes) AS bytes
+    FROM perf_metrics
+    WHERE bucket_start >= :since
+    GROUP BY stage
+    ORDER BY total_ms DESC
+    """
+)
+
+
+@dataclass
+class Stage:
+    """Contadores de uma execução de ``stage``: preencha ``rows``/``bytes`` dentro do bloco."""
+
+    rows: int = 0
+    bytes: int = 0
+
+
+_lock = threading.Lock()
+# (bucket_start, stage) -> [calls, total_ms, max_ms, rows, bytes], not yet in the database
+_pending: dict[tuple[int, str], list[float]] = {}
+_last_flush = time.monotonic()
+_url: str | None = None
+_flush_engines: dict[str, Engine] = {}
+_atexit_registered = False
+
+
+def bind(engine: Engine) -> None:
+    """Grava as métricas deste processo na base de ``engine`` (padrão: DATABASE_URL)."""
+    global _url
+    _url = engine.url.render_as_string(hide_password=False)
+
+
+def record(name: str, elapsed_ms: float, rows: int = 0, nbytes: int = 0) -> None:
+    """Soma uma execução da etapa ``name`` aos totais do processo (e grava se já passou METRICS_FLUSH_S)."""
+    global _atexit_registered
+    if not METRICS_ENABLED:
+        return
+    key = (int(time.time()) // _BUCKET_S * _BUCKET_S, name)
+    with _lock:
+        acc = _pending.get(key)
+        if acc is None:
+            _pending[key] = [1, elapsed_ms, elapsed_ms, rows, nbytes]
+        else:
+            acc[0] += 1
+            acc[1] += elapsed_ms
+            acc[2] = max(acc[2], elapsed_ms)
+            acc[3] += rows
+            acc[4] += nbytes
+        due = time.monotonic() - _last_flush >= METRICS_FLUSH_S
+        if not _atexit_registered:
+            atexit.register(flush)
+            _atexit_registered = True
+    if due:
+        flush()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Stage]:
+    """Mede a duração do bloco como uma execução da etapa ``name``.
+
+    O custo é um ``perf_counter`` e uma soma num dicionário; a gravação em
+    ``perf_metrics`` é agregada por hora e feita no máximo a cada METRICS_FLUSH_S.
+    """
+    counters = Stage()
+    t0 = time.perf_counter()
+    try:
+        yield counters
+    finally:
+        record(name, (time.perf_counter() - t0) * 1000, counters.rows, counters.bytes)
+
+
+def acquire_write_lock(conn: Connection) -> None:
+    """Abre a transação de ``conn`` já com o lock de escrita do SQLite, medindo a espera em ``db.lock_wait``.
+
+    Sem isso o lock só é pedido na primeira escrita, depois das leituras da mesma
+    transação, e a espera fica escondida dentro dela.
+    """
+    if conn.dialect.name != "sqlite" or conn.connection.dbapi_connection.in_transaction:
+        return
+    with stage("db.lock_wait"):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _flush_engine(url: str) -> Engine:
+    # Own engine without busy timeout: if another connection holds the write lock, the
+    # flush fails at once and the totals wait for the next one instead of blocking
+    eng = _flush_engines.get(url)
+    if eng is None:
+        eng = _flush_engines[url] = create_engine(url, future=True, connect_args={"timeout": 0})
+    return eng
+
+
+def flush(engine: Engine | None = None) -> int:
+    """Grava em ``perf_metrics`` os totais pendentes do processo; retorna as linhas gravadas.
+
+    Falhas (base travada, tabela ainda não criada) não propagam: os totais voltam
+    para a fila e vão na próxima gravação.
+    """
+    global _last_flush
+    with _lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not batch:
+        return 0
+    rows = [
+        {"bucket_start": b, "stage": s, "calls": int(v[0]), "total_ms": v[1], "max_ms": v[2], "rows": int(v[3]), "bytes": int(v[4])}
+        for (b, s), v in batch.items()
+    ]
+    try:
+        eng = engine or _flush_engine(_url or DATABASE_URL)
+        with eng.begin() as conn:
+            conn.execute(_UPSERT_METRICS_SQL, rows)
+    except SQLAlchemyError:
+        with _lock:
+            for key, v in batch.items():
+                acc = _pending.setdefault(key, [0, 0.0, 0.0, 0, 0])
+                acc[0] += v[0]
+                acc[1] += v[1]
+                acc[2] = max(acc[2], v[2])
+                acc[3] += v[3]
+                acc[4] += v[4]
+        return 0
+    return len(rows)
+
+
+def get_metrics(hours: float = 24, engine: Engine | None = None) -> pd.DataFrame:
+    """Totais por etapa nas últimas ``hours`` horas: calls, total_ms, avg_ms, max_ms, rows, bytes, rows_per_s.
+
+    Inclui os totais ainda pendentes deste processo (gravados antes da leitura).
+    """
+    engine = engine or get_engine()
+    flush(engine)
+    since = int(time.time() - hours * 3600) // _BUCKET_S * _BUCKET_S
+    with engine.connect() as conn:
+        df = pd.read_sql(_SUMMARY_SQL, conn, params={"since": since})
+    df["avg_ms"] = (df["total_ms"] / df["calls"]).round(3)
+    df["rows_per_s"] = (df["rows"] / (df["total_ms"] / 1000)).where(df["rows"] > 0).round(1)
+    df["total_ms"] = df["total_ms"].round(1)
+    df["max_ms"] = df["max_ms"].round(3)
+    return df[["stage", "calls", "total_ms", "avg_ms", "max_ms", "rows", "bytes", "rows_per_s"]]
+
+
+@contextmanager
+def profiled(path: str | None = None, top: int = 25) -> Iterator[io.StringIO]:
+    """Roda o bloco sob cProfile (uma execução): grava as estatísticas em ``path`` (se dado).
+
+    O ``StringIO`` devolvido recebe, ao final, as ``top`` funções por tempo acumulado.
+    """
+    report = io.StringIO()
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield report
+    finally:
+        prof.disable()
+        if path:
+            prof.dump_stats(path)
+        pstats.Stats(prof, stream=report).sort_stats("cumulative").print_stats(top)
+
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Sequence
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+from .config import DEFAULT_SYSTEM_ID, SYSTEMS_BATCH_WINDOW_S, SYSTEMS_MAX_CONCURRENCY, SYSTEMS_PER_HOST
+from .db import get_engine, init_db
+from .etl_gbfs import FEED_NAMES, GbfsClient, append_status_batch, load_stations
+from .ingest_loop import RETRYABLE_ERRORS, feed_delay
+from .systems import System, get_systems
+
+
+@dataclass
+class _Collected:
+    system_id: str
+    feed: str
+    payload: dict[str, Any]
+    fetched_at: float
+
+
+def _host(url: str) -> str:
+    return urlsplit(url).netloc
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(int(epoch), timezone.utc).astimezone().isoformat(timespec="seconds")
+
+
+def _rounds(collected: list[_Collected]) -> list[dict[str, _Collected]]:
+    # One snapshot holds each system at most once: a system collected twice in the
+    # window goes to the next snapshot, in collection order
+    rounds: list[dict[str, _Collected]] = []
+    for c in collected:
+        for r in rounds:
+            if c.system_id not in r:
+                r[c.system_id] = c
+                break
+        else:
+            rounds.append({c.system_id: c})
+    return rounds
+
+
+class MultiSystemIngester:
+    """Ingestão residente de vários sistemas GBFS com asyncio.
+
+    Cada sistema tem a sua tarefa de polling (feeds buscados quando o ``ttl``
+    expira, entre ``min_interval`` e ``max_interval`` do registro, com backoff
+    exponencial em erros). As requisições rodam num pool de ``max_concurrency``
+    threads, no máximo ``per_host`` por host, com uma ``requests.Session`` (pool de
+    conexões) por host. Uma única tarefa grava: junta o que chega em
+    ``batch_window`` segundos e escreve os status como um snapshot por vez
+    (``append_status_batch``), então o tempo de um ciclo acompanha o sistema mais
+    lento, não a soma das latências. ``on_event`` recebe um dict por coleta,
+    gravação e erro.
+    """
+
+    def __init__(
+        self,
+        systems: Sequence[System],
+        engine: Engine | None = None,
+        *,
+        mode: str | None = None,
+        max_concurrency: int = SYSTEMS_MAX_CONCURRENCY,
+        per_host: int = SYSTEMS_PER_HOST,
+        batch_window: float = SYSTEMS_BATCH_WINDOW_S,
+        max_backoff: float = 600.0,
+        iterations: int | None = None,
+        on_event: Callable[[dict[str, Any]], None] | None = None,
+    ) -> None:
+        self.systems = list(systems)
+        self.engine = engine or get_engine()
+        self.mode = mode
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.batch_window = batch_window
+        self.max_backoff = max_backoff
+        self.iterations = iterations
+        self.on_event = on_event
+        self.totals = {"polls": 0, "errors": 0, "snapshots": 0, "status_rows": 0, "stations_upserted": 0}
+        self._sessions: dict[str, requests.Session] = {}
+        self._last_epoch = 0
+        self._stop: asyncio.Event | None = None
+
+    def stop(self) -> None:
+        """Pede o fim da coleta: o que já foi coletado ainda é gravado."""
+        if self._stop is not None:
+            self._stop.set()
+
+    def _emit(self, event: dict[str, Any]) -> None:
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _session(self, url: str) -> requests.Session:
+        # One session per host, its pool sized for the per-host limit
+        host = _host(url)
+        session = self._sessions.get(host)
+        if session is None:
+            session = self._sessions[host] = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.per_host)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+    async def _call(self, host: str, fn: Callable[..., Any], *args: Any) -> Any:
+        sem = self._host_sems.setdefault(host, asyncio.Semaphore(self.per_host))
+        async with self._slots, sem:
+            return await asyncio.get_running_loop().run_in_executor(self._http_pool, fn, *args)
+
+    async def _sleep(self, seconds: float) -> None:
+        assert self._stop is not None
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(seconds, 0.0))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll(self, system: System) -> None:
+        assert self._stop is not None
+        # The client shares its host's session (not closed with it); only the default
+        # system goes to the raw archive, whose records have no system dimension
+        client = GbfsClient(
+            system.auto_discovery_url,
+            session=self._session(system.auto_discovery_url),
+            archive=system.system_id == DEFAULT_SYSTEM_ID,
+        )
+        next_due = {name: 0.0 for name in FEED_NAMES}
+        last_seen: dict[str, Any] = {}
+        failures = 0
+        polls = 0
+        while not self._stop.is_set() and (self.iterations is None or polls < self.iterations):
+            polls += 1
+            self.totals["polls"] += 1
+            now = time.time()
+            due = [name for name in FEED_NAMES if next_due[name] <= now]
+            t0 = time.perf_counter()
+            try:
+                urls = await self._call(_host(system.auto_discovery_url), client.feed_urls)
+                # Feeds that arrived are queued even if another one failed
+                results = await asyncio.gather(
+                    *(self._call(_host(urls[name]), client.fetch_feed, name) for name in due), return_exceptions=True
+                )
+            except RETRYABLE_ERRORS as e:
+                results = [e]
+                due = []
+            errors = [r for r in results if isinstance(r, BaseException)]
+            for e in errors:
+                if not isinstance(e, RETRYABLE_ERRORS):
+                    raise e
+            now = time.time()
+            queued, skipped = [], []
+            for name, res in zip(due, results):
+                if isinstance(res, BaseException):
+                    continue
+                payload, modified = res
+                next_due[name] = now + feed_delay(payload, now, system.min_interval, system.max_interval)
+                last_updated = payload.get("last_updated")
+                if not modified or (last_updated is not None and last_updated == last_seen.get(name)):
+                    skipped.append(name)
+                    continue
+                last_seen[name] = last_updated
+                queued.append(name)
+                await self._queue.put(_Collected(system.system_id, name, payload, now))
+            if errors:
+                failures += 1
+                self.totals["errors"] += 1
+                client.invalidate()
+                delay = min(system.min_interval * 2 ** (failures - 1), self.max_backoff)
+                e = errors[0]
+                self._emit(
+                    {
+                        "event": "error",
+                        "system_id": system.system_id,
+                        "error": f"{type(e).__name__}: {e}",
+                        "queued": queued,
+                        "retry_in": delay,
+                    }
+                )
+                if self.iterations is None or polls < self.iterations:
+                    await self._sleep(delay)
+                continue
+            failures = 0
+            self._emit(
+                {
+                    "event": "poll",
+                    "system_id": system.system_id,
+                    "fetch_seconds": round(time.perf_counter() - t0, 3),
+                    "queued": queued,
+                    "skipped": skipped,
+                }
+            )
+            if self.iterations is None or polls < self.iterations:
+                await self._sleep(min(next_due.values()) - time.time())
+
+    def _write_stations(self, c: _Collected) -> dict[str, Any]:
+        n = load_stations(c.payload, self.engine, system_id=c.system_id)
+        return {"event": "stations", "system_id": c.system_id, "stations_upserted": n}
+
+    def _write_status(self, batch: dict[str, _Collected]) -> dict[str, Any]:
+        # Snapshot times strictly increase, so a snapshot never merges into the previous one
+        epoch = max(int(max(c.fetched_at for c in batch.values())), self._last_epoch + 1)
+        t0 = time.perf_counter()
+        written = append_status_batch({s: c.payload for s, c in batch.items()}, self.engine, self.mode, _iso(epoch))
+        self._last_epoch = epoch
+        return {
+            "event": "snapshot",
+            "scraped_at": _iso(epoch),
+            "systems": sorted(batch),
+            "status_rows": sum(written.values()),
+            "write_seconds": round(time.perf_counter() - t0, 3),
+        }
+
+    async def _write(self, collected: list[_Collected]) -> None:
+        assert self._stop is not None
+        loop = asyncio.get_running_loop()
+        units: list[tuple[Callable[[Any], dict[str, Any]], Any]] = [
+            (self._write_stations, c) for c in collected if c.feed == "station_information"
+        ]
+        units += [(self._write_status, r) for r in _rounds([c for c in collected if c.feed == "station_status"])]
+        for fn, arg in units:
+            failures = 0
+            while True:
+                try:
+                    event = await loop.run_in_executor(self._db_pool, fn, arg)
+                except OperationalError as e:
+                    # Locked/busy database: retry, nothing is dropped (the pollers wait on
+                    # the full queue meanwhile)
+                    failures += 1
+                    self.totals["errors"] += 1
+                    delay = min(2 ** (failures - 1), self.max_backoff)
+                    self._emit({"event": "error", "system_id": None, "error": f"{type(e).__name__}: {e}", "retry_in": delay})
+                    await asyncio.sleep(delay)
+                    continue
+                except SQLAlchemyError as e:
+                    # Anything else would fail again the same way: drop the unit
+                    self.totals["errors"] += 1
+                    self._emit(
+                        {
+                            "event": "error",
+                            "system_id": None,
+                            "error": f"{type(e).__name__}: {e}",
+                            "dropped": sorted(arg) if isinstance(arg, dict) else [arg.system_id],
+                        }
+                    )
+                    break
+                # Totals are only touched on the event loop, not in the writer thread
+                if event["event"] == "snapshot":
+                    self.totals["snapshots"] += 1
+                    self.totals["status_rows"] += event["status_rows"]
+                else:
+                    self.totals["stations_upserted"] += event["stations_upserted"]
+                self._emit(event)
+                break
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            first = await self._queue.get()
+            if first is None:
+                break
+            collected = [first]
+            deadline = loop.time() + self.batch_window
+            while (timeout := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    done = True
+                    break
+                collected.append(item)
+            await self._write(collected)
+
+    async def run(self, duration: float | None = None) -> dict[str, Any]:
+        """Coleta até ``iterations`` ciclos por sistema, ``duration`` segundos ou ``stop()``; retorna os totais."""
+        t0 = time.perf_counter()
+        init_db(self.engine)
+        self._stop = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._host_sems: dict[str, asyncio.Semaphore] = {}
+        self._queue: asyncio.Queue[_Collected | None] = asyncio.Queue(maxsize=2 * len(FEED_NAMES) * max(len(self.systems), 1))
+        self._http_pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gbfs-http")
+        self._db_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gbfs-writer")
+        writer = asyncio.create_task(self._writer())
+        timer = asyncio.get_running_loop().call_later(duration, self.stop) if duration is not None else None
+        try:
+            await asyncio.gather(*(self._poll(s) for s in self.systems))
+        finally:
+            if timer is not None:
+                timer.cancel()
+            await self._queue.put(None)
+            await writer
+            self._http_pool.shutdown(wait=False)
+            self._db_pool.shutdown()
+            for session in self._sessions.values():
+                session.close()
+        elapsed = time.perf_counter() - t0
+        return {"systems": len(self.systems), **self.totals, "elapsed_s": round(elapsed, 2)}
+
+
+def ingest_systems(
+    system_ids: Sequence[str] | None = None,
+    engine: Engine | None = None,
+    duration: float | None = None,
+    **kwargs: Any,
+) -> dict[str, Any]:
+    """Roda ``MultiSystemIngester`` sobre os sistemas habilitados do registro (ou só ``system_ids``)."""
+    engine = engine or get_engine()
+    systems = get_systems(engine=engine)
+    if system_ids is not None:
+        missing = set(system_ids) - {s.system_id for s in systems}
+        if missing:
+            raise ValueError(f"Sistemas não registrados ou desabilitados: {', '.join(sorted(missing))}")
+        systems = [s for s in systems if s.system_id in system_ids]
+    return asyncio.run(MultiSystemIngester(systems, engine, **kwargs).run(duration))
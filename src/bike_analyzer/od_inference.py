@@ -1,77 +1,231 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable
 
+import numpy as np
 import pandas as pd
 
-from .utils import haversine
-
-
-@dataclass
-class Node:
-    station_id: str
-    lat: float
-    lon: float
-    count: int
-
-
-def _match_flows_once(departs: list[Node], arrives: list[Node]) -> list[tuple[str, str, int]]:
-    flows: list[tuple[str, str, int]] = []
-    # Greedy nearest-neighbor matching
-    while True:
-        dep_candidates = [d for d in departs if d.count > 0]
-        arr_candidates = [a for a in arrives if a.count > 0]
-        if not dep_candidates or not arr_candidates:
-            break
-        # pick departure with largest remaining to stabilize
-        dep = max(dep_candidates, key=lambda x: x.count)
-        # find nearest arrival
-        best = None
-        best_dist = 1e18
-        for a in arr_candidates:
-            dist = haversine(dep.lat, dep.lon, a.lat, a.lon)
-            if dist < best_dist:
-                best = a
-                best_dist = dist
-        if best is None:
-            break
-        flow = min(dep.count, best.count)
-        flows.append((dep.station_id, best.station_id, flow))
-        dep.count -= flow
-        best.count -= flow
+from .geo import StationGeometry, get_station_geometry
+from .metrics import stage
+
+# Largest bikes-departing x bikes-arriving matrix solved as a unit assignment (64-128 MB);
+# larger buckets are solved at station level
+ASSIGNMENT_MAX_CELLS = 16_000_000
+
+# (departure counts, arrival counts, distance matrix) -> [(dep index, arr index, flow)]
+Matcher = Callable[[np.ndarray, np.ndarray, np.ndarray], list[tuple[int, int, int]]]
+
+
+def _match_greedy(dep: np.ndarray, arr: np.ndarray, dist: np.ndarray) -> list[tuple[int, int, int]]:
+    # Greedy nearest-neighbor matching: the departure with the largest remaining count
+    # is sent to its nearest arrival with remaining capacity, until one side is exhausted
+    dep = dep.astype(np.int64, copy=True)
+    arr = arr.astype(np.int64, copy=True)
+    masked = np.where(arr > 0, dist, np.inf)
+    flows: list[tuple[int, int, int]] = []
+    remaining = min(int(dep.sum()), int(arr.sum()))
+    while remaining > 0:
+        i = int(np.argmax(dep))
+        j = int(np.argmin(masked[i]))
+        flow = int(min(dep[i], arr[j]))
+        flows.append((i, j, flow))
+        dep[i] -= flow
+        arr[j] -= flow
+        remaining -= flow
+        if arr[j] == 0:
+            masked[:, j] = np.inf
     return flows
 
 
-def infer_flows(status_df: pd.DataFrame, stations_df: pd.DataFrame, freq: str = "10min") -> pd.DataFrame:
-    # status_df: station_id, scraped_at (ISO), num_bikes_available
-    df = status_df.copy()
-    df["scraped_at"] = pd.to_datetime(df["scraped_at"])  # local tz strings OK
-    df["bucket"] = df["scraped_at"].dt.floor(freq)
-    df = df.sort_values(["station_id", "bucket", "scraped_at"])  # keep last per bucket
-    df_last = df.groupby(["station_id", "bucket"], as_index=False).last()
-    df_last["delta"] = df_last.groupby("station_id")["num_bikes_available"].diff().fillna(0).astype(int)
-
-    st = stations_df.set_index("station_id")[['lat','lon']]
-
-    all_flows: list[tuple[pd.Timestamp, str, str, int]] = []
-    for bucket, g in df_last.groupby("bucket"):
-        departs: list[Node] = []
-        arrives: list[Node] = []
-        for _, row in g.iterrows():
-            sid = row["station_id"]
-            if sid not in st.index:
-                continue
-            lat, lon = st.loc[sid, "lat"], st.loc[sid, "lon"]
-            d = int(row["delta"])
-            if d < 0:
-                departs.append(Node(sid, lat, lon, -d))
-            elif d > 0:
-                arrives.append(Node(sid, lat, lon, d))
-        if departs and arrives:
-            matched = _match_flows_once(departs, arrives)
-            for o, d, c in matched:
-                all_flows.append((bucket, o, d, c))
-
-    flows_df = pd.DataFrame(all_flows, columns=["bucket", "o", "d", "count"]).groupby(["o", "d"], as_index=False)["count"].sum()
-    return flows_df
+def _match_optimal(dep: np.ndarray, arr: np.ndarray, dist: np.ndarray) -> list[tuple[int, int, int]]:
+    # Min-cost transport: ships min(sum(dep), sum(arr)) bikes at minimal total distance. Few
+    # bikes: unit assignment (fastest); otherwise the same optimum at station level, whose
+    # size does not grow with the number of bikes
+    n_dep, n_arr = int(dep.sum()), int(arr.sum())
+    if n_dep == 0 or n_arr == 0:
+        return []
+    if n_dep * n_arr <= ASSIGNMENT_MAX_CELLS:
+        return _assign_units(dep, arr, dist)
+    return _transport(dep, arr, dist)
+
+
+def _assign_units(dep: np.ndarray, arr: np.ndarray, dist: np.ndarray) -> list[tuple[int, int, int]]:
+    # Expand counts into unit bikes and solve the rectangular assignment problem
+    from scipy.optimize import linear_sum_assignment
+
+    rows = np.repeat(np.arange(len(dep)), dep)
+    cols = np.repeat(np.arange(len(arr)), arr)
+    r, c = linear_sum_assignment(dist[np.ix_(rows, cols)])
+    pairs, counts = np.unique(np.stack([rows[r], cols[c]], axis=1), axis=0, return_counts=True)
+    return [(int(i), int(j), int(n)) for (i, j), n in zip(pairs, counts)]
+
+
+def _transport(dep: np.ndarray, arr: np.ndarray, dist: np.ndarray) -> list[tuple[int, int, int]]:
+    # Transport LP over the dep x arr station matrix: the short side ships everything, the
+    # other side at most its count. The constraint matrix is totally unimodular, so the
+    # simplex vertex is integral
+    from scipy import sparse
+    from scipy.optimize import linprog
+
+    n_dep, n_arr = len(dep), len(arr)
+    by_dep = sparse.kron(sparse.eye(n_dep, format="csr"), np.ones((1, n_arr)), format="csr")
+    by_arr = sparse.kron(np.ones((1, n_dep)), sparse.eye(n_arr, format="csr"), format="csr")
+    if dep.sum() <= arr.sum():
+        eq, b_eq, ub, b_ub = by_dep, dep, by_arr, arr
+    else:
+        eq, b_eq, ub, b_ub = by_arr, arr, by_dep, dep
+    res = linprog(
+        np.asarray(dist, dtype=np.float64).ravel(),
+        A_ub=ub, b_ub=b_ub, A_eq=eq, b_eq=b_eq, bounds=(0, None), method="highs-ds",
+    )
+    if not res.success:
+        raise RuntimeError(f"Transporte OD sem solução: {res.message}")
+    x = np.rint(res.x).astype(np.int64).reshape(n_dep, n_arr)
+    i, j = np.nonzero(x)
+    return [(int(a), int(b), int(x[a, b])) for a, b in zip(i, j)]
+
+
+MATCHERS: dict[str, Matcher] = {
+    "greedy": _match_greedy,
+    "optimal": _match_optimal,
+}
+
+
+def bucket_deltas(status_df: pd.DataFrame, freq: str = "10min") -> pd.DataFrame:
+    """Variação líquida de bikes por estação e janela: station_id, bucket, delta.
+
+    O delta de uma janela é o último valor nela menos o último valor da janela
+    anterior em que a estação apareceu (0 na primeira aparição).
+    """
+    with stage("od.bucket_deltas") as m:
+        m.rows = len(status_df)
+        return _bucket_deltas(status_df, freq)
+
+
+def _bucket_deltas(status_df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    # status_df: station_id, scraped_at (datetime64 or ISO), num_bikes_available
+    ts = pd.to_datetime(status_df["scraped_at"])  # no-op for datetime64; ISO strings OK
+    df = pd.DataFrame(
+        {
+            "station_id": status_df["station_id"],
+            "scraped_at": ts,
+            "bucket": ts.dt.floor(freq),
+            "n": status_df["num_bikes_available"],
+        }
+    )
+    # Missing counts are not readings: the last one of a bucket is its last known value
+    df = df[df["n"].notna()].sort_values(["station_id", "scraped_at"], kind="stable")
+    df = df.drop_duplicates(["station_id", "bucket"], keep="last")  # keep last per bucket
+    df["delta"] = df.groupby("station_id")["n"].diff().fillna(0).astype(int)
+    return df[["station_id", "bucket", "delta"]].reset_index(drop=True)
+
+
+def _match_buckets(
+    matcher: str, geometry: StationGeometry, pos: np.ndarray, delta: np.ndarray, bounds: np.ndarray
+) -> np.ndarray:
+    # Runs in worker processes too: rows [bounds[k], bounds[k+1]) belong to bucket k
+    match = MATCHERS[matcher]
+    out: list[tuple[int, int, int, int]] = []
+    for k in range(len(bounds) - 1):
+        p, d = pos[bounds[k] : bounds[k + 1]], delta[bounds[k] : bounds[k + 1]]
+        dep_pos, arr_pos = p[d < 0], p[d > 0]
+        if len(dep_pos) and len(arr_pos):
+            for i, j, c in match(-d[d < 0], d[d > 0], geometry.distances(dep_pos, arr_pos)):
+                out.append((k, dep_pos[i], arr_pos[j], c))
+    return np.array(out, dtype=np.int64).reshape(-1, 4)
+
+
+def flows_from_deltas(
+    deltas: pd.DataFrame,
+    geometry: StationGeometry,
+    matcher: str = "optimal",
+    workers: int = 1,
+) -> pd.DataFrame:
+    """Fluxos por janela a partir de deltas já calculados (station_id, bucket, delta).
+
+    Com ``workers > 1`` as janelas são divididas em blocos contíguos de tempo e
+    processadas num pool de processos (os deltas já são globais, então os blocos
+    são independentes).
+    """
+    MATCHERS[matcher]  # fail fast on unknown matcher
+    deltas = deltas[["bucket", "delta"]].assign(pos=geometry.positions(deltas["station_id"]))
+    moved = deltas[(deltas["delta"] != 0) & (deltas["pos"] >= 0)]
+    moved = moved.sort_values("bucket", kind="stable")  # stations stay sorted within a bucket
+    empty = pd.DataFrame({"bucket": pd.Series(dtype=deltas["bucket"].dtype), "o": [], "d": [], "count": []})
+    if moved.empty:
+        return empty.astype({"o": object, "d": object, "count": "int64"})
+
+    buckets = moved["bucket"].array.asi8  # int64 ns, avoids boxing tz-aware timestamps
+    pos = moved["pos"].to_numpy(dtype=np.int64)
+    delta = moved["delta"].to_numpy(dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    bounds = np.r_[starts, len(buckets)]
+    bucket_values = moved["bucket"].iloc[starts].reset_index(drop=True)
+
+    with stage(f"od.match.{matcher}") as m:
+        m.rows = len(moved)
+        res = _match_chunks(matcher, geometry, pos, delta, bounds, workers)
+    if len(res) == 0:
+        return empty.astype({"o": object, "d": object, "count": "int64"})
+    ids = geometry.station_ids
+    return pd.DataFrame(
+        {"bucket": bucket_values.iloc[res[:, 0]].to_numpy(), "o": ids[res[:, 1]], "d": ids[res[:, 2]], "count": res[:, 3]}
+    )
+
+
+def _match_chunks(
+    matcher: str, geometry: StationGeometry, pos: np.ndarray, delta: np.ndarray, bounds: np.ndarray, workers: int
+) -> np.ndarray:
+    n_buckets = len(bounds) - 1
+    n_chunks = min(n_buckets, workers * 4) if workers > 1 else 1
+    if n_chunks <= 1:
+        return _match_buckets(matcher, geometry, pos, delta, bounds)
+    # Contiguous bucket ranges with roughly the same number of moved rows
+    cuts = np.unique(np.searchsorted(bounds, np.linspace(0, len(pos), n_chunks + 1)[1:-1]))
+    edges = np.r_[0, cuts[(cuts > 0) & (cuts < n_buckets)], n_buckets]
+    # Workers get coordinates only; each bucket's small distance block is computed there
+    light = StationGeometry(geometry.key, geometry.station_ids, geometry.lat, geometry.lon)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                _match_buckets,
+                matcher,
+                light,
+                pos[bounds[a] : bounds[b]],
+                delta[bounds[a] : bounds[b]],
+                bounds[a : b + 1] - bounds[a],
+            )
+            for a, b in zip(edges[:-1], edges[1:])
+        ]
+        parts = []
+        for a, fut in zip(edges[:-1], futures):
+            part = fut.result()
+            part[:, 0] += a
+            parts.append(part)
+    return np.concatenate(parts)
+
+
+def infer_bucket_flows(
+    status_df: pd.DataFrame,
+    stations_df: pd.DataFrame,
+    freq: str = "10min",
+    matcher: str = "optimal",
+    geometry: StationGeometry | None = None,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """Fluxos estimados por janela: bucket, o, d, count."""
+    geometry = geometry or get_station_geometry(stations_df)
+    return flows_from_deltas(bucket_deltas(status_df, freq), geometry, matcher, workers)
+
+
+def infer_flows(
+    status_df: pd.DataFrame,
+    stations_df: pd.DataFrame,
+    freq: str = "10min",
+    matcher: str = "optimal",
+    geometry: StationGeometry | None = None,
+    workers: int = 1,
+) -> pd.DataFrame:
+    flows = infer_bucket_flows(status_df, stations_df, freq, matcher, geometry, workers)
+    return flows.groupby(["o", "d"], as_index=False)["count"].sum()
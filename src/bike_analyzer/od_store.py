@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from typing import Any
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .db import get_engine
+from .geo import get_station_geometry
+from .od_inference import infer_bucket_flows
+from .status_store import from_epoch, to_epoch
+from .utils import get_stations, get_status_range
+
+_INSERT_FLOW_SQL = text(
+    """
+    INSERT INTO od_flows (bucket_size, matcher, bucket_start, o, d, count)
+    VALUES (:bucket_size, :matcher, :bucket_start, :o, :d, :count)
+    """
+)
+
+_UPSERT_WATERMARK_SQL = text(
+    """
+    INSERT INTO od_watermarks (bucket_size, matcher, last_bucket_start, baseline_scraped_at)
+    VALUES (:bucket_size, :matcher, :last_bucket_start, :baseline_scraped_at)
+    ON CONFLICT(bucket_size, matcher) DO UPDATE SET
+      last_bucket_start=excluded.last_bucket_start,
+      baseline_scraped_at=excluded.baseline_scraped_at
+    ;
+    """
+)
+
+
+def _epoch_seconds(s: pd.Series) -> pd.Series:
+    return (s - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+
+def get_watermark(bucket_min: int, matcher: str, engine: Engine | None = None) -> dict[str, Any] | None:
+    engine = engine or get_engine()
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(
+                "SELECT last_bucket_start, baseline_scraped_at FROM od_watermarks "
+                "WHERE bucket_size = :b AND matcher = :m"
+            ),
+            {"b": bucket_min, "m": matcher},
+        ).first()
+    return dict(row._mapping) if row else None
+
+
+def materialize_od(
+    bucket_min: int = 10,
+    matcher: str = "optimal",
+    backfill: bool = False,
+    chunk_days: float = 7.0,
+    engine: Engine | None = None,
+) -> dict[str, Any]:
+    """Estende od_flows com as janelas dos snapshots que chegaram desde a última execução.
+
+    A última janela materializada pode ter sido parcial, então ela é sempre recalculada,
+    a partir do snapshot anterior a ela (baseline) para que os deltas que cruzam a
+    fronteira entre dados antigos e novos fiquem corretos. ``backfill`` apaga e
+    reconstrói todo o histórico, em blocos de ``chunk_days``.
+    """
+    engine = engine or get_engine()
+    key = {"bucket_size": bucket_min, "matcher": matcher}
+    if backfill:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM od_flows WHERE bucket_size = :bucket_size AND matcher = :matcher"), key)
+            conn.execute(text("DELETE FROM od_watermarks WHERE bucket_size = :bucket_size AND matcher = :matcher"), key)
+    wm = get_watermark(bucket_min, matcher, engine)
+    with engine.connect() as conn:
+        first, last = conn.execute(text("SELECT MIN(ts_epoch), MAX(ts_epoch) FROM snapshots")).one()
+    if last is None:
+        return {"buckets": 0, "flows": 0}
+
+    stations = get_stations(engine)
+    geometry = get_station_geometry(stations)
+    freq = f"{bucket_min}min"
+    last_bucket = wm["last_bucket_start"] if wm else None
+    baseline = wm["baseline_scraped_at"] if wm else None
+    n_buckets = n_flows = 0
+    chunk_end = to_epoch(baseline) if baseline else first
+    while True:
+        end = None
+        if chunk_days:
+            chunk_end += int(chunk_days * 86400)
+            end = from_epoch([chunk_end])[0] if chunk_end < last else None
+        status = get_status_range(baseline, end, engine=engine, compact=True)
+        if status.empty:
+            break
+        # New watermark: the newest (possibly partial) bucket and the last snapshot before it
+        times = pd.Series(status["scraped_at"].unique())
+        new_last = times.max().floor(freq)
+        new_last_epoch = to_epoch(new_last)
+        # A chunk that ends inside a collection gap holds nothing past the watermark
+        if last_bucket is None or new_last_epoch >= last_bucket:
+            earlier = times[times < new_last]
+            new_baseline = earlier.max().isoformat() if not earlier.empty else baseline
+
+            flows = infer_bucket_flows(status, stations, freq, matcher, geometry)
+            flows["bucket_start"] = _epoch_seconds(flows["bucket"])
+            if last_bucket is not None:
+                flows = flows[flows["bucket_start"] >= last_bucket]
+            rows = [
+                {**key, "bucket_start": int(b), "o": o, "d": d, "count": int(c)}
+                for b, o, d, c in flows[["bucket_start", "o", "d", "count"]].itertuples(index=False)
+            ]
+            with engine.begin() as conn:
+                if last_bucket is not None:
+                    conn.execute(
+                        text(
+                            "DELETE FROM od_flows WHERE bucket_size = :bucket_size AND matcher = :matcher "
+                            "AND bucket_start >= :since"
+                        ),
+                        {**key, "since": last_bucket},
+                    )
+                if rows:
+                    conn.execute(_INSERT_FLOW_SQL, rows)
+                conn.execute(
+                    _UPSERT_WATERMARK_SQL,
+                    {**key, "last_bucket_start": new_last_epoch, "baseline_scraped_at": new_baseline},
+                )
+            n_buckets += flows["bucket_start"].nunique()
+            n_flows += len(rows)
+            last_bucket, baseline = new_last_epoch, new_baseline
+        if end is None:
+            break
+        # Skip empty stretches: the next chunk starts at the next stored snapshot
+        with engine.connect() as conn:
+            nxt = conn.execute(
+                text("SELECT MIN(ts_epoch) FROM snapshots WHERE ts_epoch > :end"), {"end": chunk_end}
+            ).scalar()
+        if nxt is None:
+            break
+        chunk_end = max(chunk_end, nxt - int(chunk_days * 86400))
+    return {"buckets": int(n_buckets), "flows": int(n_flows), "last_bucket_start": last_bucket}
+
+
+def query_od_flows(
+    bucket_min: int,
+    matcher: str = "optimal",
+    start: str | None = None,
+    end: str | None = None,
+    top: int | None = None,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Soma dos fluxos materializados no intervalo: o, d, count (agregado indexado em SQL)."""
+    engine = engine or get_engine()
+    sql = "SELECT o, d, SUM(count) AS count FROM od_flows WHERE bucket_size = :b AND matcher = :m"
+    params: dict[str, Any] = {"b": bucket_min, "m": matcher}
+    if start:
+        sql += " AND bucket_start >= :start"
+        params["start"] = to_epoch(start)
+    if end:
+        sql += " AND bucket_start <= :end"
+        params["end"] = to_epoch(end)
+    sql += " GROUP BY o, d ORDER BY count DESC"
+    if top:
+        sql += " LIMIT :top"
+        params["top"] = top
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params)
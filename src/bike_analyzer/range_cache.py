@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .aggregates import get_station_stats
+from .config import RANGE_CACHE_MB
+from .db import get_data_stats, get_engine
+from .delta_cube import DeltaCube
+from .geo import StationGeometry
+from .od_inference import flows_from_deltas
+from .status_store import from_epoch, to_epoch
+from .streaming import StationActivity, StationMean, last_per_station, plain_ids
+from .utils import dense_state, get_status_range, read_carry_in, read_status_compact
+
+_COLUMNS = ("num_bikes_available",)
+_BLOCK = " WHERE sn.ts_epoch >= :start AND sn.ts_epoch <= :end"
+
+# Snapshots only arrive at the tail of the log (ts_epoch greater than data_stats.last_ts_epoch),
+# so a result covering [start, covered] is brought up to date by folding in the dense rows of
+# (covered, hi]; anything else (e.g. an older snapshot inserted later) drops the whole cache.
+
+
+@dataclass
+class _Entry:
+    value: Any
+    covered: int  # epoch of the last snapshot folded in (inclusive)
+    state: Any = None  # what the kind needs to extend the value
+    nbytes: int = 0
+
+
+def _nbytes(obj: Any) -> int:
+    if obj is None:
+        return 0
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(obj.memory_usage(deep=True).sum()) if isinstance(obj, pd.DataFrame) else int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, DeltaCube):
+        return obj.net.nbytes + obj.gross.nbytes + obj.first_seen.nbytes + obj.station_ids.nbytes
+    if isinstance(obj, StationMean):
+        return _nbytes(obj.sums) + _nbytes(obj.counts)
+    if isinstance(obj, StationActivity):
+        return _nbytes(obj.totals) + _nbytes(obj.last)
+    if isinstance(obj, (tuple, list)):
+        return sum(_nbytes(o) for o in obj)
+    return 0
+
+
+def _append_status(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    # Both compact frames are in time order; station_id categories are merged and kept sorted
+    if new.empty:
+        return old
+    if old.empty:
+        return new
+    ids = pd.api.types.union_categoricals([old["station_id"], new["station_id"]], sort_categories=True)
+    out = pd.concat([old.drop(columns="station_id"), new.drop(columns="station_id")], ignore_index=True)
+    out.insert(0, "station_id", ids)
+    return out[list(old.columns)]
+
+
+class RangeCache:
+    """Cache do dashboard por intervalo, atualizado pela marca d'água de ``data_stats``.
+
+    Guarda o status compacto, o ``DeltaCube``, as médias/atividade por estação e os fluxos
+    OD de cada intervalo. Quando chegam coletas novas, só as linhas posteriores à última
+    coleta coberta são lidas e somadas ao que já está em memória; um intervalo com o mesmo
+    início e fim maior (o caso do fim padrão = última coleta) também reaproveita a entrada.
+    As entradas saem por ordem de uso (LRU) quando o total passa de ``max_mb``.
+    """
+
+    def __init__(self, max_mb: float = RANGE_CACHE_MB, engine: Engine | None = None) -> None:
+        self.max_bytes = int(max_mb * 2**20)
+        self.engine = engine or get_engine()
+        # (kind, params, start, end) -> entry, least recently used first
+        self._entries: OrderedDict[tuple[Any, ...], _Entry] = OrderedDict()
+        self._lock = threading.RLock()
+        self._version: tuple[int, int | None] | None = None  # (n_snapshots, last_ts_epoch)
+        self._fresh: dict[tuple[int, int], pd.DataFrame] = {}  # new rows read in this version
+        # Dense state of every station at a covered epoch: the carry-in of the next read, so a
+        # refresh in delta storage does not scan the history for it
+        self._states: dict[int, pd.DataFrame] = {}
+        self.counters = {"hits": 0, "extends": 0, "misses": 0, "evictions": 0}
+
+    # Public results; callers must not modify the returned objects
+
+    def status(self, start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """``get_status_range(start, end, compact=True)``."""
+        return self._get("status", (), start, end, self._status_cold, self._status_extend)
+
+    def cube(self, start: str | None = None, end: str | None = None) -> DeltaCube:
+        """``DeltaCube.from_status`` sobre o status do intervalo."""
+        return self._get("cube", (), start, end, self._cube_cold, self._cube_extend)
+
+    def station_stats(self, start: str | None = None, end: str | None = None) -> pd.DataFrame:
+        """``aggregates.get_station_stats`` (station_id, avg_bikes, n_samples, activity)."""
+        mean, activity = self._get("stats", (), start, end, self._stats_cold, self._stats_extend)
+        out = mean.result().merge(activity.result(), on="station_id", how="left")
+        return pd.DataFrame(
+            {
+                "station_id": out["station_id"].to_numpy(dtype=object),
+                "avg_bikes": out["avg_bikes"].to_numpy(dtype="float64"),
+                "n_samples": out["n_samples"].to_numpy(dtype="int64"),
+                "activity": out["activity"].fillna(0).to_numpy(dtype="int64"),
+            }
+        )
+
+    def flows(
+        self,
+        geometry: StationGeometry,
+        start: str | None = None,
+        end: str | None = None,
+        bucket_min: int = 10,
+        matcher: str = "optimal",
+    ) -> pd.DataFrame:
+        """Fluxos OD somados no intervalo (o, d, count), a partir do cubo, como ``infer_flows``."""
+        params = (bucket_min, matcher, geometry.key)
+        flows = self._get(
+            "flows",
+            params,
+            start,
+            end,
+            lambda lo, hi: self._flows_cold(params, geometry, lo, hi),
+            lambda entry, lo, hi: self._flows_extend(params, geometry, entry, lo, hi),
+        )
+        return flows.groupby(["o", "d"], as_index=False)["count"].sum()
+
+    def info(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                **self.counters,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._fresh.clear()
+            self._states.clear()
+            self._version = None
+
+    # Lookup, refresh and eviction
+
+    def _get(
+        self,
+        kind: str,
+        params: tuple[Any, ...],
+        start: str | None,
+        end: str | None,
+        cold: Callable[[int | None, int], tuple[Any, Any]],
+        extend: Callable[[_Entry, int | None, int], tuple[Any, Any]],
+    ) -> Any:
+        lo = to_epoch(start) if start else None
+        req_end = to_epoch(end) if end else None
+        with self._lock:
+            last = self._check_version()
+            hi = None if last is None else last if req_end is None else min(req_end, last)
+            if hi is None or (lo is not None and hi < lo):
+                # Nothing stored in range (yet): computed on an empty span, not cached
+                return cold(lo, -1 if lo is None else lo - 1)[0]
+            key = (kind, params, lo, req_end)
+            # Any entry of the same kind and start covering up to hi or less is a prefix of this range
+            found = [
+                (k, e)
+                for k, e in self._entries.items()
+                if k[:3] == (kind, params, lo) and e.covered <= hi
+            ]
+            if found:
+                old_key, entry = max(found, key=lambda item: item[1].covered)
+                del self._entries[old_key]
+                if entry.covered < hi:
+                    entry.value, entry.state = extend(entry, lo, hi)
+                    entry.covered = hi
+                    self.counters["extends"] += 1
+                else:
+                    self.counters["hits"] += 1
+            else:
+                value, state = cold(lo, hi)
+                entry = _Entry(value, hi, state)
+                self.counters["misses"] += 1
+            entry.nbytes = _nbytes(entry.value) + _nbytes(entry.state)
+            self._entries[key] = entry
+            self._evict(keep=key)
+            covered = {e.covered for e in self._entries.values()}
+            self._states = {t: v for t, v in self._states.items() if t in covered}
+            return entry.value
+
+    def _check_version(self) -> int | None:
+        stats = get_data_stats(self.engine)
+        version = (stats["n_snapshots"], stats["last_ts_epoch"])
+        if version != self._version:
+            if self._version is not None and self._entries:
+                n_old, last_old = self._version
+                with self.engine.connect() as conn:
+                    n_new = conn.execute(
+                        text("SELECT COUNT(*) FROM snapshots WHERE ts_epoch > :t"), {"t": last_old or -1}
+                    ).scalar()
+                if version[0] - n_old != n_new:
+                    # Not a pure append: covered ranges changed
+                    self._entries.clear()
+                    self._states.clear()
+            self._fresh.clear()
+            self._version = version
+        return version[1]
+
+    def _evict(self, keep: tuple[Any, ...]) -> None:
+        total = sum(e.nbytes for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key).nbytes
+            self.counters["evictions"] += 1
+
+    def _new_rows(self, covered: int, hi: int) -> pd.DataFrame:
+        # Dense rows of (covered, hi]; read once per data version and shared by every kind
+        key = (covered, hi)
+        if key not in self._fresh:
+            carry = self._states.get(covered)
+            new = read_status_compact(self.engine, _BLOCK, {"start": covered + 1, "end": hi}, _COLUMNS, carry)
+            self._fresh[key] = new
+            if not new.empty:
+                self._states[hi] = dense_state(new, _COLUMNS)
+            elif carry is not None:
+                self._states[hi] = carry
+        return self._fresh[key]
+
+    # Kinds: cold(lo, hi) and extend(entry, lo, hi) return (value, state)
+
+    def _status_cold(self, lo: int | None, hi: int) -> tuple[pd.DataFrame, None]:
+        start = from_epoch([lo])[0] if lo is not None else None
+        status = get_status_range(start, from_epoch([hi])[0], engine=self.engine, compact=True)
+        if not status.empty:
+            self._states.setdefault(hi, dense_state(status, _COLUMNS))
+        return status, None
+
+    def _status_extend(self, entry: _Entry, lo: int | None, hi: int) -> tuple[pd.DataFrame, None]:
+        return _append_status(entry.value, self._new_rows(entry.covered, hi)), None
+
+    def _cube_cold(self, lo: int | None, hi: int) -> tuple[DeltaCube, pd.DataFrame]:
+        status = self.status(
+            from_epoch([lo])[0].isoformat() if lo is not None else None, from_epoch([hi])[0].isoformat()
+        )
+        # The last row of each station anchors the first delta of the next refresh
+        last = last_per_station(plain_ids(status[["station_id", "scraped_at", "num_bikes_available"]]))
+        return DeltaCube.from_status(status), last
+
+    def _cube_extend(self, entry: _Entry, lo: int | None, hi: int) -> tuple[DeltaCube, pd.DataFrame]:
+        new = plain_ids(self._new_rows(entry.covered, hi)[["station_id", "scraped_at", "num_bikes_available"]])
+        if new.empty:
+            return entry.value, entry.state
+        both = pd.concat([entry.state, new], ignore_index=True)
+        return entry.value.extend(both), last_per_station(both)
+
+    def _stats_cold(self, lo: int | None, hi: int) -> tuple[tuple[StationMean, StationActivity], None]:
+        start = from_epoch([lo])[0] if lo is not None else None
+        stats = get_station_stats(start, from_epoch([hi])[0], engine=self.engine).set_index("station_id")
+        mean = StationMean(_COLUMNS[0], stats["avg_bikes"] * stats["n_samples"], stats["n_samples"])
+        activity = StationActivity(_COLUMNS[0], stats["activity"])
+        if not stats.empty:
+            # Last value of each station in range, to step from on the next refresh
+            with self.engine.connect() as conn:
+                carry = read_carry_in(conn, hi + 1, _COLUMNS)
+            self._states.setdefault(hi, carry)
+            activity.last = plain_ids(carry[carry["station_id"].isin(stats.index)][["station_id", activity.column]])
+        return (mean, activity), None
+
+    def _stats_extend(
+        self, entry: _Entry, lo: int | None, hi: int
+    ) -> tuple[tuple[StationMean, StationActivity], None]:
+        new = self._new_rows(entry.covered, hi)
+        mean, activity = entry.value
+        if not new.empty:
+            mean.update(new)
+            activity.update(new)
+        return (mean, activity), None
+
+    def _flows_cold(
+        self, params: tuple[Any, ...], geometry: StationGeometry, lo: int | None, hi: int
+    ) -> tuple[pd.DataFrame, int | None]:
+        bucket_min, matcher, _ = params
+        cube = self._cube_for(lo, hi)
+        flows = flows_from_deltas(cube.bucket_deltas(bucket_min), geometry, matcher)
+        return flows, self._last_bucket(cube, bucket_min)
+
+    def _flows_extend(
+        self, params: tuple[Any, ...], geometry: StationGeometry, entry: _Entry, lo: int | None, hi: int
+    ) -> tuple[pd.DataFrame, int | None]:
+        bucket_min, matcher, _ = params
+        cube = self._cube_for(lo, hi)
+        since = entry.state
+        if since is None:
+            return self._flows_cold(params, geometry, lo, hi)
+        # The last cached window may have been partial: it is matched again with the new rows
+        deltas = cube.bucket_deltas(bucket_min)
+        cut = pd.Timestamp(since, unit="s", tz="UTC")
+        new = flows_from_deltas(deltas[deltas["bucket"] >= cut], geometry, matcher)
+        old = entry.value[entry.value["bucket"] < cut]
+        flows = pd.concat([old, new], ignore_index=True) if not old.empty else new
+        return flows, self._last_bucket(cube, bucket_min)
+
+    def _cube_for(self, lo: int | None, hi: int) -> DeltaCube:
+        return self.cube(
+            from_epoch([lo])[0].isoformat() if lo is not None else None, from_epoch([hi])[0].isoformat()
+        )
+
+    @staticmethod
+    def _last_bucket(cube: DeltaCube, bucket_min: int) -> int | None:
+        if cube.n_buckets == 0:
+            return None
+        step = bucket_min * 60
+        return int(cube.bucket_starts()[-1] // step * step)
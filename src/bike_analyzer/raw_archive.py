@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import gzip
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator
+
+import pandas as pd
+
+from .config import RAW_ARCHIVE_DIR, TIMEZONE
+
+
+def _feeds_dir(root: str | Path | None = None) -> Path:
+    return Path(root or RAW_ARCHIVE_DIR) / "gbfs"
+
+
+def _day_path(day: str, root: str | Path | None = None) -> Path:
+    return _feeds_dir(root) / f"{day}.jsonl.gz"
+
+
+def append_payload(
+    feed: str, payload: dict[str, Any], fetched_at: str | None = None, root: str | Path | None = None
+) -> Path | None:
+    """Acrescenta um payload GBFS ao arquivo bruto do dia (gzip JSONL, um arquivo por dia local).
+
+    Cada registro é um membro gzip completo gravado com uma única escrita em modo
+    append, então coletas concorrentes (threads ou processos) não se intercalam.
+    Retorna o arquivo, ou None se ``RAW_ARCHIVE_DIR`` estiver vazio (arquivo desativado).
+    """
+    if not (root or RAW_ARCHIVE_DIR):
+        return None
+    fetched_at = fetched_at or datetime.now(timezone.utc).astimezone().isoformat(timespec="seconds")
+    day = pd.Timestamp(fetched_at).tz_convert(TIMEZONE).strftime("%Y-%m-%d")
+    path = _day_path(day, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps({"feed": feed, "fetched_at": fetched_at, "payload": payload}, separators=(",", ":"))
+    with open(path, "ab") as f:
+        f.write(gzip.compress(line.encode("utf-8") + b"\n", compresslevel=6))
+    return path
+
+
+def raw_days(root: str | Path | None = None) -> list[str]:
+    """Dias (YYYY-MM-DD, data local em TIMEZONE) com payloads arquivados."""
+    d = _feeds_dir(root)
+    if not d.exists():
+        return []
+    return sorted(p.name[: -len(".jsonl.gz")] for p in d.glob("*.jsonl.gz"))
+
+
+def read_day(day: str, root: str | Path | None = None) -> list[dict[str, Any]]:
+    """Registros (feed, fetched_at, payload) de um dia, na ordem em que foram coletados.
+
+    Um registro final truncado (processo interrompido no meio da escrita) é ignorado.
+    """
+    records = []
+    try:
+        with gzip.open(_day_path(day, root), "rt", encoding="utf-8") as f:
+            for line in f:
+                records.append(json.loads(line))
+    except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+        pass
+    return records
+
+
+def select_days(start: str | None = None, end: str | None = None, root: str | Path | None = None) -> list[str]:
+    return [d for d in raw_days(root) if (start is None or d >= start) and (end is None or d <= end)]
+
+
+def iter_payloads(
+    start: str | None = None, end: str | None = None, root: str | Path | None = None
+) -> Iterator[dict[str, Any]]:
+    """Registros dos dias ``start``..``end`` (inclusive), em ordem de coleta."""
+    for day in select_days(start, end, root):
+        yield from read_day(day, root)
+
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .config import DEFAULT_SYSTEM_ID, ROLLUP_MAX_GAP_MIN, TIMEZONE
+from .db import get_engine, init_db
+from .features import update_features
+from .status_store import from_epoch
+from .systems import station_systems
+from .utils import get_status_range
+
+_UPSERT_ROLLUP = """
+    INSERT INTO {table} (
+      station_id, {key}, n_samples, sum_bikes, min_bikes, max_bikes, activity, empty_min, full_min
+    ) VALUES (
+      :station_id, :{key}, :n_samples, :sum_bikes, :min_bikes, :max_bikes, :activity, :empty_min, :full_min
+    )
+    ON CONFLICT(station_id, {key}) DO UPDATE SET
+      n_samples = n_samples + excluded.n_samples,
+      sum_bikes = sum_bikes + excluded.sum_bikes,
+      min_bikes = COALESCE(MIN(min_bikes, excluded.min_bikes), min_bikes, excluded.min_bikes),
+      max_bikes = COALESCE(MAX(max_bikes, excluded.max_bikes), max_bikes, excluded.max_bikes),
+      activity = activity + excluded.activity,
+      empty_min = empty_min + excluded.empty_min,
+      full_min = full_min + excluded.full_min
+    ;
+"""
+_UPSERT_HOURLY_SQL = text(_UPSERT_ROLLUP.format(table="station_hourly", key="hour"))
+_UPSERT_DAILY_SQL = text(_UPSERT_ROLLUP.format(table="station_daily", key="day"))
+
+_STATE = ["num_bikes_available", "num_docks_available"]
+_SAMPLE_NUMERIC = (*_STATE, "prev_bikes", "prev_docks", "gap_min")
+
+
+def hour_key(ts: str | pd.Timestamp) -> str:
+    """'YYYY-MM-DDTHH:00' no horário local (TIMEZONE) de ``ts``, mesmo formato de weather_hourly.time."""
+    t = pd.Timestamp(ts)
+    if t.tzinfo is not None:
+        t = t.tz_convert(TIMEZONE)
+    return t.strftime("%Y-%m-%dT%H:00")
+
+
+def _aggregate(samples: pd.DataFrame, key: str) -> list[dict[str, Any]]:
+    # samples: station_id, scraped_at (tz-aware datetime64), num_bikes_available, num_docks_available,
+    # prev_bikes, prev_docks, gap_min (minutes since the previous snapshot, NaN for the first one)
+    local = samples["scraped_at"].dt.tz_convert(TIMEZONE).dt.tz_localize(None)
+    keys = local.dt.floor("h" if key == "hour" else "D")
+    # The interval since the previous snapshot is charged to the state seen at that snapshot,
+    # in the hour/day of the current one; long collection gaps are capped
+    num = {c: pd.to_numeric(samples[c], errors="coerce") for c in _SAMPLE_NUMERIC}
+    dt = num["gap_min"].clip(upper=ROLLUP_MAX_GAP_MIN).fillna(0.0)
+    bikes = num["num_bikes_available"]
+    docks = num["num_docks_available"]
+    activity = (bikes - num["prev_bikes"]).abs().fillna(0)
+    empty_min = dt.where(num["prev_bikes"] == 0, 0.0)
+    full_min = dt.where(num["prev_docks"] == 0, 0.0)
+    fmt = "%Y-%m-%dT%H:00" if key == "hour" else "%Y-%m-%d"
+    if samples["station_id"].is_unique:
+        # One snapshot (the ingest path): every row is its own group, skip the groupby
+        labels = {k: k.strftime(fmt) for k in keys.unique()}
+        return [
+            {
+                "station_id": sid,
+                key: labels[k],
+                "n_samples": 0 if np.isnan(b) else 1,
+                "sum_bikes": 0 if np.isnan(b) else int(b),
+                "min_bikes": None if np.isnan(b) else int(b),
+                "max_bikes": None if np.isnan(b) else int(b),
+                "sum_docks": 0 if np.isnan(b) or np.isnan(d) else int(d),
+                "min_docks": None if np.isnan(d) else int(d),
+                "max_docks": None if np.isnan(d) else int(d),
+                "activity": int(a),
+                "empty_min": float(e),
+                "full_min": float(f),
+            }
+            for sid, k, b, d, a, e, f in zip(
+                samples["station_id"].tolist(),
+                keys.tolist(),
+                bikes.to_numpy(dtype=float),
+                docks.to_numpy(dtype=float),
+                activity.tolist(),
+                empty_min.tolist(),
+                full_min.tolist(),
+            )
+        ]
+    df = pd.DataFrame(
+        {
+            "station_id": samples["station_id"],
+            key: keys,
+            "bikes": bikes,
+            # Docks summed over the same samples as bikes, so sum_docks / n_samples is their mean
+            "docks_sampled": docks.where(bikes.notna()),
+            "docks": docks,
+            "activity": activity,
+            "empty_min": empty_min,
+            "full_min": full_min,
+        }
+    )
+    agg = df.groupby(["station_id", key], as_index=False, sort=False).agg(
+        n_samples=("bikes", "count"),
+        sum_bikes=("bikes", "sum"),
+        min_bikes=("bikes", "min"),
+        max_bikes=("bikes", "max"),
+        sum_docks=("docks_sampled", "sum"),
+        min_docks=("docks", "min"),
+        max_docks=("docks", "max"),
+        activity=("activity", "sum"),
+        empty_min=("empty_min", "sum"),
+        full_min=("full_min", "sum"),
+    )
+    agg[key] = agg[key].dt.strftime(fmt)
+    agg = agg.astype({"n_samples": "int64", "sum_bikes": "int64", "sum_docks": "int64", "activity": "int64"})
+    for c in ("min_bikes", "max_bikes", "min_docks", "max_docks"):
+        agg[c] = pd.Series([None if pd.isna(v) else int(v) for v in agg[c]], index=agg.index, dtype=object)
+    return agg.to_dict(orient="records")
+
+
+def update_rollups(conn: Connection, samples: pd.DataFrame) -> int:
+    """Soma as amostras em station_hourly/station_daily e station_features (na transação de ``conn``)."""
+    if samples.empty:
+        return 0
+    hourly = _aggregate(samples, "hour")
+    conn.execute(_UPSERT_HOURLY_SQL, hourly)
+    conn.execute(_UPSERT_DAILY_SQL, _aggregate(samples, "day"))
+    update_features(conn, hourly)
+    return len(hourly)
+
+
+def rebuild_rollups(chunk_days: float = 7.0, engine: Engine | None = None) -> dict[str, Any]:
+    """Recalcula station_hourly/station_daily/station_features a partir do histórico bruto, em blocos de ``chunk_days``.
+
+    Usa a mesma regra da ingestão (estado anterior da estação e intervalo até o
+    snapshot anterior do seu sistema, em ``snapshot_systems``), então o resultado
+    é igual ao mantido incrementalmente.
+    """
+    engine = engine or get_engine()
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM station_hourly"))
+        conn.execute(text("DELETE FROM station_daily"))
+        conn.execute(text("DELETE FROM station_features"))
+        epochs = [r[0] for r in conn.execute(text("SELECT ts_epoch FROM snapshots ORDER BY ts_epoch"))]
+        seen = pd.read_sql(
+            text("SELECT system_id, ts_epoch FROM snapshot_systems ORDER BY system_id, ts_epoch"), conn
+        )
+    if not epochs:
+        return {"snapshots": 0, "hours": 0, "days": 0}
+
+    times = pd.Series(from_epoch(epochs))
+    # Each system's samples are charged the interval since that system's previous collection
+    seen["gap_min"] = seen.groupby("system_id")["ts_epoch"].diff() / 60
+    systems = set(seen["system_id"]) | {DEFAULT_SYSTEM_ID}
+    chunk = ((times - times.iloc[0]) // pd.Timedelta(days=chunk_days)).to_numpy()
+    edges = np.r_[np.flatnonzero(np.r_[True, chunk[1:] != chunk[:-1]]), len(times)]
+    for a, b in zip(edges[:-1], edges[1:]):
+        lo, hi = epochs[a], epochs[b - 1]
+        # Load from the earliest previous collection of the systems in the chunk, so its
+        # first samples have a previous state
+        in_chunk = seen["system_id"][(seen["ts_epoch"] >= lo) & (seen["ts_epoch"] <= hi)].unique()
+        before = seen[seen["system_id"].isin(in_chunk) & (seen["ts_epoch"] < lo)]
+        start_epoch = int(before.groupby("system_id")["ts_epoch"].max().min()) if len(before) else lo
+        df = get_status_range(from_epoch([start_epoch])[0], times.iloc[b - 1], engine=engine, columns=_STATE)
+        df = df.sort_values(["station_id", "scraped_at"], kind="stable")
+        prev = df.groupby("station_id")[_STATE].shift()
+        df = df.assign(
+            prev_bikes=prev["num_bikes_available"],
+            prev_docks=prev["num_docks_available"],
+            system_id=station_systems(df["station_id"], systems),
+            ts_epoch=(df["scraped_at"] - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1),
+        )
+        # Keep only the rows of systems collected in each snapshot (the delta view carries
+        # every station through all snapshots)
+        df = df[df["ts_epoch"] >= lo].merge(seen, on=["system_id", "ts_epoch"], how="inner")
+        with engine.begin() as conn:
+            update_rollups(conn, df)
+    with engine.connect() as conn:
+        hours = conn.execute(text("SELECT COUNT(*) FROM station_hourly")).scalar() or 0
+        days = conn.execute(text("SELECT COUNT(*) FROM station_daily")).scalar() or 0
+    return {"snapshots": len(times), "hours": int(hours), "days": int(days)}
+
+
+def _range_filter(column: str, start: str | None, end: str | None) -> tuple[str, dict[str, str]]:
+    where: list[str] = []
+    params: dict[str, str] = {}
+    if start:
+        where.append(f"{column} >= :start")
+        params["start"] = hour_key(start)
+    if end:
+        where.append(f"{column} <= :end")
+        params["end"] = hour_key(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def get_station_summary(
+    start: str | None = None, end: str | None = None, engine: Engine | None = None
+) -> pd.DataFrame:
+    """Por estação, a partir de station_hourly: avg_bikes, min/max, activity, empty_min, full_min."""
+    engine = engine or get_engine()
+    cond, params = _range_filter("hour", start, end)
+    sql = (
+        "SELECT station_id, SUM(sum_bikes) * 1.0 / NULLIF(SUM(n_samples), 0) AS avg_bikes, "
+        "MIN(min_bikes) AS min_bikes, MAX(max_bikes) AS max_bikes, SUM(activity) AS activity, "
+        "SUM(empty_min) AS empty_min, SUM(full_min) AS full_min "
+        "FROM station_hourly" + cond + " GROUP BY station_id"
+    )
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params)
+
+
+def get_hour_of_day_profile(
+    start: str | None = None, end: str | None = None, engine: Engine | None = None
+) -> pd.DataFrame:
+    """Por hora do dia (0-23): média de bikes por estação e minutos vazias/cheias somados na rede."""
+    engine = engine or get_engine()
+    cond, params = _range_filter("hour", start, end)
+    sql = (
+        "SELECT CAST(SUBSTR(hour, 12, 2) AS INTEGER) AS hora, "
+        "SUM(sum_bikes) * 1.0 / NULLIF(SUM(n_samples), 0) AS media_bikes, "
+        "SUM(empty_min) AS empty_min, SUM(full_min) AS full_min "
+        "FROM station_hourly" + cond + " GROUP BY hora ORDER BY hora"
+    )
+    with engine.connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params)
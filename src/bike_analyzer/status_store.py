@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import TIMEZONE
+from .db import get_engine, init_db, refresh_data_stats
+
+# Columns that make up a station's state (same set as station_status_latest)
+STATE_COLUMNS = (
+    "num_bikes_available",
+    "num_bikes_disabled",
+    "num_docks_available",
+    "num_docks_disabled",
+    "is_installed",
+    "is_renting",
+    "is_returning",
+)
+
+# A station that left the feed gets a tombstone: a station_status row with every state
+# column NULL, in the first snapshot of its system without it. Not counted in
+# snapshots.n_rows; readers select this flag to stop carrying the station
+REMOVED_SQL = "(" + " AND ".join(f"{c} IS NULL" for c in STATE_COLUMNS) + ")"
+
+# Status rows with their snapshot time (sn.ts_epoch); append a WHERE on sn.ts_epoch
+STATUS_FROM_SQL = " FROM snapshots sn JOIN station_status st ON st.snapshot_id = sn.snapshot_id"
+
+# Last stored row per station strictly before :start (epoch seconds), the carry-in state
+# for delta storage; {columns} is filled with the requested state columns. Tombstones are
+# kept (removed = 1) so they still win over older archived rows when both are merged
+CARRY_IN_SQL = """
+    SELECT station_id, ts_epoch, {columns}, """ + REMOVED_SQL + """ AS removed
+    FROM (
+      SELECT st.*, sn.ts_epoch,
+             ROW_NUMBER() OVER (PARTITION BY st.station_id ORDER BY sn.ts_epoch DESC, st.id DESC) AS rn
+      FROM station_status st
+      JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id
+      WHERE sn.ts_epoch < :start
+    )
+    WHERE rn = 1
+"""
+
+
+# Dtypes of the compact loader (utils.get_status_range(compact=True)); columns with NULLs
+# become the masked pandas variant (Int16/Int8/Int64)
+COMPACT_DTYPES: dict[str, Any] = {
+    "num_bikes_available": np.int16,
+    "num_bikes_disabled": np.int16,
+    "num_docks_available": np.int16,
+    "num_docks_disabled": np.int16,
+    "is_installed": np.int8,
+    "is_renting": np.int8,
+    "is_returning": np.int8,
+    "last_reported": np.int64,
+}
+
+
+def to_epoch(ts: Any) -> int:
+    """ISO (com ou sem offset; sem offset = horário local de TIMEZONE) ou Timestamp -> epoch segundos."""
+    t = pd.Timestamp(ts)
+    if t.tzinfo is None:
+        t = t.tz_localize(TIMEZONE)
+    return int(t.timestamp())
+
+
+def from_epoch(epoch: Any) -> pd.DatetimeIndex:
+    """Epoch segundos -> datetime64 com fuso TIMEZONE."""
+    return pd.to_datetime(np.asarray(epoch, dtype="int64"), unit="s", utc=True).tz_convert(TIMEZONE)
+
+
+def densify_status(
+    rows: pd.DataFrame,
+    carry: pd.DataFrame,
+    snapshot_times: Iterable[Any],
+    columns: Sequence[str] = ("num_bikes_available",),
+) -> pd.DataFrame:
+    """Reconstrói a visão densa (uma linha por estação e snapshot) a partir de linhas de mudança.
+
+    ``carry`` traz o último estado de cada estação antes do intervalo; cada estação é
+    propagada (forward-fill) para todos os snapshots posteriores à sua primeira aparição,
+    até uma linha de remoção (coluna ``removed`` de ``rows``, quando presente).
+    """
+    times = pd.Index(list(snapshot_times), name="scraped_at")
+    cols = ["station_id", "scraped_at", *columns]
+    removed = rows["removed"].to_numpy(dtype=bool) if "removed" in rows else np.zeros(len(rows), dtype=bool)
+    frames = pd.concat([carry[cols], rows[cols]], ignore_index=True)
+    if frames.empty or times.empty:
+        return rows[cols].iloc[0:0]
+    is_removed = np.r_[np.zeros(len(carry), dtype=bool), removed]
+    # Pivot row positions instead of values so any number of state columns is filled in one pass
+    frames["_row"] = np.arange(len(frames))
+    wide = frames.pivot_table(index="scraped_at", columns="station_id", values="_row", aggfunc="last")
+    wide = wide.reindex(wide.index.union(times)).ffill().reindex(times)
+    dense = (
+        wide.reset_index()
+        .melt(id_vars="scraped_at", var_name="station_id", value_name="_row")
+        .dropna(subset=["_row"])
+        .sort_values(["scraped_at", "station_id"], kind="stable")
+    )
+    # A station whose newest row is its tombstone is out of the feed at that snapshot
+    src = dense["_row"].to_numpy(dtype=np.int64)
+    keep = ~is_removed[src]
+    dense, src = dense[keep], src[keep]
+    out = frames[list(columns)].iloc[src].reset_index(drop=True)
+    out.insert(0, "scraped_at", dense["scraped_at"].to_numpy())
+    out.insert(0, "station_id", dense["station_id"].to_numpy())
+    for c in columns:
+        if out[c].notna().all():
+            out[c] = out[c].astype("int64")
+    return out
+
+
+def dense_positions(
+    codes: np.ndarray, snap: np.ndarray, n_snapshots: int, n_codes: int, removed: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """Versão em arrays de ``densify_status`` para linhas já codificadas.
+
+    ``codes`` é o código da estação de cada linha e ``snap`` o índice do snapshot dela
+    (-1 para o estado anterior ao intervalo), com as linhas em ordem de tempo; ``removed``
+    marca as linhas de remoção. Retorna, para cada linha da visão densa, a linha de origem
+    e o índice do snapshot, ordenadas por snapshot e código.
+    """
+    bounds = np.searchsorted(snap, np.arange(-1, n_snapshots + 1))
+    first = np.full(n_codes, n_snapshots, dtype=np.int64)
+    np.minimum.at(first, codes, np.maximum(snap, 0))
+    n_out = int((n_snapshots - first).sum())
+    src = np.empty(n_out, dtype=np.int64)
+    out_snap = np.empty(n_out, dtype=np.int32)
+    # state[code] = newest row of the station so far; one pass over the snapshots
+    state = np.full(n_codes, -1, dtype=np.int64)
+    state[codes[: bounds[1]]] = np.arange(bounds[1])
+    p = 0
+    for k in range(n_snapshots):
+        a, b = bounds[k + 1], bounds[k + 2]
+        state[codes[a:b]] = np.arange(a, b)
+        live = state[state >= 0]
+        if removed is not None:
+            live = live[~removed[live]]
+        src[p : p + len(live)] = live
+        out_snap[p : p + len(live)] = k
+        p += len(live)
+    # Tombstones make n_out an upper bound
+    return src[:p], out_snap[:p]
+
+
+def db_size(engine: Engine) -> int:
+    """Tamanho do arquivo SQLite em bytes (page_count x page_size)."""
+    with engine.connect() as conn:
+        page_count = conn.execute(text("PRAGMA page_count")).scalar() or 0
+        page_size = conn.execute(text("PRAGMA page_size")).scalar() or 0
+    return int(page_count * page_size)
+
+
+# Tombstones for history stored in full: a station with a row in one snapshot of its system
+# and none in the next one (itself stored in full) left the feed there
+_BACKFILL_TOMBSTONES_SQL = text(
+    """
+    INSERT INTO station_status (station_id, snapshot_id, system_id)
+    SELECT g.station_id, g.next_id, g.system_id
+    FROM (
+      SELECT st.station_id, st.system_id, (
+        SELECT ss.snapshot_id FROM snapshot_systems ss
+        WHERE ss.system_id = st.system_id AND ss.ts_epoch > sn.ts_epoch
+        ORDER BY ss.ts_epoch LIMIT 1
+      ) AS next_id
+      FROM station_status st
+      JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id
+      WHERE NOT """ + REMOVED_SQL + """
+    ) g
+    JOIN snapshots nx ON nx.snapshot_id = g.next_id
+    WHERE nx.n_rows = nx.n_stations
+      AND NOT EXISTS (
+        SELECT 1 FROM station_status s2 WHERE s2.snapshot_id = g.next_id AND s2.station_id = g.station_id
+      )
+    """
+)
+
+
+def compact_status(engine: Engine | None = None) -> dict[str, Any]:
+    """Migra station_status para o modo delta: remove linhas idênticas à anterior da mesma estação.
+
+    O log de snapshots é preenchido antes (via ``init_db``), então a visão densa continua
+    reconstruível. Estações que saíram do feed em coletas gravadas completas recebem antes
+    a linha de remoção, para não serem propagadas depois disso. Retorna contagens e
+    tamanho do arquivo antes/depois do VACUUM.
+    """
+    engine = engine or get_engine()
+    init_db(engine)
+    bytes_before = db_size(engine)
+    with engine.begin() as conn:
+        rows_before = conn.execute(text("SELECT COUNT(*) FROM station_status")).scalar() or 0
+        conn.execute(_BACKFILL_TOMBSTONES_SQL)
+        conn.execute(
+            text(
+                """
+                DELETE FROM station_status WHERE id IN (
+                  SELECT id FROM (
+                    SELECT
+                      st.id,
+                      ROW_NUMBER() OVER w AS rn,
+                      num_bikes_available IS LAG(num_bikes_available) OVER w
+                        AND num_bikes_disabled IS LAG(num_bikes_disabled) OVER w
+                        AND num_docks_available IS LAG(num_docks_available) OVER w
+                        AND num_docks_disabled IS LAG(num_docks_disabled) OVER w
+                        AND is_installed IS LAG(is_installed) OVER w
+                        AND is_renting IS LAG(is_renting) OVER w
+                        AND is_returning IS LAG(is_returning) OVER w AS same
+                    FROM station_status st
+                    JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id
+                    WINDOW w AS (PARTITION BY st.station_id ORDER BY sn.ts_epoch, st.id)
+                  )
+                  WHERE rn > 1 AND same
+                )
+                """
+            )
+        )
+        rows_after = conn.execute(text("SELECT COUNT(*) FROM station_status")).scalar() or 0
+        # Days already moved to the Parquet archive keep their counts
+        conn.execute(
+            text(
+                """
+                UPDATE snapshots SET n_rows = 0
+                WHERE ts_epoch >= (
+                  SELECT MIN(sn.ts_epoch) FROM station_status st JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id
+                )
+                """
+            )
+        )
+        conn.execute(
+            text(
+                """
+                UPDATE snapshots SET n_rows = c.n
+                FROM (
+                  SELECT snapshot_id, COUNT(*) AS n FROM station_status WHERE NOT """ + REMOVED_SQL + """ GROUP BY snapshot_id
+                ) c
+                WHERE c.snapshot_id = snapshots.snapshot_id
+                """
+            )
+        )
+        refresh_data_stats(conn)
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+    bytes_after = db_size(engine)
+    return {
+        "rows_before": rows_before,
+        "rows_after": rows_after,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "reduction_pct": round(100.0 * (1 - bytes_after / bytes_before), 1) if bytes_before else 0.0,
+    }
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+from .geo import StationGeometry
+from .od_inference import MATCHERS, bucket_deltas, flows_from_deltas
+
+# Online versions of the status aggregations: feed the chunks of utils.iter_status_range
+# (time-ordered) to update(); memory stays O(stations), whatever the length of the range.
+
+
+def last_per_station(df: pd.DataFrame) -> pd.DataFrame:
+    """Última linha de cada estação; com as linhas em ordem de tempo, o estado mais novo."""
+    return df.drop_duplicates("station_id", keep="last")
+
+
+def plain_ids(chunk: pd.DataFrame) -> pd.DataFrame:
+    """``chunk`` com station_id em object: as categorias mudam entre blocos e ids simples concatenam sem recodificar."""
+    return chunk.assign(station_id=chunk["station_id"].astype(object))
+
+
+@dataclass
+class StationMean:
+    """Média de bikes por estação (station_id, avg_bikes, n_samples)."""
+
+    column: str = "num_bikes_available"
+    sums: pd.Series = field(default_factory=lambda: pd.Series(dtype="float64"))
+    counts: pd.Series = field(default_factory=lambda: pd.Series(dtype="int64"))
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        g = chunk.groupby("station_id", observed=True)[self.column]
+        self.sums = self.sums.add(g.sum().astype("float64"), fill_value=0)
+        self.counts = self.counts.add(g.count(), fill_value=0)
+
+    def result(self) -> pd.DataFrame:
+        out = pd.DataFrame({"avg_bikes": self.sums / self.counts, "n_samples": self.counts.astype("int64")})
+        return out.rename_axis("station_id").reset_index()
+
+
+@dataclass
+class StationActivity:
+    """Proxy de uso por estação: soma das variações absolutas entre coletas (station_id, activity).
+
+    O último valor de cada estação fica guardado entre blocos, então a variação que
+    atravessa a fronteira de um bloco também é contada.
+    """
+
+    column: str = "num_bikes_available"
+    totals: pd.Series = field(default_factory=lambda: pd.Series(dtype="int64"))
+    last: pd.DataFrame | None = None
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        df = plain_ids(chunk[["station_id", self.column]])
+        both = df if self.last is None else pd.concat([self.last, df], ignore_index=True)
+        moved = both.groupby("station_id")[self.column].diff().abs()
+        self.totals = self.totals.add(moved.groupby(both["station_id"]).sum(), fill_value=0)
+        self.last = last_per_station(both)
+
+    def result(self) -> pd.DataFrame:
+        return self.totals.astype("int64").rename("activity").rename_axis("station_id").reset_index()
+
+
+@dataclass
+class BucketDeltas:
+    """``od_inference.bucket_deltas`` em blocos: ``update`` devolve as janelas já fechadas.
+
+    As linhas da última janela de cada bloco (possivelmente incompleta) esperam o bloco
+    seguinte; ``flush`` devolve a janela que sobrar no fim. Concatenadas, as saídas são
+    iguais a ``bucket_deltas`` sobre o intervalo inteiro.
+    """
+
+    freq: str = "10min"
+    tail: pd.DataFrame | None = None  # rows of the open window
+    last: pd.DataFrame | None = None  # last row per station in the windows already emitted
+
+    def update(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        df = plain_ids(chunk[["station_id", "scraped_at", "num_bikes_available"]])
+        if self.tail is not None:
+            df = pd.concat([self.tail, df], ignore_index=True)
+        cut = df["scraped_at"].iloc[-1].floor(self.freq)
+        closed = df["scraped_at"] < cut
+        self.tail = df[~closed]
+        return self._emit(df[closed])
+
+    def flush(self) -> pd.DataFrame:
+        tail, self.tail = self.tail, None
+        return self._emit(tail if tail is not None else pd.DataFrame())
+
+    def _emit(self, done: pd.DataFrame) -> pd.DataFrame:
+        if done.empty:
+            return pd.DataFrame({"station_id": [], "bucket": pd.Series(dtype="datetime64[s]"), "delta": []})
+        first_bucket = done["scraped_at"].iloc[0].floor(self.freq)
+        both = done if self.last is None else pd.concat([self.last, done], ignore_index=True)
+        out = bucket_deltas(both, self.freq)
+        self.last = last_per_station(both)
+        # The carried rows only anchor the first delta of each station
+        return out[out["bucket"] >= first_bucket].reset_index(drop=True)
+
+
+def iter_bucket_deltas(chunks: Iterable[pd.DataFrame], freq: str = "10min") -> Iterator[pd.DataFrame]:
+    """Deltas por janela (station_id, bucket, delta) de cada bloco, só com janelas completas."""
+    acc = BucketDeltas(freq)
+    for chunk in chunks:
+        yield acc.update(chunk)
+    yield acc.flush()
+
+
+@dataclass
+class FlowTotals:
+    """Fluxos OD somados no intervalo (o, d, count), janela a janela, como ``infer_flows``."""
+
+    geometry: StationGeometry
+    freq: str = "10min"
+    matcher: str = "optimal"
+    workers: int = 1
+    totals: pd.Series | None = None  # count by (o, d)
+    deltas: BucketDeltas = field(init=False)
+
+    def __post_init__(self) -> None:
+        MATCHERS[self.matcher]  # fail fast on unknown matcher
+        self.deltas = BucketDeltas(self.freq)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self._add(self.deltas.update(chunk))
+
+    def result(self) -> pd.DataFrame:
+        self._add(self.deltas.flush())
+        if self.totals is None:
+            return pd.DataFrame({"o": pd.Series(dtype=object), "d": pd.Series(dtype=object), "count": []}).astype(
+                {"count": "int64"}
+            )
+        return self.totals.astype("int64").rename("count").reset_index()
+
+    def _add(self, deltas: pd.DataFrame) -> None:
+        if deltas.empty:
+            return
+        flows = flows_from_deltas(deltas, self.geometry, self.matcher, self.workers)
+        counts = flows.groupby(["o", "d"])["count"].sum()
+        self.totals = counts if self.totals is None else self.totals.add(counts, fill_value=0)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Iterable
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .config import DEFAULT_SYSTEM_ID
+from .db import get_engine, init_db
+
+
+@dataclass
+class System:
+    """Um sistema GBFS do registro (tabela ``systems``), com o intervalo de polling permitido em segundos."""
+
+    system_id: str
+    auto_discovery_url: str
+    name: str | None = None
+    min_interval: float = 10.0
+    max_interval: float = 300.0
+    enabled: bool = True
+
+
+_UPSERT_SYSTEM_SQL = text(
+    """
+    INSERT INTO systems (system_id, name, auto_discovery_url, min_interval, max_interval, enabled)
+    VALUES (:system_id, :name, :auto_discovery_url, :min_interval, :max_interval, :enabled)
+    ON CONFLICT(system_id) DO UPDATE SET
+      name=excluded.name,
+      auto_discovery_url=excluded.auto_discovery_url,
+      min_interval=excluded.min_interval,
+      max_interval=excluded.max_interval,
+      enabled=excluded.enabled
+    ;
+    """
+)
+
+
+def station_key(system_id: str, station_id: str) -> str:
+    """station_id gravado na base: o do feed no sistema padrão, ``"<system_id>:<station_id>"`` nos demais."""
+    return station_id if system_id == DEFAULT_SYSTEM_ID else f"{system_id}:{station_id}"
+
+
+def station_systems(station_ids: pd.Series, system_ids: Iterable[str]) -> pd.Series:
+    """system_id de cada station_id gravado (inverso de ``station_key``), dados os sistemas registrados."""
+    ids = station_ids.astype(str)
+    prefix = ids.str.split(":", n=1).str[0]
+    own = ids.str.contains(":", regex=False) & prefix.isin(set(system_ids) - {DEFAULT_SYSTEM_ID})
+    return prefix.where(own, DEFAULT_SYSTEM_ID)
+
+
+def get_systems(enabled_only: bool = True, engine: Engine | None = None) -> list[System]:
+    """Sistemas registrados (por padrão só os habilitados), em ordem de system_id."""
+    engine = engine or get_engine()
+    init_db(engine)
+    sql = "SELECT system_id, auto_discovery_url, name, min_interval, max_interval, enabled FROM systems"
+    if enabled_only:
+        sql += " WHERE enabled = 1"
+    with engine.connect() as conn:
+        rows = conn.execute(text(sql + " ORDER BY system_id")).all()
+    return [System(r[0], r[1], r[2], float(r[3]), float(r[4]), bool(r[5])) for r in rows]
+
+
+def add_system(system: System, engine: Engine | None = None) -> None:
+    """Registra ``system`` (ou atualiza o registro com o mesmo system_id)."""
+    if ":" in system.system_id:
+        raise ValueError("system_id não pode conter ':' (separador de station_key)")
+    if system.min_interval <= 0 or system.max_interval < system.min_interval:
+        raise ValueError("Intervalos inválidos: é preciso 0 < min_interval <= max_interval")
+    engine = engine or get_engine()
+    init_db(engine)
+    with engine.begin() as conn:
+        conn.execute(_UPSERT_SYSTEM_SQL, {**asdict(system), "enabled": int(system.enabled)})
+
+
+def set_system_enabled(system_id: str, enabled: bool, engine: Engine | None = None) -> bool:
+    """Habilita/desabilita a coleta de um sistema (os dados já gravados ficam); False se não existe."""
+    engine = engine or get_engine()
+    init_db(engine)
+    with engine.begin() as conn:
+        res = conn.execute(
+            text("UPDATE systems SET enabled = :e WHERE system_id = :s"), {"e": int(enabled), "s": system_id}
+        )
+    return bool(res.rowcount)
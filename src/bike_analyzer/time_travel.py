@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+from .archive import read_archive
+from .config import KEYFRAME_EVERY_MIN
+from .db import get_engine, init_db
+from .status_store import REMOVED_SQL, STATE_COLUMNS, STATUS_FROM_SQL, from_epoch, to_epoch
+from .utils import read_carry_in
+
+_COLS = ", ".join(STATE_COLUMNS)
+
+_KEYFRAME_FROM_LATEST_SQL = text(
+    f"""
+    INSERT OR REPLACE INTO status_keyframes (ts_epoch, station_id, {_COLS})
+    SELECT :ts_epoch, station_id, {_COLS} FROM station_status_latest
+    ;
+    """
+)
+
+_INSERT_KEYFRAME_SQL = text(
+    f"""
+    INSERT OR REPLACE INTO status_keyframes (ts_epoch, station_id, {_COLS})
+    VALUES (:ts_epoch, :station_id, {", ".join(f":{c}" for c in STATE_COLUMNS)})
+    ;
+    """
+)
+
+# Keyframes replayed per block by build_keyframes
+_BLOCK_KEYFRAMES = 24
+
+
+def write_keyframe(conn: Connection, ts_epoch: int, every_min: float = KEYFRAME_EVERY_MIN) -> bool:
+    """Grava o keyframe da coleta ``ts_epoch`` se ela abriu um novo intervalo de ``every_min`` minutos.
+
+    Chamada pela ingestão na mesma transação do snapshot, logo depois de atualizar
+    ``station_status_latest``: o estado da rede nessa coleta é uma cópia dessa tabela.
+    """
+    step = int(every_min * 60)
+    last = conn.execute(text("SELECT MAX(ts_epoch) FROM status_keyframes")).scalar()
+    if last is not None and ts_epoch // step <= last // step:
+        return False
+    conn.execute(_KEYFRAME_FROM_LATEST_SQL, {"ts_epoch": ts_epoch})
+    return True
+
+
+def _changes(conn: Connection, after: int | None, upto: int, columns: Sequence[str]) -> pd.DataFrame:
+    # Rows written in (after, upto], in time order: station_id, ts_epoch, columns and the
+    # tombstone flag. In delta mode these are only the changes; archived days come first
+    # since they are all older
+    cond = " WHERE sn.ts_epoch <= :upto" + (" AND sn.ts_epoch > :after" if after is not None else "")
+    sql = (
+        f"SELECT st.station_id, sn.ts_epoch, {', '.join(f'st.{c}' for c in columns)}, "
+        + REMOVED_SQL + " AS removed" + STATUS_FROM_SQL + cond
+    )
+    df = pd.read_sql(text(sql + " ORDER BY sn.ts_epoch, st.id"), conn, params={"after": after, "upto": upto})
+    archived = read_archive(after + 1 if after is not None else None, upto, columns, removed=True)
+    if archived is not None and not archived.empty:
+        archived = archived.sort_values("ts_epoch", kind="stable")
+        df = pd.concat([archived, df], ignore_index=True) if not df.empty else archived.reset_index(drop=True)
+    return df.astype({"removed": bool})
+
+
+def _last(parts: Sequence[pd.DataFrame], columns: Sequence[str]) -> pd.DataFrame:
+    # Last row of each station across the time-ordered parts, without the stations whose
+    # last row is a tombstone
+    parts = [p.reindex(columns=["station_id", *columns, "removed"]) for p in parts if p is not None and not p.empty]
+    if not parts:
+        return pd.DataFrame({"station_id": pd.Series(dtype=object), **{c: pd.Series(dtype="Int64") for c in columns}})
+    last = pd.concat(parts, ignore_index=True).drop_duplicates("station_id", keep="last")
+    return last[~last.pop("removed").fillna(False).astype(bool).to_numpy()]
+
+
+def _keyframe_before(conn: Connection, ts_epoch: int, columns: Sequence[str]) -> tuple[int | None, pd.DataFrame | None]:
+    k = conn.execute(
+        text("SELECT MAX(ts_epoch) FROM status_keyframes WHERE ts_epoch <= :t"), {"t": ts_epoch}
+    ).scalar()
+    if k is None:
+        return None, None
+    sql = f"SELECT station_id, {', '.join(columns)} FROM status_keyframes WHERE ts_epoch = :k"
+    return int(k), pd.read_sql(text(sql), conn, params={"k": k})
+
+
+def _state_at(conn: Connection, ts_epoch: int, columns: Sequence[str]) -> pd.DataFrame:
+    k, keyframe = _keyframe_before(conn, ts_epoch, columns)
+    if k is None:
+        # No keyframe yet: last row of each station from the whole history
+        return _last([read_carry_in(conn, ts_epoch + 1, columns)], columns)
+    return _last([keyframe, _changes(conn, k, ts_epoch, columns)], columns)
+
+
+def state_at(
+    when: str | pd.Timestamp,
+    columns: Sequence[str] = STATE_COLUMNS,
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Estado de todas as estações no instante ``when``: station_id e ``columns``.
+
+    Cada estação traz a última linha gravada até ``when``; estações que já tinham saído
+    do feed não aparecem. Parte do keyframe mais próximo antes de
+    ``when`` e reaplica só as linhas gravadas depois dele, então o custo é limitado
+    por ``KEYFRAME_EVERY_MIN`` e não pelo tamanho do histórico.
+    """
+    eng = engine or get_engine()
+    with eng.connect() as conn:
+        state = _state_at(conn, to_epoch(when), columns)
+    return state.sort_values("station_id", ignore_index=True)
+
+
+def states_between(
+    start: str | pd.Timestamp,
+    end: str | pd.Timestamp,
+    step_min: float = 5,
+    columns: Sequence[str] = ("num_bikes_available", "num_docks_available"),
+    engine: Engine | None = None,
+) -> pd.DataFrame:
+    """Quadros da rede a cada ``step_min`` minutos entre ``start`` e ``end`` (para animação).
+
+    Retorna scraped_at (instante do quadro), station_id e ``columns``, igual a chamar
+    ``state_at`` em cada quadro, mas com um único keyframe e uma única leitura das
+    mudanças do intervalo.
+    """
+    eng = engine or get_engine()
+    step = int(step_min * 60)
+    lo, hi = to_epoch(start), to_epoch(end)
+    frames = np.arange(-(-lo // step) * step, hi + 1, step, dtype=np.int64)
+    if not len(frames):
+        return pd.DataFrame(columns=["scraped_at", "station_id", *columns])
+    with eng.connect() as conn:
+        base = _state_at(conn, int(frames[0]), columns)
+        changes = _changes(conn, int(frames[0]), int(frames[-1]), columns)
+    events = pd.concat([base.assign(ts_epoch=frames[0]), changes], ignore_index=True)
+    events = events.astype({"station_id": str, "ts_epoch": np.int64}).sort_values("ts_epoch", kind="stable")
+    ids = np.sort(events["station_id"].unique())
+    grid = pd.DataFrame(
+        {"frame": np.repeat(frames, len(ids)), "station_id": pd.array(np.tile(ids, len(frames)), dtype=str)}
+    )
+    # Each frame takes each station's last event at or before it
+    out = pd.merge_asof(grid, events, left_on="frame", right_on="ts_epoch", by="station_id", direction="backward")
+    out = out.dropna(subset=["ts_epoch"])
+    # A station out of the feed at the frame has its tombstone as the last event
+    out = out[~out.pop("removed").fillna(False).astype(bool).to_numpy()]
+    out.insert(0, "scraped_at", from_epoch(out.pop("frame")))
+    return out.drop(columns="ts_epoch").reset_index(drop=True)
+
+
+def build_keyframes(
+    every_min: float = KEYFRAME_EVERY_MIN, rebuild: bool = False, engine: Engine | None = None
+) -> dict[str, Any]:
+    """Grava os keyframes que faltam no histórico: um na primeira coleta de cada intervalo de ``every_min``.
+
+    A ingestão já mantém os keyframes das coletas novas; este comando cobre o histórico
+    anterior (e o arquivo Parquet). O estado é reconstruído a partir do keyframe
+    existente mais próximo antes do primeiro que falta; ``rebuild`` apaga e refaz todos.
+    """
+    t0 = time.perf_counter()
+    engine = engine or get_engine()
+    init_db(engine)
+    step = int(every_min * 60)
+    with engine.begin() as conn:
+        if rebuild:
+            conn.execute(text("DELETE FROM status_keyframes"))
+        epochs = np.fromiter(
+            (r[0] for r in conn.execute(text("SELECT ts_epoch FROM snapshots ORDER BY ts_epoch"))), dtype=np.int64
+        )
+        have = {r[0] for r in conn.execute(text("SELECT DISTINCT ts_epoch FROM status_keyframes"))}
+    bucket = epochs // step
+    due = epochs[np.r_[True, bucket[1:] != bucket[:-1]]] if len(epochs) else epochs
+    missing = [int(k) for k in due if int(k) not in have]
+    if not missing:
+        return {"keyframes": 0, "rows": 0, "elapsed_s": round(time.perf_counter() - t0, 2)}
+
+    with engine.connect() as conn:
+        prev, state = _keyframe_before(conn, missing[0] - 1, STATE_COLUMNS)
+    state = _last([state], STATE_COLUMNS)
+    todo = due[(due > (prev if prev is not None else -1)) & (due <= missing[-1])]
+    missing_set, n_rows = set(missing), 0
+    for i in range(0, len(todo), _BLOCK_KEYFRAMES):
+        block = todo[i : i + _BLOCK_KEYFRAMES]
+        with engine.connect() as conn:
+            changes = _changes(conn, prev, int(block[-1]), STATE_COLUMNS)
+        cuts = np.searchsorted(changes["ts_epoch"].to_numpy(dtype=np.int64), block, side="right")
+        rows: list[dict[str, Any]] = []
+        a = 0
+        for k, b in zip(block, cuts):
+            state = _last([state, changes.iloc[a:b]], STATE_COLUMNS)
+            a = b
+            if int(k) in missing_set:
+                frame = state.astype(object).where(state.notna(), None)
+                rows.extend(frame.assign(ts_epoch=int(k)).to_dict(orient="records"))
+        if rows:
+            with engine.begin() as conn:
+                conn.execute(_INSERT_KEYFRAME_SQL, rows)
+        n_rows += len(rows)
+        prev = int(block[-1])
+    return {"keyframes": len(missing), "rows": n_rows, "elapsed_s": round(time.perf_counter() - t0, 2)}
@@ -1,12 +1,27 @@
 from __future__ import annotations
 
 import math
-from typing import Iterable
+from typing import Any, Iterable, Iterator, Sequence
 
+import numpy as np
 import pandas as pd
+from numpy.typing import ArrayLike
 from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
 
-from .db import get_engine
+from .archive import archive_carry_in, read_archive, read_archive_table
+from .db import get_data_stats, get_engine
+from .metrics import stage
+from .status_store import (
+    CARRY_IN_SQL,
+    COMPACT_DTYPES,
+    REMOVED_SQL,
+    STATUS_FROM_SQL,
+    dense_positions,
+    densify_status,
+    from_epoch,
+    to_epoch,
+)
 
 
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -19,8 +34,18 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return R * c
 
 
-def get_stations() -> pd.DataFrame:
-    eng = get_engine()
+def haversine_matrix(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike) -> np.ndarray:
+    """Distâncias (m) entre todos os pares de pontos: matriz ``len(lat1) x len(lat2)``."""
+    R = 6371000.0
+    phi1 = np.radians(np.asarray(lat1, dtype=float))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=float))[None, :]
+    dlambda = np.radians(np.asarray(lon2, dtype=float))[None, :] - np.radians(np.asarray(lon1, dtype=float))[:, None]
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * R * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def get_stations(engine: Engine | None = None) -> pd.DataFrame:
+    eng = engine or get_engine()
     q = text(
         """
         SELECT station_id, name, lat, lon, capacity
@@ -33,30 +58,287 @@ def get_stations() -> pd.DataFrame:
     return df
 
 
-def get_status_range(start: str | None = None, end: str | None = None) -> pd.DataFrame:
-    eng = get_engine()
-    sql = "SELECT station_id, scraped_at, num_bikes_available FROM station_status"
-    params: dict[str, str] = {}
-    where: list[str] = []
-    if start:
-        where.append("scraped_at >= :start")
-        params["start"] = start
-    if end:
-        where.append("scraped_at <= :end")
-        params["end"] = end
-    if where:
-        sql += " WHERE " + " AND ".join(where)
-    sql += " ORDER BY scraped_at"
+_SNAPSHOTS_SQL = "SELECT ts_epoch, n_stations, n_rows FROM snapshots sn"
+
+
+def get_status_range(
+    start: str | pd.Timestamp | None = None,
+    end: str | pd.Timestamp | None = None,
+    engine: Engine | None = None,
+    columns: Sequence[str] = ("num_bikes_available",),
+    compact: bool = False,
+) -> pd.DataFrame:
+    """station_id, scraped_at (datetime64 no fuso TIMEZONE) e ``columns`` no intervalo, na visão densa.
+
+    Dias já arquivados (``archive``) vêm das partições Parquet, o restante do SQLite. Com
+    ``compact=True`` as linhas vão do cursor direto para arrays NumPy pré-alocados:
+    station_id categórico, contagens/flags em int16/int8 (``COMPACT_DTYPES``) e
+    scraped_at em datetime64[s].
+    """
+    eng = engine or get_engine()
+    cond, params = epoch_range(start, end)
+    if compact:
+        with stage("status.read_compact") as m:
+            df = read_status_compact(eng, cond, params, columns)
+            m.rows = len(df)
+        return df
+    with stage("status.read") as m:
+        df = _status_range(eng, cond, params, columns)
+        m.rows = len(df)
+    return df
+
+
+def _status_range(eng: Engine, cond: str, params: dict[str, int], columns: Sequence[str]) -> pd.DataFrame:
+    # Times travel as epoch seconds and become datetime64 once, at the end
+    sql = (
+        f"SELECT st.station_id, sn.ts_epoch AS scraped_at, {', '.join(f'st.{c}' for c in columns)}, "
+        + REMOVED_SQL + " AS removed" + STATUS_FROM_SQL + cond + " ORDER BY sn.ts_epoch"
+    )
+    archived = read_archive(params.get("start"), params.get("end"), columns, removed=True)
     with eng.connect() as conn:
         df = pd.read_sql(text(sql), conn, params=params)
+        if archived is not None:
+            # Archived days are all older than the rows still in SQLite
+            archived = archived.rename(columns={"ts_epoch": "scraped_at"})
+            archived = archived.sort_values("scraped_at", kind="stable", ignore_index=True)
+            df = pd.concat([archived, df], ignore_index=True) if not df.empty else archived
+        snaps = pd.read_sql(text(_SNAPSHOTS_SQL + cond + " ORDER BY ts_epoch"), conn, params=params)
+        # Every snapshot in range stored in full: the rows already are the dense view
+        if not snaps.empty and snaps["n_rows"].sum() != snaps["n_stations"].sum():
+            if "start" in params:
+                carry = read_carry_in(conn, params["start"], columns).rename(columns={"ts_epoch": "scraped_at"})
+            else:
+                carry = df.iloc[0:0]
+            df = densify_status(df, carry, snaps["ts_epoch"], columns)
+        else:
+            df = df[~df["removed"].astype(bool)].drop(columns="removed").reset_index(drop=True)
+    df["scraped_at"] = from_epoch(df["scraped_at"])
     return df
 
 
-def get_time_bounds() -> tuple[str | None, str | None]:
-    eng = get_engine()
+def iter_status_range(
+    start: str | pd.Timestamp | None = None,
+    end: str | pd.Timestamp | None = None,
+    engine: Engine | None = None,
+    columns: Sequence[str] = ("num_bikes_available",),
+    chunk_snapshots: int = 288,
+) -> Iterator[pd.DataFrame]:
+    """A mesma visão densa de ``get_status_range(compact=True)``, em blocos de até ``chunk_snapshots`` coletas.
+
+    Os blocos saem em ordem de tempo. No modo delta o último estado de cada estação passa
+    de um bloco para o seguinte, então só o primeiro bloco consulta o histórico anterior e
+    a memória fica limitada pelo tamanho do bloco, não pelo do intervalo.
+    """
+    eng = engine or get_engine()
+    cond, params = epoch_range(start, end)
+    with eng.connect() as conn:
+        epochs = np.fromiter(
+            (r[0] for r in conn.execute(text("SELECT ts_epoch FROM snapshots sn" + cond + " ORDER BY ts_epoch"), params)),
+            dtype=np.int64,
+        )
+    block = " WHERE sn.ts_epoch >= :start AND sn.ts_epoch <= :end"
+    carry: pd.DataFrame | None = None
+    for i in range(0, len(epochs), max(chunk_snapshots, 1)):
+        first, last = int(epochs[i]), int(epochs[min(i + chunk_snapshots, len(epochs)) - 1])
+        # Before the first block the carry-in comes from the user's start (None = query it)
+        bounds = {"start": params["start"] if i == 0 and "start" in params else first, "end": last}
+        df = read_status_compact(eng, block, bounds, columns, carry)
+        if df.empty:
+            continue
+        carry = dense_state(df, columns)
+        yield df
+
+
+def dense_state(df: pd.DataFrame, columns: Sequence[str]) -> pd.DataFrame:
+    """Estado das estações na última coleta de ``df`` (visão compacta em ordem de tempo).
+
+    Sai no formato de ``read_carry_in`` (station_id, ts_epoch, ``columns``), para ser o
+    carry-in do bloco seguinte em ``read_status_compact``; estações que saíram do feed
+    antes dessa coleta ficam de fora.
+    """
+    state = df[df["scraped_at"] == df["scraped_at"].iloc[-1]]
+    return pd.DataFrame(
+        {
+            "station_id": state["station_id"].astype(object).to_numpy(),
+            "ts_epoch": state["scraped_at"].dt.as_unit("s").array.asi8,
+            **{c: state[c].to_numpy() for c in columns},
+        }
+    )
+
+
+def epoch_range(start: str | pd.Timestamp | None, end: str | pd.Timestamp | None) -> tuple[str, dict[str, int]]:
+    """Filtro ``WHERE`` sobre ``sn.ts_epoch`` (vazio sem limites) e os parâmetros em epoch segundos."""
+    params: dict[str, int] = {}
+    where: list[str] = []
+    if start:
+        where.append("sn.ts_epoch >= :start")
+        params["start"] = to_epoch(start)
+    if end:
+        where.append("sn.ts_epoch <= :end")
+        params["end"] = to_epoch(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def read_carry_in(conn: Connection, start: int, columns: Sequence[str]) -> pd.DataFrame:
+    """Último estado de cada estação antes de ``start`` (epoch), do SQLite e do arquivo Parquet.
+
+    Colunas station_id, ts_epoch e ``columns``: o ponto de partida da visão densa no modo delta.
+    """
+    carry = pd.read_sql(text(CARRY_IN_SQL.format(columns=", ".join(columns))), conn, params={"start": start})
+    archived_carry = archive_carry_in(start, columns)
+    if archived_carry is not None:
+        carry = pd.concat([archived_carry, carry], ignore_index=True)
+    carry = carry.sort_values("ts_epoch", kind="stable").drop_duplicates("station_id", keep="last")
+    # Stations whose last record is a tombstone had left the feed by then
+    return carry[~carry.pop("removed").astype(bool)].reset_index(drop=True)
+
+
+def _small_int(values: ArrayLike, dtype: Any) -> tuple[np.ndarray, np.ndarray | None]:
+    # Column chunk -> (values in `dtype`, NULL mask or None); NULLs arrive as None or NaN
+    arr = np.asarray(values)
+    mask = pd.isna(arr) if arr.dtype.kind in "fO" else None
+    if mask is None or not mask.any():
+        return arr.astype(dtype, copy=False), None
+    return np.where(mask, 0, arr).astype(dtype), mask
+
+
+class _StatusBuffer:
+    # Preallocated arrays filled chunk by chunk; station ids are coded as they arrive
+    def __init__(self, n: int, columns: Sequence[str]) -> None:
+        self.codes = np.empty(n, dtype=np.int32)
+        self.epoch = np.empty(n, dtype=np.int64)
+        self.values = {c: np.empty(n, dtype=COMPACT_DTYPES[c]) for c in columns}
+        self.masks: dict[str, np.ndarray] = {}
+        self.removed = np.zeros(n, dtype=bool)
+        self.station_codes: dict[str, int] = {}
+        self.n = 0
+
+    def code(self, station_ids: Iterable[str]) -> np.ndarray:
+        lookup = self.station_codes
+        return np.fromiter((lookup.setdefault(s, len(lookup)) for s in station_ids), dtype=np.int32)
+
+    def put(
+        self, codes: np.ndarray, epoch: ArrayLike, values: dict[str, ArrayLike], removed: ArrayLike | None = None
+    ) -> None:
+        a, b = self.n, self.n + len(codes)
+        self.codes[a:b] = codes
+        self.epoch[a:b] = epoch
+        if removed is not None:
+            self.removed[a:b] = removed
+        for c, v in values.items():
+            arr, mask = _small_int(v, COMPACT_DTYPES[c])
+            self.values[c][a:b] = arr
+            if mask is not None:
+                self.masks.setdefault(c, np.zeros(len(self.codes), dtype=bool))[a:b] = mask
+        self.n = b
+
+    def trim(self) -> None:
+        # Rows deleted (compacted/archived) between the COUNT and the read leave unused slots
+        self.take(slice(0, self.n))
+
+    def take(self, rows: np.ndarray | slice) -> None:
+        self.codes, self.epoch, self.removed = self.codes[rows], self.epoch[rows], self.removed[rows]
+        self.values = {c: v[rows] for c, v in self.values.items()}
+        self.masks = {c: m[rows] for c, m in self.masks.items()}
+
+    def sort_stations(self) -> np.ndarray:
+        # Recode so that code order is station_id order; returns the sorted ids
+        ids = np.array(list(self.station_codes), dtype=object)
+        order = np.argsort(ids, kind="stable")
+        rank = np.empty(len(ids), dtype=np.int32)
+        rank[order] = np.arange(len(ids), dtype=np.int32)
+        self.codes = rank[self.codes]
+        return ids[order]
+
+    def drop_unused(self, categories: np.ndarray) -> np.ndarray:
+        # Stations left with no row (only tombstones) leave the categories
+        used = np.zeros(len(categories), dtype=bool)
+        used[self.codes] = True
+        if used.all():
+            return categories
+        self.codes = (np.cumsum(used, dtype=np.int32) - 1)[self.codes]
+        return categories[used]
+
+
+def read_status_compact(
+    eng: Engine, cond: str, params: dict[str, int], columns: Sequence[str], carry: pd.DataFrame | None = None
+) -> pd.DataFrame:
+    """Leitor de ``get_status_range(compact=True)`` para um filtro já montado (``epoch_range``).
+
+    ``carry`` é o estado antes de ``params["start"]`` (formato de ``read_carry_in``); com
+    ``None`` ele é lido do banco e do arquivo.
+    """
+    unknown = [c for c in columns if c not in COMPACT_DTYPES]
+    if unknown:
+        raise ValueError(f"Sem tipo compacto para: {', '.join(unknown)}")
+    archived = read_archive_table(params.get("start"), params.get("end"), columns, removed=True)
+    if archived is not None:
+        archived = archived.sort_by("ts_epoch")
     with eng.connect() as conn:
-        res = conn.execute(text("SELECT MIN(scraped_at), MAX(scraped_at) FROM station_status"))
-        row = res.fetchone()
-        if row:
-            return row[0], row[1]
-    return None, None
+        snaps = pd.read_sql(text(_SNAPSHOTS_SQL + cond + " ORDER BY ts_epoch"), conn, params=params)
+        is_delta = not snaps.empty and snaps["n_rows"].sum() != snaps["n_stations"].sum()
+        if not is_delta:
+            carry = None
+        elif carry is None and "start" in params:
+            carry = read_carry_in(conn, params["start"], columns)
+        # Bounded by the snapshots just read, so a concurrent ingest cannot outgrow the arrays
+        live_cond = cond + (" AND " if cond else " WHERE ") + "sn.ts_epoch <= :last"
+        live_params = {**params, "last": int(snaps["ts_epoch"].iloc[-1]) if not snaps.empty else -1}
+        n_live = conn.execute(text("SELECT COUNT(*)" + STATUS_FROM_SQL + live_cond), live_params).scalar() or 0
+        n_carry = len(carry) if carry is not None else 0
+        buf = _StatusBuffer(n_carry + (archived.num_rows if archived is not None else 0) + n_live, columns)
+        # Time order: carry-in, archived days, then the rows still in SQLite
+        if carry is not None:
+            buf.put(buf.code(carry["station_id"]), carry["ts_epoch"], {c: carry[c].to_numpy() for c in columns})
+        if archived is not None:
+            ids = archived.column("station_id").combine_chunks().dictionary_encode()
+            codes = buf.code(ids.dictionary.to_pylist())[ids.indices.to_numpy()]
+            buf.put(
+                codes,
+                archived.column("ts_epoch").to_numpy(),
+                {c: archived.column(c).to_numpy() for c in columns},
+                archived.column("removed").to_numpy(zero_copy_only=False),
+            )
+            del archived, ids, codes
+        sql = (
+            f"SELECT st.station_id, sn.ts_epoch, {', '.join(f'st.{c}' for c in columns)}, "
+            + REMOVED_SQL + STATUS_FROM_SQL + live_cond + " ORDER BY sn.ts_epoch"
+        )
+        result = conn.execute(text(sql), live_params)
+        for part in result.partitions(50_000):
+            station_ids, epoch, *values, removed = zip(*part)
+            buf.put(buf.code(station_ids), epoch, dict(zip(columns, values)), removed)
+    buf.trim()
+    categories = buf.sort_stations()
+    has_removed = bool(buf.removed.any())
+    if is_delta:
+        snap_epoch = snaps["ts_epoch"].to_numpy(dtype=np.int64)
+        snap = np.searchsorted(snap_epoch, buf.epoch)
+        snap[:n_carry] = -1
+        rows, out_snap = dense_positions(
+            buf.codes, snap, len(snap_epoch), len(categories), buf.removed if has_removed else None
+        )
+        buf.take(rows)
+        buf.epoch = snap_epoch[out_snap]
+    elif has_removed:
+        buf.take(~buf.removed)
+    if has_removed:
+        categories = buf.drop_unused(categories)
+    data: dict[str, Any] = {
+        "station_id": pd.Categorical.from_codes(buf.codes, categories=pd.Index(categories, dtype=object)),
+        "scraped_at": from_epoch(buf.epoch),
+    }
+    for c in columns:
+        mask = buf.masks.get(c)
+        data[c] = pd.arrays.IntegerArray(buf.values[c], mask) if mask is not None else buf.values[c]
+    return pd.DataFrame(data, copy=False)
+
+
+def get_time_bounds(engine: Engine | None = None) -> tuple[str | None, str | None]:
+    # Kept by the ingest in data_stats; the snapshot log also covers archived days
+    stats = get_data_stats(engine)
+    lo, hi = stats.get("first_ts_epoch"), stats.get("last_ts_epoch")
+    if lo is None:
+        return None, None
+    lo, hi = from_epoch([lo, hi])
+    return lo.isoformat(), hi.isoformat()
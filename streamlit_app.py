@@ -1,50 +1,87 @@
 import sys
+import time
 from pathlib import Path
 
 sys.path.append(str(Path(__file__).resolve().parent / 'src'))
 
-import time
 from typing import Optional
 
 import numpy as np
 import pandas as pd
 import pydeck as pdk
-import requests
 import streamlit as st
 
-from bike_analyzer.config import CITY_LAT, CITY_LON
-from bike_analyzer.utils import get_stations, get_status_range, get_time_bounds
-from bike_analyzer.od_inference import infer_flows
-from bike_analyzer.db import init_db, get_engine
+from bike_analyzer.config import BAIRROS_GEOJSON, CITY_LAT, CITY_LON, TIMEZONE
+from bike_analyzer.bairros import geocode_nominatim, resolve_bairros
+from bike_analyzer.utils import get_stations, get_time_bounds
+from bike_analyzer.delta_cube import DeltaCube
+from bike_analyzer.geo import get_station_geometry
+from bike_analyzer.hexbins import HEX_LEVELS_M, hexbin_levels, scaled_radius
+from bike_analyzer.od_store import get_watermark, materialize_od, query_od_flows
+from bike_analyzer.range_cache import RangeCache
+from bike_analyzer.rollups import get_hour_of_day_profile, get_station_summary
+from bike_analyzer.time_travel import states_between
+from bike_analyzer.db import init_db, get_data_stats
 from bike_analyzer.etl_gbfs import ingest_once
-from bike_analyzer.etl_weather import fetch_weather, load_weather_hourly
+from bike_analyzer.etl_weather import sync_weather
+from bike_analyzer.metrics import get_metrics
 
 st.set_page_config(page_title="Bike Analyzer – Porto Alegre", layout="wide")
 
+def data_version() -> tuple:
+    # Marca d'água da ingestão (data_stats, O(1)): muda a cada coleta e invalida só o que depende dela
+    stats = get_data_stats()
+    return (stats["n_stations"], stats["last_snapshot_id"])
+
+@st.cache_resource(show_spinner=False)
+def range_cache() -> RangeCache:
+    # Compartilhado entre sessões; a cada coleta nova lê só as linhas novas e estende as entradas
+    return RangeCache()
+
 @st.cache_data(show_spinner=False)
-def load_stations_cached():
+def load_stations_cached(version: tuple):
     return get_stations()
 
+def load_cube_cached(start: Optional[str], end: Optional[str]) -> DeltaCube:
+    # Cubo de deltas a 5 min: mudar a janela OD só re-agrega linhas, sem reler o status
+    return range_cache().cube(start, end)
+
+def load_station_stats_cached(start: Optional[str], end: Optional[str]):
+    # Agregado dentro do SQLite na primeira leitura; depois só as coletas novas são somadas
+    return range_cache().station_stats(start, end)
+
+@st.cache_data(show_spinner=False)
+def load_bairros_cached(version: tuple, boundaries_mtime: float):
+    return resolve_bairros(get_stations())
+
+@st.cache_data(show_spinner=False)
+def load_station_summary_cached(start: Optional[str], end: Optional[str], version: tuple):
+    return get_station_summary(start, end)
+
 @st.cache_data(show_spinner=False)
-def load_status_cached(start: Optional[str], end: Optional[str]):
-    return get_status_range(start, end)
+def load_hour_profile_cached(start: Optional[str], end: Optional[str], version: tuple):
+    return get_hour_of_day_profile(start, end)
 
 @st.cache_data(show_spinner=False)
+def load_frames_cached(day: str, step_min: int, version: tuple) -> pd.DataFrame:
+    # Um keyframe + as mudanças do dia, lidos uma vez: arrastar o slider só filtra linhas
+    start = pd.Timestamp(day).tz_localize(TIMEZONE)
+    _, last = get_time_bounds()
+    end = min(start + pd.Timedelta(days=1) - pd.Timedelta(seconds=1), pd.Timestamp(last))
+    return states_between(start, end, step_min)
+
 def get_bounds():
+    # Lido de data_stats (mantida pela ingestão): O(1), então não precisa de cache
     return get_time_bounds()
 
 
 def check_data_exists() -> dict[str, int]:
-    """Verifica se há dados no banco."""
-    engine = get_engine()
-    with engine.connect() as conn:
-        from sqlalchemy import text
-        try:
-            stations_count = conn.execute(text("SELECT COUNT(*) FROM stations")).scalar()
-            status_count = conn.execute(text("SELECT COUNT(*) FROM station_status")).scalar()
-            return {"stations": stations_count or 0, "status": status_count or 0}
-        except:
-            return {"stations": 0, "status": 0}
+    """Verifica se há dados no banco (contagens de data_stats, sem COUNT(*) nas tabelas)."""
+    try:
+        stats = get_data_stats()
+        return {"stations": stats["n_stations"], "snapshots": stats["n_snapshots"]}
+    except Exception:
+        return {"stations": 0, "snapshots": 0}
 
 
 def run_initial_ingest():
@@ -58,17 +95,15 @@ def run_initial_ingest():
             result = ingest_once()
             st.success(f"✅ {result['stations_upserted']} estações, {result['status_rows']} snapshots coletados")
         
-        # Ingerir clima dos últimos 2 dias
+        # Clima: só as horas do histórico de status que ainda faltam
         try:
             with st.spinner("Coletando dados climáticos..."):
-                weather_data = fetch_weather("-2d", "+1d")
-                weather_rows = load_weather_hourly(weather_data)
+                weather_rows = sync_weather()["rows"]
                 st.success(f"✅ {weather_rows} registros de clima adicionados")
         except Exception as e:
             st.warning(f"⚠️ Clima falhou (opcional): {e}")
         
-        # Limpar cache para recarregar dados
-        st.cache_data.clear()
+        # Os caches são chaveados na marca d'água da ingestão: o rerun já lê só o que é novo
         st.rerun()
         
     except Exception as e:
@@ -77,48 +112,6 @@ def run_initial_ingest():
     return True
 
 
-def geocode_bairros(stations: pd.DataFrame) -> pd.DataFrame:
-    cache_path = Path("data/station_neighborhoods.csv")
-    if cache_path.exists():
-        return pd.read_csv(cache_path)
-    out = []
-    headers = {"User-Agent": "bike-analyzer/0.1 (educational)"}
-    for _, row in stations.iterrows():
-        lat, lon = row["lat"], row["lon"]
-        try:
-            r = requests.get(
-                "https://nominatim.openstreetmap.org/reverse",
-                params={
-                    "format": "jsonv2",
-                    "lat": lat,
-                    "lon": lon,
-                    "accept-language": "pt-BR",
-                    "zoom": 14,
-                },
-                headers=headers,
-                timeout=20,
-            )
-            r.raise_for_status()
-            js = r.json()
-            addr = js.get("address", {})
-            bairro = (
-                addr.get("neighbourhood")
-                or addr.get("suburb")
-                or addr.get("city_district")
-                or addr.get("quarter")
-                or addr.get("residential")
-                or None
-            )
-        except Exception:
-            bairro = None
-        out.append({"station_id": row["station_id"], "bairro": bairro, "lat": lat, "lon": lon})
-        time.sleep(1)  # respeitar limites do Nominatim
-    df = pd.DataFrame(out)
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(cache_path, index=False)
-    return df
-
-
 def header():
     st.title("🚲 Bike Analyzer – Porto Alegre")
     st.caption("Dashboard de análise de mobilidade urbana com dados do BikePoA (GBFS) + clima")
@@ -127,7 +120,7 @@ def header():
     if data_counts["stations"] == 0:
         st.warning("👋 **Bem-vindo!** Este é seu primeiro acesso. Clique em '🚀 Carregar dados iniciais' na barra lateral para começar a análise.")
     else:
-        st.info(f"📊 Analisando **{data_counts['stations']} estações** com **{data_counts['status']} snapshots** coletados.")
+        st.info(f"📊 Analisando **{data_counts['stations']} estações** com **{data_counts['snapshots']} snapshots** coletados.")
 
 
 def sidebar():
@@ -145,7 +138,7 @@ def sidebar():
         st.sidebar.info("Clique em 'Carregar dados iniciais' para começar!")
         return None
     else:
-        st.sidebar.success(f"✅ {data_counts['stations']} estações, {data_counts['status']} snapshots")
+        st.sidebar.success(f"✅ {data_counts['stations']} estações, {data_counts['snapshots']} snapshots")
         
         col1, col2 = st.sidebar.columns(2)
         with col1:
@@ -154,6 +147,7 @@ def sidebar():
         with col2:
             if st.button("🗑️ Limpar cache"):
                 st.cache_data.clear()
+                range_cache().clear()
                 st.rerun()
     
     st.sidebar.header("Filtros")
@@ -166,74 +160,135 @@ def sidebar():
     end = st.sidebar.text_input("Fim (YYYY-MM-DD HH:MM:SS)", value=str(tmax))
     bucket = st.sidebar.select_slider("Janela para OD (min)", options=[5,10,15,20,30,60], value=10)
     topn = st.sidebar.slider("Top fluxos (OD)", min_value=10, max_value=200, value=50, step=10)
-    return {"start": start, "end": end, "bucket": bucket, "topn": topn}
+    matcher = st.sidebar.radio(
+        "Matching OD",
+        options=["optimal", "greedy"],
+        format_func=lambda m: {"optimal": "Ótimo (custo mínimo)", "greedy": "Guloso (rápido)"}[m],
+        horizontal=True,
+    )
+    return {"start": start, "end": end, "bucket": bucket, "topn": topn, "matcher": matcher}
 
 
 def map_view_state():
     return pdk.ViewState(latitude=CITY_LAT, longitude=CITY_LON, zoom=12, pitch=0)
 
 
-def tab_bairros(stations: pd.DataFrame, status: pd.DataFrame):
+def station_metric(metric: str, start: Optional[str], end: Optional[str]) -> pd.DataFrame:
+    """Estações (station_id, name, lat, lon) com a métrica do intervalo: activity ou avg_bikes."""
+    stations = load_stations_cached(data_version())
+    if metric == "activity":
+        values = load_station_stats_cached(start, end)[["station_id", "activity"]]
+    else:
+        values = load_station_summary_cached(start, end, data_version())[["station_id", metric]]
+    return stations[["station_id", "name", "lat", "lon"]].merge(values, on="station_id", how="left").fillna({metric: 0})
+
+@st.cache_data(show_spinner=False)
+def load_hexbins_cached(metric: str, start: Optional[str], end: Optional[str], version: tuple) -> pd.DataFrame:
+    # Binagem hexagonal no servidor, para todos os tamanhos de uma vez: o mapa recebe só as células
+    return hexbin_levels(station_metric(metric, start, end), [metric])
+
+
+def hex_layer(metric: str, start: Optional[str], end: Optional[str], size_m: int, elevation_scale: float, color: list[int]):
+    bins = load_hexbins_cached(metric, start, end, data_version())
+    bins = bins.loc[bins["size_m"] == size_m, ["lat", "lon", "n_stations", metric]]
+    # ColumnLayer com disk_resolution=6 desenha cada célula já agregada como um hexágono
+    return pdk.Layer(
+        "ColumnLayer",
+        data=bins,
+        get_position="[lon, lat]",
+        get_elevation=metric,
+        elevation_scale=elevation_scale,
+        radius=size_m,
+        disk_resolution=6,
+        coverage=0.95,
+        extruded=True,
+        get_fill_color=color,
+        pickable=True,
+    )
+
+
+def hex_size_picker(key: str) -> int:
+    return st.select_slider("Tamanho do hexágono (m)", options=sorted(HEX_LEVELS_M), value=400, key=key)
+
+
+def tab_bairros(stations: pd.DataFrame, start: Optional[str], end: Optional[str]):
     st.subheader("Bairros que mais usam bikes (proxy)")
-    st.caption("Proxy: soma das variações absolutas de bikes por estação no período, agregada por bairro via geocodificação OSM.")
+    st.caption("Proxy: soma das variações absolutas de bikes por estação no período, agregada por bairro (limites em GeoJSON).")
 
-    df = status.copy()
-    if df.empty:
+    usage = load_station_stats_cached(start, end)
+    if usage.empty:
         st.info("Sem dados no intervalo selecionado.")
         return
-    df["scraped_at"] = pd.to_datetime(df["scraped_at"]) 
-    df = df.sort_values(["station_id", "scraped_at"])
-    df["delta"] = df.groupby("station_id")["num_bikes_available"].diff().fillna(0).astype(int)
-    usage = df.groupby("station_id", as_index=False)["delta"].apply(lambda s: int(np.abs(s).sum()))
-    usage = usage.rename(columns={"delta": "activity"})
+    usage = usage[["station_id", "activity"]]
 
     stns = stations.merge(usage, on="station_id", how="left").fillna({"activity":0})
 
-    if st.button("Resolver bairros (OSM)"):
-        bairro_df = geocode_bairros(stations)
-    else:
-        # tenta carregar se já existir
-        p = Path("data/station_neighborhoods.csv")
-        bairro_df = pd.read_csv(p) if p.exists() else pd.DataFrame(columns=["station_id","bairro","lat","lon"])
+    # Resolvedor offline (GeoJSON local + ponto-em-polígono), em cache no SQLite por coordenadas
+    geojson = Path(BAIRROS_GEOJSON)
+    bairro_df = load_bairros_cached(data_version(), geojson.stat().st_mtime if geojson.exists() else 0.0)
+    if bairro_df["bairro"].isna().any() and st.button("Completar bairros faltantes (Nominatim, online)"):
+        with st.spinner("Consultando o Nominatim (1 estação por segundo)..."):
+            geocode_nominatim(stations)
+        load_bairros_cached.clear()
+        st.rerun()
+    bairro_df = bairro_df.dropna(subset=["bairro"])
 
     if not bairro_df.empty:
         merged = stns.merge(bairro_df[["station_id","bairro"]], on="station_id", how="left")
         by_bairro = merged.groupby("bairro", as_index=False)["activity"].sum().sort_values("activity", ascending=False).head(20)
         st.dataframe(by_bairro, use_container_width=True)
-        # Mapa: pontos ponderados por activity
+        # Mapa: pontos ponderados por activity (raio calculado aqui, só as colunas usadas vão ao navegador)
+        points = merged[["station_id", "name", "bairro", "lat", "lon", "activity"]].assign(
+            radius=lambda d: scaled_radius(d["activity"], 5, 100, 3000)
+        )
         layer = pdk.Layer(
             "ScatterplotLayer",
-            data=merged,
+            data=points,
             get_position="[lon, lat]",
-            get_radius="np.clip(activity*5, 100, 3000)",
+            get_radius="radius",
             get_fill_color="[255, 140, 0, 140]",
             pickable=True,
         )
         st.pydeck_chart(pdk.Deck(map_style="mapbox://styles/mapbox/light-v9", initial_view_state=map_view_state(), layers=[layer]))
     else:
-        st.info("Clique em 'Resolver bairros (OSM)' para agregar por bairro. Enquanto isso, veja o heatmap por área.")
-        # Heatmap por área (Hex)
-        hex_layer = pdk.Layer(
-            "HexagonLayer",
-            data=stns,
-            get_position="[lon, lat]",
-            get_elevation_weight="activity",
-            elevation_scale=1,
-            elevation_range=[0, 5000],
-            extruded=True,
-            radius=200,
-            coverage=1,
+        st.info(
+            f"Coloque os limites dos bairros (GeoJSON) em `{BAIRROS_GEOJSON}` para agregar por bairro, "
+            "ou complete pelo Nominatim. Enquanto isso, veja o heatmap por área."
         )
-        st.pydeck_chart(pdk.Deck(initial_view_state=map_view_state(), layers=[hex_layer]))
-
-
-def tab_trajetos(stations: pd.DataFrame, status: pd.DataFrame, bucket_min: int, topn: int):
+        # Heatmap por área (hexágonos pré-agregados no servidor)
+        size_m = hex_size_picker("hex_bairros")
+        layer = hex_layer("activity", start, end, size_m, 1, [255, 140, 0, 180])
+        st.pydeck_chart(pdk.Deck(initial_view_state=map_view_state(), layers=[layer]))
+
+
+def tab_trajetos(
+    stations: pd.DataFrame,
+    bucket_min: int,
+    topn: int,
+    matcher: str = "optimal",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
     st.subheader("Trajetos mais realizados (estimados)")
     st.caption("Estimativa baseada em variações de estoque por janela de tempo (matching de partidas/chegadas por proximidade). Não são viagens observadas.")
-    if status.empty:
-        st.info("Sem dados no intervalo selecionado.")
-        return
-    flows = infer_flows(status, stations, freq=f"{bucket_min}min")
+    wm = get_watermark(bucket_min, matcher)
+    if wm is not None:
+        # Tabela materializada: só agrega em SQL, sem carregar o status. O ingest-loop com
+        # --materialize-od a mantém em dia; aqui ela só é estendida quando a última coleta já
+        # passou da janela da marca d'água (a janela parcial fica para a próxima)
+        last_ts = get_data_stats().get("last_ts_epoch")
+        if last_ts is not None and last_ts >= wm["last_bucket_start"] + bucket_min * 60:
+            materialize_od(bucket_min, matcher)
+        flows = query_od_flows(bucket_min, matcher, start, end, top=topn)
+    else:
+        cube = load_cube_cached(start, end)
+        if cube.n_buckets == 0:
+            st.info("Sem dados no intervalo selecionado.")
+            return
+        st.caption(f"Dica: `bike-analyzer materialize-od --bucket {bucket_min}` evita recalcular os fluxos a cada filtro.")
+        # Deltas da janela escolhida saem do cubo (soma de janelas de 5 min); os fluxos por janela ficam
+        # em cache e, a cada coleta nova, só a última janela em diante é recalculada
+        flows = range_cache().flows(get_station_geometry(stations), start, end, bucket_min, matcher)
     if flows.empty:
         st.info("Sem fluxos estimados no intervalo.")
         return
@@ -250,10 +305,10 @@ def tab_trajetos(stations: pd.DataFrame, status: pd.DataFrame, bucket_min: int,
 
     arc = pdk.Layer(
         "ArcLayer",
-        data=flows,
+        data=flows.assign(width=np.clip(flows["count"], 1, 20)),
         get_source_position="[o_lon, o_lat]",
         get_target_position="[d_lon, d_lat]",
-        get_width="np.clip(count, 1, 20)",
+        get_width="width",
         get_source_color="[0, 128, 255, 160]",
         get_target_color="[255, 0, 128, 160]",
         pickable=True,
@@ -261,39 +316,113 @@ def tab_trajetos(stations: pd.DataFrame, status: pd.DataFrame, bucket_min: int,
     st.pydeck_chart(pdk.Deck(initial_view_state=map_view_state(), layers=[arc]))
 
 
-def tab_bikes(stations: pd.DataFrame, status: pd.DataFrame):
+def tab_bikes(stations: pd.DataFrame, start: Optional[str], end: Optional[str]):
     st.subheader("Onde geralmente tem mais bikes")
     st.caption("Média de bikes disponíveis por estação no período selecionado, com heatmap hexagonal.")
-    if status.empty:
-        st.info("Sem dados no intervalo selecionado.")
+    # Lido dos rollups station_hourly (mantidos na ingestão), sem varrer station_status
+    summary = load_station_summary_cached(start, end, data_version())
+    if summary.empty:
+        st.info("Sem dados no intervalo selecionado (ou rode `bike-analyzer rebuild-rollups`).")
         return
-    df = status.copy()
-    df["scraped_at"] = pd.to_datetime(df["scraped_at"]) 
-    df = df.sort_values(["station_id", "scraped_at"]) 
-    avg_bikes = df.groupby("station_id")["num_bikes_available"].mean().reset_index(name="avg_bikes")
-    stns = stations.merge(avg_bikes, on="station_id", how="left").fillna({"avg_bikes":0})
-
-    layer_hex = pdk.Layer(
-        "HexagonLayer",
-        data=stns,
-        get_position="[lon, lat]",
-        get_elevation_weight="avg_bikes",
-        elevation_scale=10,
-        elevation_range=[0, 500],
-        extruded=True,
-        radius=200,
-        coverage=1,
+    stns = stations.merge(summary, on="station_id", how="left").fillna({"avg_bikes": 0})
+
+    size_m = hex_size_picker("hex_bikes")
+    layer_hex = hex_layer("avg_bikes", start, end, size_m, 10, [0, 140, 255, 160])
+    points = stns[["station_id", "name", "lat", "lon", "avg_bikes"]].assign(
+        radius=lambda d: scaled_radius(d["avg_bikes"], 20, 50, 2500)
     )
     layer_pts = pdk.Layer(
         "ScatterplotLayer",
-        data=stns,
+        data=points,
         get_position="[lon, lat]",
-        get_radius="np.clip(avg_bikes*20, 50, 2500)",
+        get_radius="radius",
         get_fill_color="[0, 200, 100, 160]",
         pickable=True,
     )
     st.pydeck_chart(pdk.Deck(initial_view_state=map_view_state(), layers=[layer_hex, layer_pts]))
 
+    st.markdown("**Perfil por hora do dia**")
+    profile = load_hour_profile_cached(start, end, data_version())
+    st.line_chart(profile.set_index("hora")[["media_bikes"]])
+    st.markdown("**Estações mais tempo vazias / cheias (min)**")
+    ranking = stns.assign(indisponivel_min=stns["empty_min"].fillna(0) + stns["full_min"].fillna(0))
+    st.dataframe(
+        ranking.sort_values("indisponivel_min", ascending=False)
+        .head(20)[["station_id", "name", "avg_bikes", "empty_min", "full_min", "activity"]],
+        use_container_width=True,
+    )
+
+
+def frame_layer(stations: pd.DataFrame, frame: pd.DataFrame):
+    # Cor e raio calculados no servidor: vermelho = vazia, azul = sem vagas, verde no meio
+    pts = stations[["station_id", "name", "lat", "lon"]].merge(frame, on="station_id")
+    bikes = pts["num_bikes_available"].to_numpy(dtype=float)
+    docks = pts["num_docks_available"].to_numpy(dtype=float)
+    color = np.select(
+        [(bikes == 0)[:, None], (docks == 0)[:, None]],
+        [[220, 50, 50, 200], [40, 90, 220, 200]],
+        default=np.array([0, 170, 90, 180]),
+    )
+    pts = pts.assign(radius=scaled_radius(bikes, 25, 40, 400), r=color[:, 0], g=color[:, 1], b=color[:, 2], a=color[:, 3])
+    return pdk.Layer(
+        "ScatterplotLayer",
+        data=pts[["name", "lat", "lon", "num_bikes_available", "num_docks_available", "radius", "r", "g", "b", "a"]],
+        get_position="[lon, lat]",
+        get_radius="radius",
+        get_fill_color="[r, g, b, a]",
+        pickable=True,
+    )
+
+
+def draw_frame(slot, stations: pd.DataFrame, frames: pd.DataFrame, at: pd.Timestamp):
+    frame = frames[frames["scraped_at"] == at]
+    with slot.container():
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Horário", at.strftime("%d/%m %H:%M"))
+        c2.metric("Bikes disponíveis", int(frame["num_bikes_available"].sum()))
+        c3.metric("Estações vazias", int((frame["num_bikes_available"] == 0).sum()))
+        st.pydeck_chart(pdk.Deck(initial_view_state=map_view_state(), layers=[frame_layer(stations, frame)]))
+
+
+def tab_linha_do_tempo(stations: pd.DataFrame, start: Optional[str], end: Optional[str]):
+    st.subheader("Estado da rede ao longo do dia")
+    st.caption("Estado de todas as estações em cada instante, reconstruído a partir de keyframes periódicos.")
+    lo, hi = get_bounds()
+    first_day, last_day = pd.Timestamp(lo).date(), pd.Timestamp(hi).date()
+    # Defaults to the last day of the sidebar range
+    default = min(max(pd.Timestamp(end).date() if end else last_day, first_day), last_day)
+    c1, c2 = st.columns(2)
+    day = c1.date_input("Dia", value=default, min_value=first_day, max_value=last_day)
+    step_min = c2.select_slider("Passo (min)", options=[5, 10, 15, 30, 60], value=15)
+    frames = load_frames_cached(str(day), step_min, data_version())
+    if frames.empty:
+        st.info("Sem coletas neste dia.")
+        return
+    times = list(frames["scraped_at"].drop_duplicates())
+    at = st.select_slider("Instante", options=times, value=times[-1], format_func=lambda t: t.strftime("%H:%M"))
+    play = st.button("▶️ Reproduzir o dia")
+    slot = st.empty()
+    if play:
+        for t in times:
+            draw_frame(slot, stations, frames, t)
+            time.sleep(0.3)
+    else:
+        draw_frame(slot, stations, frames, at)
+
+
+def performance_panel():
+    with st.expander("⚙️ Desempenho", expanded=False):
+        st.caption("Tempo, volume e espera de lock por etapa (coleta, clima, leitura do status, OD), somados por todos os processos. Mesmo conteúdo de `bike-analyzer stats`.")
+        hours = st.select_slider("Janela (h)", options=[1, 6, 24, 72, 168], value=24, key="perf_hours")
+        df = get_metrics(hours)
+        if df.empty:
+            st.info("Sem métricas na janela.")
+            return
+        st.dataframe(df, use_container_width=True)
+        lock = df[df["stage"] == "db.lock_wait"]
+        if not lock.empty:
+            st.caption(f"Espera de lock de escrita: {lock['total_ms'].iloc[0]:.0f} ms no total, máx. {lock['max_ms'].iloc[0]:.0f} ms.")
+
 
 # App
 header()
@@ -301,23 +430,27 @@ filters = sidebar()
 
 # Só mostrar dashboard se há dados
 if filters:
-    stations = load_stations_cached()
-    status = load_status_cached(filters["start"], filters["end"])
+    stations = load_stations_cached(data_version())
 
-    tabs = st.tabs(["🏘️ Bairros", "🔄 Trajetos", "🚲 Bikes"])
+    tabs = st.tabs(["🏘️ Bairros", "🔄 Trajetos", "🚲 Bikes", "⏱️ Linha do tempo"])
     with tabs[0]:
-        tab_bairros(stations, status)
+        tab_bairros(stations, filters["start"], filters["end"])
     with tabs[1]:
-        tab_trajetos(stations, status, filters["bucket"], filters["topn"])
+        tab_trajetos(stations, filters["bucket"], filters["topn"], filters["matcher"], filters["start"], filters["end"])
     with tabs[2]:
-        tab_bikes(stations, status)
+        tab_bikes(stations, filters["start"], filters["end"])
+    with tabs[3]:
+        tab_linha_do_tempo(stations, filters["start"], filters["end"])
+    performance_panel()
 else:
     # Placeholder quando não há dados
     st.markdown("---")
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.info("🏘️ **Bairros**\nHeatmap de uso por bairro (geocodificação OSM)")
+        st.info("🏘️ **Bairros**\nHeatmap de uso por bairro (limites locais em GeoJSON)")
     with col2:
         st.info("🔄 **Trajetos**\nFluxos OD estimados via matching temporal")
     with col3:
         st.info("🚲 **Bikes**\nHotspots de disponibilidade média")
+    with col4:
+        st.info("⏱️ **Linha do tempo**\nEstado da rede em qualquer instante, quadro a quadro")
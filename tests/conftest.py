@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT / "src"), str(ROOT / "benchmarks")]
+
+from sqlalchemy.engine import Engine  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+from synthetic import SyntheticNetwork  # noqa: E402
+
+from bike_analyzer import metrics  # noqa: E402
+from bike_analyzer.db import get_engine, init_db  # noqa: E402
+
+START = "2024-01-01T00:00:00-03:00"
+
+
+@pytest.fixture
+def engine(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Engine]:
+    # DATABASE_URL and the data/ directories are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    eng = get_engine()
+    init_db(eng)
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def network() -> SyntheticNetwork:
+    return SyntheticNetwork(12, start=START, every_min=10, churn=0.5, seed=0)
+
+
+@pytest.fixture
+def stub(network: SyntheticNetwork) -> Iterator[StubServer]:
+    with StubServer(network) as server:
+        yield server
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+
+from bike_analyzer.bairros import Boundaries, load_boundaries
+
+
+def _square(x0: float, y0: float, size: float) -> list[list[float]]:
+    return [[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size], [x0, y0]]
+
+
+def test_locate_square_with_a_hole(tmp_path):
+    # Centro: 10 x 10 square with a 2 x 2 hole, which is Ilha; Leste shares Centro's right edge
+    features = [
+        {"properties": {"Nome": "Centro"}, "geometry": {"type": "Polygon", "coordinates": [_square(0, 0, 10), _square(4, 4, 2)]}},
+        {"properties": {"bairro": "Ilha"}, "geometry": {"type": "Polygon", "coordinates": [_square(4, 4, 2)]}},
+        {"properties": {"name": "Leste"}, "geometry": {"type": "MultiPolygon", "coordinates": [[_square(10, 0, 10)]]}},
+        {"properties": {"Nome": "Vazio"}, "geometry": None},
+    ]
+    path = tmp_path / "bairros.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    boundaries = load_boundaries(path)
+    assert boundaries.names.tolist() == ["Centro", "Ilha", "Leste"]
+    assert load_boundaries(path) is boundaries and load_boundaries(tmp_path / "missing.geojson") is None
+
+    points = {
+        (2, 2): "Centro",
+        (5, 5): "Ilha",  # inside the hole
+        (9.999, 5): "Centro",
+        (30, 5): None,
+        # Points on an edge belong to exactly one of the polygons that share it
+        (4, 5): "Ilha",
+        (6, 5): "Centro",
+        (10, 5): "Leste",
+    }
+    (lons, lats), expected = np.array(list(points)).T, list(points.values())
+    # The first containing feature wins, so the reversed order checks that no other one contains the point
+    flipped = Boundaries("flipped", boundaries.names[::-1], boundaries.bbox[::-1], boundaries.edges[::-1])
+    for b in (boundaries, flipped):
+        assert [b.names[i] if i >= 0 else None for i in b.locate(lats, lons)] == expected
+    assert boundaries.locate([], []).tolist() == []
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import sqlite3
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from bike_analyzer import metrics
+from bike_analyzer.db import get_data_stats, init_db
+from bike_analyzer.etl_weather import weather_gaps
+from bike_analyzer.utils import get_status_range
+
+# Schema of the databases written before snapshots existed (data/bikepoa.sqlite is one):
+# scraped_at stored as text on every station_status row
+LEGACY_SCHEMA = """
+CREATE TABLE stations (
+  station_id TEXT PRIMARY KEY, name TEXT, lat REAL, lon REAL, capacity INTEGER, address TEXT,
+  rental_methods TEXT, is_virtual_station INTEGER, external_id TEXT, short_name TEXT, region_id TEXT,
+  last_updated INTEGER
+);
+CREATE TABLE station_status (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  station_id TEXT NOT NULL,
+  num_bikes_available INTEGER, num_bikes_disabled INTEGER, num_docks_available INTEGER,
+  num_docks_disabled INTEGER, is_installed INTEGER, is_renting INTEGER, is_returning INTEGER,
+  last_reported INTEGER,
+  scraped_at TEXT NOT NULL,
+  vehicles_json TEXT,
+  FOREIGN KEY (station_id) REFERENCES stations (station_id)
+);
+CREATE INDEX idx_station_status_station_time ON station_status(station_id, scraped_at);
+CREATE TABLE weather_hourly (
+  time TEXT PRIMARY KEY, temperature_2m REAL, precipitation REAL, rain REAL, showers REAL, snowfall REAL,
+  cloudcover REAL, windspeed_10m REAL, relative_humidity_2m REAL, weathercode INTEGER
+);
+"""
+TIMES = ["2024-01-01T10:00:00-03:00", "2024-01-01T10:05:00-03:00", "2024-01-01T10:10:00-03:00"]
+
+
+def _legacy_db(path) -> None:
+    con = sqlite3.connect(path)
+    con.executescript(LEGACY_SCHEMA)
+    rows = [
+        (sid, 3 * i + int(sid), 10 - int(sid), 0, 0, 1, 1, 1, None, t, None)
+        for i, t in enumerate(TIMES)
+        # Station 3 is missing from the last collection
+        for sid in ("1", "2", "3")
+        if not (sid == "3" and i == 2)
+    ]
+    con.executemany(
+        "INSERT INTO station_status (station_id, num_bikes_available, num_docks_available, num_bikes_disabled, "
+        "num_docks_disabled, is_installed, is_renting, is_returning, last_reported, scraped_at, vehicles_json) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    con.execute("INSERT INTO weather_hourly (time, temperature_2m) VALUES ('2024-01-01T10:00', 21.5)")
+    con.commit()
+    con.close()
+
+
+def test_legacy_scraped_at_migration(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", False)
+    _legacy_db(tmp_path / "legacy.sqlite")
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite'}")
+    init_db(engine)
+    # A second run finds nothing left to migrate
+    init_db(engine)
+    with engine.connect() as conn:
+        snapshots = pd.read_sql(text("SELECT * FROM snapshots ORDER BY ts_epoch"), conn)
+        systems = conn.execute(text("SELECT COUNT(*) FROM snapshot_systems")).scalar()
+        latest = dict(conn.execute(text("SELECT station_id, num_bikes_available FROM station_status_latest")).all())
+        tables = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    assert snapshots["scraped_at"].tolist() == TIMES
+    assert snapshots["ts_epoch"].tolist() == [int(pd.Timestamp(t).timestamp()) for t in TIMES]
+    assert snapshots["n_rows"].tolist() == snapshots["n_stations"].tolist() == [3, 3, 2]
+    assert systems == 3 and "station_status_legacy" not in tables
+    assert latest == {"1": 7, "2": 8, "3": 6}
+
+    status = get_status_range(engine=engine, columns=["num_bikes_available", "num_docks_available"])
+    assert len(status) == 8
+    assert status["scraped_at"].dt.tz is not None
+    last = status[status["scraped_at"] == status["scraped_at"].max()].set_index("station_id")
+    assert last["num_bikes_available"].to_dict() == {"1": 7, "2": 8}
+    assert last["num_docks_available"].to_dict() == {"1": 9, "2": 8}
+
+    stats = get_data_stats(engine)
+    assert (stats["n_snapshots"], stats["n_status_rows"]) == (3, 8)
+    # Weather stored before is_forecast existed is fetched once more
+    assert weather_gaps("2024-01-01T10:00", "2024-01-01T10:59", engine) == (["2024-01-01T10:00"], 1)
+    engine.dispose()
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+from synthetic import SyntheticNetwork
+
+from bike_analyzer.delta_cube import DeltaCube
+from bike_analyzer.od_inference import bucket_deltas
+
+
+def _status(n: int = 60) -> pd.DataFrame:
+    # 7-minute collections: buckets of 10 and 15 min hold one or two readings
+    network = SyntheticNetwork(6, start="2024-01-01T07:00:00-03:00", every_min=7, churn=2.0, seed=3)
+    frames = []
+    for _ in range(n):
+        stations = pd.DataFrame(network.station_status()["data"]["stations"])
+        frames.append(stations[["station_id", "num_bikes_available"]].assign(scraped_at=pd.Timestamp(network.scraped_at)))
+    status = pd.concat(frames, ignore_index=True)
+    # Station 1005 only shows up later, and one reading of 1000 is missing
+    status = status[(status["station_id"] != "1005") | (status["scraped_at"] >= "2024-01-01T09:00:00-03:00")]
+    status["num_bikes_available"] = status["num_bikes_available"].astype("Int16")
+    missing = (status["station_id"] == "1000") & (status["scraped_at"] == status["scraped_at"].unique()[20])
+    status.loc[missing, "num_bikes_available"] = pd.NA
+    return status.reset_index(drop=True)
+
+
+def _nonzero(deltas: pd.DataFrame) -> pd.DataFrame:
+    deltas = deltas[deltas["delta"] != 0].astype({"station_id": object, "delta": "int64"})
+    deltas["bucket"] = deltas["bucket"].dt.as_unit("s")
+    return deltas.sort_values(["bucket", "station_id"], ignore_index=True)
+
+
+@pytest.mark.parametrize("minutes", [10, 15])
+def test_rollup_matches_bucket_deltas(minutes):
+    status = _status()
+    cube = DeltaCube.from_status(status)
+    expected = _nonzero(bucket_deltas(status, f"{minutes}min"))
+    assert not expected.empty and (expected["station_id"] == "1005").any()
+    pd.testing.assert_frame_equal(_nonzero(cube.bucket_deltas(minutes)), expected)
+    # Coarse windows are sums of consecutive 5-minute rows
+    starts, net = cube.rollup(minutes)
+    assert (starts % (minutes * 60) == 0).all() and net.sum() == cube.net.sum()
+
+
+def test_extend_matches_a_single_build():
+    status = _status()
+    cut = pd.Timestamp("2024-01-01T10:00:00-03:00")
+    old, new = status[status["scraped_at"] < cut], status[status["scraped_at"] >= cut]
+    # Each station's last covered row anchors the first new delta
+    anchor = old[old["num_bikes_available"].notna()].groupby("station_id").tail(1)
+    cube = DeltaCube.from_status(old).extend(pd.concat([anchor, new], ignore_index=True))
+    pd.testing.assert_frame_equal(
+        _nonzero(cube.bucket_deltas(15)), _nonzero(DeltaCube.from_status(status).bucket_deltas(15))
+    )
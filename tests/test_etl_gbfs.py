@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import pandas as pd
+from sqlalchemy import text
+from synthetic import SyntheticNetwork
+
+from bike_analyzer.etl_gbfs import append_status_batch
+from bike_analyzer.status_store import REMOVED_SQL
+from bike_analyzer.systems import System, add_system
+from bike_analyzer.utils import get_status_range
+
+
+def _without(payload: dict, station_id: str) -> dict:
+    stations = [s for s in payload["data"]["stations"] if s["station_id"] != station_id]
+    return {**payload, "data": {"stations": stations}}
+
+
+def test_batch_of_several_systems(engine):
+    add_system(System("outro", "http://localhost/gbfs.json"), engine)
+    poa = SyntheticNetwork(4, every_min=10, seed=0)
+    other = SyntheticNetwork(3, every_min=10, seed=1)
+    times = ["2024-01-01T00:00:00-03:00", "2024-01-01T00:10:00-03:00", "2024-01-01T00:20:00-03:00"]
+    written = [
+        append_status_batch({"bikepoa": poa.station_status(), "outro": other.station_status()}, engine, "delta", times[0]),
+        # "outro" is not in this batch: its stations are not removed, even though they are not in it
+        append_status_batch({"bikepoa": _without(poa.station_status(), "1003")}, engine, "delta", times[1]),
+        append_status_batch({"outro": _without(other.station_status(), "1000")}, engine, "delta", times[2]),
+    ]
+    assert written[0] == {"bikepoa": 4, "outro": 3}
+    assert set(written[1]) == {"bikepoa"} and set(written[2]) == {"outro"}
+
+    with engine.connect() as conn:
+        systems = conn.execute(
+            text("SELECT ts_epoch, system_id FROM snapshot_systems ORDER BY ts_epoch, system_id")
+        ).all()
+        snapshots = conn.execute(text("SELECT n_stations FROM snapshots ORDER BY ts_epoch")).scalars().all()
+        removed = conn.execute(
+            text(
+                "SELECT sn.scraped_at, st.station_id, st.system_id FROM station_status st "
+                f"JOIN snapshots sn ON sn.snapshot_id = st.snapshot_id WHERE {REMOVED_SQL} ORDER BY sn.ts_epoch"
+            )
+        ).all()
+        latest = set(conn.execute(text("SELECT station_id FROM station_status_latest")).scalars())
+    epochs = [int(pd.Timestamp(t).timestamp()) for t in times]
+    assert systems == [(epochs[0], "bikepoa"), (epochs[0], "outro"), (epochs[1], "bikepoa"), (epochs[2], "outro")]
+    assert snapshots == [7, 3, 2]
+    assert [tuple(r) for r in removed] == [(times[1], "1003", "bikepoa"), (times[2], "outro:1000", "outro")]
+    assert latest == {"1000", "1001", "1002", "outro:1001", "outro:1002"}
+
+    # Dense view: each system is carried until it is collected again, departed stations are not
+    status = get_status_range(engine=engine)
+    per_time = status.groupby("scraped_at")["station_id"].agg(lambda s: set(s))
+    assert per_time.tolist() == [
+        {"1000", "1001", "1002", "1003", "outro:1000", "outro:1001", "outro:1002"},
+        {"1000", "1001", "1002", "outro:1000", "outro:1001", "outro:1002"},
+        {"1000", "1001", "1002", "outro:1001", "outro:1002"},
+    ]
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from sqlalchemy import text
+
+from bike_analyzer.etl_weather import sync_weather
+
+
+def _sync(engine, stub, **kwargs) -> dict:
+    before = stub.requests
+    out = sync_weather("2024-01-01T00:00", "2024-01-05T23:00", engine, url=stub.weather_url, **kwargs)
+    assert stub.requests - before == out["requests"]
+    return out
+
+
+def test_sync_weather_fetches_only_gaps(engine, stub):
+    assert _sync(engine, stub) == {"missing_hours": 120, "forecast_hours": 0, "requests": 1, "rows": 120}
+    assert _sync(engine, stub)["requests"] == 0
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM weather_hourly WHERE time LIKE '2024-01-02T0%' OR time LIKE '2024-01-04T1%'"))
+        # A past hour stored as a forecast is fetched again
+        conn.execute(text("UPDATE weather_hourly SET is_forecast = 1 WHERE time = '2024-01-05T12:00'"))
+    # Days 2 and 4-5 are two runs of consecutive days: one request each
+    assert _sync(engine, stub) == {"missing_hours": 21, "forecast_hours": 1, "requests": 2, "rows": 21}
+    with engine.connect() as conn:
+        n, forecasts = conn.execute(text("SELECT COUNT(*), SUM(is_forecast) FROM weather_hourly")).one()
+    assert (n, forecasts) == (120, 0)
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM weather_hourly WHERE time LIKE '2024-01-02T0%' OR time LIKE '2024-01-04T1%'"))
+        conn.execute(text("DELETE FROM weather_hourly WHERE time = '2024-01-05T12:00'"))
+    # With chunk_days=1 each missing day is a request
+    assert _sync(engine, stub, chunk_days=1)["requests"] == 3
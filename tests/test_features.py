@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import numpy as np
+from synthetic import SyntheticNetwork, weather_payload
+
+from bike_analyzer.etl_gbfs import append_status_snapshot
+from bike_analyzer.etl_weather import load_weather_hourly
+from bike_analyzer.features import get_station_features
+
+
+def test_weather_is_aligned_as_of(engine):
+    payload = weather_payload("2024-01-01", 1)
+    temperature = dict(zip(payload["hourly"]["time"], payload["hourly"]["temperature_2m"]))
+    # Weather stored before the status hours it covers...
+    load_weather_hourly(payload, engine, only={"2024-01-01T00:00", "2024-01-01T01:00"})
+    network = SyntheticNetwork(3, every_min=30, seed=0)
+    for _ in range(22):
+        append_status_snapshot(network.station_status(), engine, scraped_at=network.scraped_at)
+    # ...and after them: the hours already in station_features are realigned
+    load_weather_hourly(payload, engine, only={"2024-01-01T07:00"})
+
+    features = get_station_features(engine=engine)
+    assert features["station_id"].nunique() == 3
+    # Every station of an hour gets the same weather
+    assert (features.groupby("hour")["weather_time"].nunique(dropna=False) == 1).all()
+    by_hour = features.drop_duplicates("hour").set_index("hour")
+    # The last weather hour at or before the row's hour, up to FEATURES_WEATHER_MAX_LAG_H (3) hours old
+    expected = [0, 1, 1, 1, 1, None, None, 7, 7, 7, 7]
+    expected = [f"2024-01-01T{h:02d}:00" if h is not None else None for h in expected]
+    assert by_hour["weather_time"].replace({np.nan: None}).tolist() == expected
+    np.testing.assert_array_equal(by_hour["temperature_2m"], [temperature.get(t, np.nan) for t in expected])
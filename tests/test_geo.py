@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from bike_analyzer import geo
+from bike_analyzer.geo import StationGeometry, get_station_geometry
+
+
+def _stations(n: int) -> pd.DataFrame:
+    return pd.DataFrame(
+        {"station_id": [str(i) for i in range(n)], "lat": [-30.0 - i / 1000 for i in range(n)], "lon": [-51.2] * n}
+    )
+
+
+def test_station_sets_keep_their_caches(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(geo, "_memo", type(geo._memo)())
+    monkeypatch.setattr(geo, "GEO_MEMO_SIZE", 2)
+    builds = []
+    build = StationGeometry.build.__func__
+    monkeypatch.setattr(StationGeometry, "build", classmethod(lambda cls, *a: builds.append(1) or build(cls, *a)))
+    a, b, c = _stations(5), _stations(6), _stations(7)
+    # Alternating two station sets builds each one once and keeps both files
+    for df in (a, b, a, b):
+        get_station_geometry(df)
+    assert len(builds) == 2
+    assert len(list((tmp_path / "data/cache").glob("station_geometry_*.npz"))) == 2
+    # A third set evicts the least recently used from memory; it comes back from disk
+    get_station_geometry(c)
+    assert list(geo._memo) == [geo.stations_key(b), geo.stations_key(c)]
+    geom = get_station_geometry(a)
+    assert len(builds) == 3 and len(geom) == 5 and geom.knn.shape == (5, 4)
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bike_analyzer.config import CITY_LAT, CITY_LON
+from bike_analyzer.hexbins import EARTH_RADIUS_M, HEX_LEVELS_M, hex_cells, hex_centers, hexbin_levels
+
+
+@pytest.mark.parametrize("size", HEX_LEVELS_M)
+def test_cell_ids_and_centers(size):
+    # The grid is anchored at the city origin
+    assert [a.tolist() for a in hex_cells([CITY_LAT], [CITY_LON], size)] == [[0], [0]]
+    assert hex_centers([0], [0], size) == (pytest.approx([CITY_LAT]), pytest.approx([CITY_LON]))
+    # Cell (1, 0) is 1.5 sizes east and half a hex height north of the origin
+    lat, lon = hex_centers([1], [0], size)
+    east = EARTH_RADIUS_M * np.radians(lon[0] - CITY_LON) * np.cos(np.radians(CITY_LAT))
+    north = EARTH_RADIUS_M * np.radians(lat[0] - CITY_LAT)
+    assert (east, north) == (pytest.approx(1.5 * size), pytest.approx(np.sqrt(3) / 2 * size))
+
+    # Every center falls in its own cell
+    q, r = (a.ravel() for a in np.meshgrid(np.arange(-6, 7), np.arange(-6, 7)))
+    lat, lon = hex_centers(q, r, size)
+    cq, cr = hex_cells(lat, lon, size)
+    assert (cq == q).all() and (cr == r).all()
+    # Flat-top hexagons: north, 0.8 apothem stays in the cell and 1.2 reaches the one above;
+    # east, 0.9 size (short of the vertex) stays and 1.2 size reaches a neighbor
+    x = np.array([0.0, 0.0, 0.9, 1.2]) * size
+    y = np.array([0.8, 1.2, 0.0, 0.0]) * np.sqrt(3) / 2 * size
+    q = x / (1.5 * size)
+    lat, lon = hex_centers(q, y / (np.sqrt(3) * size) - q / 2, size)  # fractional axial coordinates
+    cq, cr = hex_cells(lat, lon, size)
+    assert list(zip(cq.tolist(), cr.tolist()))[:3] == [(0, 0), (0, 1), (0, 0)]
+    assert (cq[3], cr[3]) != (0, 0)
+
+
+def test_hexbin_levels_keep_every_station():
+    rng = np.random.default_rng(0)
+    stations = pd.DataFrame(
+        {"lat": CITY_LAT + rng.uniform(-0.05, 0.05, 200), "lon": CITY_LON + rng.uniform(-0.05, 0.05, 200), "trips": 1}
+    )
+    bins = hexbin_levels(stations, ["trips"])
+    assert bins["size_m"].unique().tolist() == list(HEX_LEVELS_M)
+    per_level = bins.groupby("size_m", sort=False)
+    assert (per_level["n_stations"].sum() == 200).all() and (per_level["trips"].sum() == 200).all()
+    # Finer levels split the stations over more cells
+    assert per_level.size().is_monotonic_increasing
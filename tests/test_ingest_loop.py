@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import itertools
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from bike_analyzer import ingest_loop as loop_module
+from bike_analyzer.etl_gbfs import GbfsClient
+from bike_analyzer.ingest_loop import ingest_loop
+
+
+def _count(engine, table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def _run(engine, stub, iterations: int) -> list[dict]:
+    # Fake clock: every feed is due again at each poll, and no real sleeping
+    clock = itertools.count(0, 10).__next__
+    with GbfsClient(stub.gbfs_url) as client:
+        return list(
+            ingest_loop(
+                client, engine, min_interval=1, max_interval=1, iterations=iterations, clock=clock, sleep=lambda s: None
+            )
+        )
+
+
+def test_recovers_after_feed_failure(engine, stub, network):
+    stub.fail("/station_status.json")
+    events = _run(engine, stub, 2)
+    assert events[0]["event"] == "error"
+    # station_information arrived in the failed poll; it must not be skipped as "not modified" afterwards
+    assert events[1]["stations_upserted"] == network.n_stations
+    assert events[1]["snapshot"]
+    assert _count(engine, "stations") == network.n_stations
+    assert _count(engine, "snapshots") == 1
+
+
+def test_recovers_after_write_failure(engine, stub, network, monkeypatch):
+    load = loop_module.load_stations
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(loop_module, "load_stations", flaky)
+    events = _run(engine, stub, 2)
+    assert [e["event"] for e in events] == ["error", "poll"]
+    assert events[1]["stations_upserted"] == network.n_stations
+    assert _count(engine, "stations") == network.n_stations
+
+
+def test_skips_unchanged_station_information(engine, stub, network):
+    events = _run(engine, stub, 3)
+    assert events[0]["stations_upserted"] == network.n_stations
+    assert all(e["event"] == "poll" and e["snapshot"] for e in events)
+    assert "station_information" in events[1]["skipped"]
+    assert _count(engine, "station_status") == 3 * network.n_stations
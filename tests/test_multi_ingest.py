@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from bike_analyzer import multi_ingest
+from bike_analyzer.etl_gbfs import append_status_batch
+from bike_analyzer.multi_ingest import MultiSystemIngester
+from bike_analyzer.systems import System
+
+
+def _ingest(engine, systems, **kwargs) -> tuple[dict, list[dict]]:
+    events: list[dict] = []
+    ingester = MultiSystemIngester(systems, engine, batch_window=0.05, on_event=events.append, **kwargs)
+    return asyncio.run(ingester.run()), events
+
+
+def test_partial_failure_keeps_fetched_feeds(engine, stub, network):
+    stub.fail("/station_status.json")
+    system = System("x", stub.gbfs_url, min_interval=0.01, max_interval=0.01)
+    totals, events = _ingest(engine, [system], iterations=3)
+    error = next(e for e in events if e["event"] == "error")
+    assert error["queued"] == ["station_information"]
+    assert totals["stations_upserted"] == network.n_stations
+    assert totals["snapshots"] >= 1
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM stations WHERE system_id = 'x'")).scalar() == network.n_stations
+
+
+def test_writer_retries_only_operational_errors(engine, stub, network, monkeypatch):
+    calls = {"n": 0}
+
+    def flaky(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        if calls["n"] == 2:
+            raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+        return append_status_batch(*args, **kwargs)
+
+    monkeypatch.setattr(multi_ingest, "append_status_batch", flaky)
+    # No wait between the retries of the locked database
+    sleep = asyncio.sleep
+    monkeypatch.setattr(multi_ingest.asyncio, "sleep", lambda delay: sleep(0))
+    system = System("x", stub.gbfs_url, min_interval=0.01, max_interval=0.01)
+    totals, events = _ingest(engine, [system], iterations=3)
+    errors = [e for e in events if e["event"] == "error"]
+    # The locked write is retried; the integrity error drops its snapshot and the loop goes on
+    assert [e["error"].split(":")[0] for e in errors] == ["OperationalError", "IntegrityError"]
+    assert "retry_in" in errors[0] and errors[1]["dropped"] == ["x"]
+    snapshots = [e for e in events if e["event"] == "snapshot"]
+    assert totals["snapshots"] == len(snapshots) >= 1
+    assert totals["status_rows"] == sum(e["status_rows"] for e in snapshots)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bike_analyzer import od_inference
+from bike_analyzer.geo import StationGeometry
+from bike_analyzer.od_inference import MATCHERS, bucket_deltas, flows_from_deltas
+
+
+@pytest.mark.parametrize("dtype", ["float64", "Int16"])
+def test_bucket_deltas_skip_missing_counts(dtype):
+    status = pd.DataFrame(
+        {
+            "station_id": ["a", "a", "a"],
+            "scraped_at": pd.to_datetime(["2024-01-01 10:00", "2024-01-01 10:01", "2024-01-01 10:11"]),
+            "num_bikes_available": pd.array([3, np.nan, 5], dtype=dtype),
+        }
+    )
+    # The missing reading at 10:01 is not the last value of the 10:00 bucket
+    assert bucket_deltas(status)["delta"].tolist() == [0, 2]
+
+
+# Departures at x=0 and x=2, arrivals at x=3 and x=-10 (distances in metres along a line)
+DEP, ARR = np.array([1, 1]), np.array([1, 1])
+DIST = np.array([[3.0, 10.0], [1.0, 12.0]])
+
+
+def _cost(flows, dist) -> float:
+    return sum(dist[i, j] * c for i, j, c in flows)
+
+
+def test_greedy_and_optimal_on_a_hand_checked_case():
+    # Greedy sends the first departure to its nearest arrival and leaves the far one to the other
+    assert sorted(MATCHERS["greedy"](DEP, ARR, DIST)) == [(0, 0, 1), (1, 1, 1)]
+    assert sorted(MATCHERS["optimal"](DEP, ARR, DIST)) == [(0, 1, 1), (1, 0, 1)]
+    # Unbalanced: only min(departures, arrivals) bikes are matched, to the nearest arrivals
+    dist = np.array([[5.0, 1.0, 2.0]])
+    for name in MATCHERS:
+        assert sorted(MATCHERS[name](np.array([3]), np.array([2, 2, 2]), dist)) == [(0, 1, 2), (0, 2, 1)]
+
+
+@pytest.mark.parametrize("name", sorted(MATCHERS))
+def test_matchers_with_an_empty_side(name):
+    assert MATCHERS[name](np.array([2, 1]), np.array([], dtype=np.int64), np.zeros((2, 0))) == []
+    assert MATCHERS[name](np.array([0]), np.array([4]), np.zeros((1, 1))) == []
+
+
+def test_station_level_transport_matches_unit_assignment(monkeypatch):
+    rng = np.random.default_rng(0)
+    dep, arr = rng.integers(1, 6, 30), rng.integers(1, 6, 25)
+    dist = rng.uniform(0, 5000, (30, 25))
+    units = MATCHERS["optimal"](dep, arr, dist)
+    monkeypatch.setattr(od_inference, "ASSIGNMENT_MAX_CELLS", 0)
+    stations = MATCHERS["optimal"](dep, arr, dist)
+    for flows in (units, stations):
+        shipped = np.zeros((30, 25), dtype=np.int64)
+        for i, j, c in flows:
+            shipped[i, j] += c
+        assert shipped.sum() == min(dep.sum(), arr.sum())
+        assert (shipped.sum(axis=1) <= dep).all() and (shipped.sum(axis=0) <= arr).all()
+    assert _cost(stations, dist) == pytest.approx(_cost(units, dist))
+    assert _cost(stations, dist) < _cost(MATCHERS["greedy"](dep, arr, dist), dist)
+    # Fewer departures than arrivals: with room for both at x=3, both go there
+    assert sorted(MATCHERS["optimal"](DEP, ARR + 1, DIST)) == [(0, 0, 1), (1, 0, 1)]
+
+
+def test_flows_skip_buckets_with_only_departures():
+    geometry = StationGeometry.build(
+        pd.DataFrame({"station_id": ["a", "b", "c"], "lat": [-30.0, -30.001, -30.01], "lon": [-51.2] * 3})
+    )
+    buckets = pd.to_datetime(["2024-01-01 10:00", "2024-01-01 10:00", "2024-01-01 10:10", "2024-01-01 10:10"])
+    deltas = pd.DataFrame({"station_id": ["a", "b", "a", "c"], "bucket": buckets, "delta": [-2, -1, -1, 1]})
+    for name in MATCHERS:
+        flows = flows_from_deltas(deltas, geometry, name)
+        assert flows.to_dict("records") == [{"bucket": buckets[2], "o": "a", "d": "c", "count": 1}]
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+from synthetic import SyntheticNetwork
+
+from bike_analyzer.db import init_db
+from bike_analyzer.etl_gbfs import append_status_snapshot, load_stations, replay_archive
+from bike_analyzer.raw_archive import append_payload, raw_days, read_day
+
+_STATUS_SQL = text(
+    """
+    SELECT sn.scraped_at, ss.station_id, ss.num_bikes_available, ss.num_bikes_disabled, ss.num_docks_available,
+           ss.num_docks_disabled, ss.is_installed, ss.is_renting, ss.is_returning, ss.last_reported
+    FROM station_status ss JOIN snapshots sn ON sn.snapshot_id = ss.snapshot_id
+    ORDER BY sn.ts_epoch, ss.station_id
+    """
+)
+
+
+def _tables(engine) -> dict[str, pd.DataFrame]:
+    with engine.connect() as conn:
+        return {
+            "station_status": pd.read_sql(_STATUS_SQL, conn),
+            "station_hourly": pd.read_sql(text("SELECT * FROM station_hourly ORDER BY station_id, hour"), conn),
+        }
+
+
+def test_replay_matches_direct_ingestion(engine, tmp_path):
+    # Collections from 22:00 to 04:00 local time: two day files
+    network = SyntheticNetwork(6, start="2024-01-01T22:00:00-03:00", every_min=10, churn=1.0, seed=2)
+    root = tmp_path / "raw"
+    info = network.station_information()
+    load_stations(info, engine)
+    append_payload("station_information", info, fetched_at=network.start, root=root)
+    written = [("station_information", network.start)]
+    for scraped_at, payload in network.snapshots(days=0.25):
+        append_status_snapshot(payload, engine, mode="delta", scraped_at=scraped_at)
+        append_payload("station_status", payload, fetched_at=scraped_at, root=root)
+        written.append(("station_status", scraped_at))
+    # A repeated payload (same last_updated) is stored raw but not ingested again
+    append_payload(
+        "station_status", payload, fetched_at=(pd.Timestamp(scraped_at) + pd.Timedelta(minutes=5)).isoformat(), root=root
+    )
+
+    assert raw_days(root) == ["2024-01-01", "2024-01-02"]
+    records = read_day("2024-01-01", root) + read_day("2024-01-02", root)
+    assert [(r["feed"], r["fetched_at"]) for r in records[:-1]] == written
+    assert records[-1]["payload"] == payload
+    # A record cut short by an interrupted write is dropped, the ones before it are kept
+    with open(root / "gbfs" / "2024-01-02.jsonl.gz", "ab") as f:
+        f.write(gzip.compress(json.dumps({"feed": "station_status"}).encode())[:-6])
+    assert len(read_day("2024-01-02", root)) == len(records) - len(read_day("2024-01-01", root))
+
+    replayed = create_engine(f"sqlite:///{tmp_path / 'replayed.sqlite'}")
+    init_db(replayed)
+    out = replay_archive(engine=replayed, mode="delta", root=str(root))
+    assert (out["days"], out["snapshots"], out["skipped"]) == (2, len(written) - 1, 1)
+    direct, again = _tables(engine), _tables(replayed)
+    assert len(direct["station_status"]) > 0 and len(direct["station_hourly"]) > 0
+    for name in direct:
+        pd.testing.assert_frame_equal(again[name], direct[name], obj=name)
+    # Replaying the same days again adds nothing
+    assert replay_archive(engine=replayed, mode="delta", root=str(root))["snapshots"] == 0
+    pd.testing.assert_frame_equal(_tables(replayed)["station_status"], direct["station_status"])
+    replayed.dispose()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+from synthetic import SyntheticNetwork
+
+from bike_analyzer.aggregates import get_station_stats
+from bike_analyzer.archive import archive_status
+from bike_analyzer.db import init_db
+from bike_analyzer.etl_gbfs import append_status_snapshot
+from bike_analyzer.range_cache import RangeCache
+from bike_analyzer.rollups import rebuild_rollups
+from bike_analyzer.status_store import compact_status
+from bike_analyzer.time_travel import state_at, states_between
+from bike_analyzer.utils import get_status_range, iter_status_range
+
+COLUMNS = ["num_bikes_available", "num_docks_available"]
+# Station 1001 leaves the feed for a few hours and comes back, 1002 leaves for good
+AWAY = {"1001": range(10, 14), "1002": range(30, 10**6)}
+
+
+def _payloads(n: int = 48) -> list[tuple[str, dict]]:
+    network = SyntheticNetwork(8, start="2024-01-01T00:00:00-03:00", every_min=60, churn=0.5, seed=1)
+    out = []
+    for i in range(n):
+        payload = network.station_status()
+        stations = [s for s in payload["data"]["stations"] if i not in AWAY.get(s["station_id"], ())]
+        out.append((network.scraped_at, {**payload, "data": {"stations": stations}}))
+    return out
+
+
+def _load(engine, payloads, mode: str) -> None:
+    for scraped_at, payload in payloads:
+        append_status_snapshot(payload, engine, mode=mode, scraped_at=scraped_at)
+
+
+def _views(engine) -> dict[str, pd.DataFrame]:
+    rebuild_rollups(engine=engine)
+    with engine.connect() as conn:
+        hourly = pd.read_sql(text("SELECT * FROM station_hourly"), conn)
+    mid, end = "2024-01-01T12:30:00-03:00", "2024-01-02T23:00:00-03:00"
+    dense = get_status_range(engine=engine, columns=COLUMNS)
+    compact = get_status_range(engine=engine, columns=COLUMNS, compact=True)
+    chunks = pd.concat(list(iter_status_range(engine=engine, columns=COLUMNS, chunk_snapshots=7)), ignore_index=True)
+    return {
+        "dense": dense,
+        # From the middle of 1001's absence: the carry-in must not bring it back
+        "dense_mid": get_status_range(mid, end, engine=engine, columns=COLUMNS),
+        "compact": compact.astype({"station_id": object, **{c: "int64" for c in COLUMNS}}),
+        "chunks": chunks.astype({"station_id": object, **{c: "int64" for c in COLUMNS}}),
+        "stats": get_station_stats(engine=engine),
+        "stats_mid": get_station_stats(mid, end, engine=engine),
+        "state_at": state_at(mid, COLUMNS, engine=engine),
+        "hourly": hourly,
+        "frames": states_between("2024-01-01T08:00:00-03:00", "2024-01-01T16:00:00-03:00", 60, COLUMNS, engine=engine),
+    }
+
+
+def _assert_same(left: dict[str, pd.DataFrame], right: dict[str, pd.DataFrame]) -> None:
+    for name in left:
+        a = left[name].sort_values(list(left[name].columns[:2]), ignore_index=True)
+        b = right[name].sort_values(list(right[name].columns[:2]), ignore_index=True)
+        pd.testing.assert_frame_equal(a, b, check_dtype=False, obj=name)
+
+
+@pytest.fixture
+def full_views(tmp_path) -> dict[str, pd.DataFrame]:
+    # Read before the delta database archives anything: the archive directory is shared
+    engine = create_engine(f"sqlite:///{tmp_path / 'full.sqlite'}")
+    init_db(engine)
+    _load(engine, _payloads(), "full")
+    views = _views(engine)
+    engine.dispose()
+    return views
+
+
+def test_departed_stations_are_not_carried(engine, full_views):
+    _load(engine, _payloads(), "delta")
+    dense = full_views["dense"]
+    hours = dense.groupby("station_id")["scraped_at"].nunique()
+    assert hours["1001"] == 48 - 4 and hours["1002"] == 30
+    _assert_same(full_views, _views(engine))
+    # Moving the closed days to Parquet keeps the same view
+    assert archive_status(keep_days=1, engine=engine)["days"] == 1
+    _assert_same(full_views, _views(engine))
+
+
+def test_compact_status_backfills_tombstones(engine, full_views):
+    _load(engine, _payloads(), "full")
+    compact_status(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT SUM(n_rows), SUM(n_stations) FROM snapshots")).one()
+    assert rows[0] < rows[1]
+    _assert_same(full_views, _views(engine))
+
+
+def test_range_cache_extends_across_departures(engine, full_views):
+    payloads = _payloads()
+    cache = RangeCache(engine=engine)
+    # Refreshes land inside 1001's absence and right after 1002 leaves
+    for a, b in ((0, 12), (12, 31), (31, len(payloads))):
+        _load(engine, payloads[a:b], "delta")
+        status, stats = cache.status(), cache.station_stats()
+    status = status.astype({"station_id": object, "num_bikes_available": "int64"})
+    expected = {"dense": full_views["dense"][status.columns], "stats": full_views["stats"]}
+    _assert_same(expected, {"dense": status, "stats": stats})